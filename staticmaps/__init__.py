@@ -4,9 +4,14 @@
 
 # flake8: noqa
 from .area import Area
+from .async_tile_downloader import AsyncTileDownloader
 from .bounds import Bounds
+from .cache_index import CacheIndex
+from .cache_pruner import CachePruner
 from .cairo_renderer import CairoRenderer, cairo_is_supported
+from .cancellation import CancellationToken, DegradedTile
 from .circle import Circle
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 from .color import (
     BLACK,
     BLUE,
@@ -24,14 +29,38 @@ from .color import (
 )
 from .context import Context
 from .coordinates import create_latlng, parse_latlng, parse_latlngs, parse_latlngs2rect
+from .decoded_tile_cache import DecodedTileCache
+from .file_lock import FileLock, file_lock_is_supported
 from .image_marker import ImageMarker
+from .image_registry import (
+    ImageRegistry,
+    ImageSourceT,
+    RegisteredImage,
+    default_image_registry,
+)
 from .line import Line
 from .marker import Marker
+from .mbtiles_tile_cache import MBTilesTileCache
+from .memory_tile_cache import MemoryTileCache, default_memory_tile_cache
 from .meta import GITHUB_URL, LIB_NAME, VERSION
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
+from .rate_limiter import RateLimiter
+from .session_pool import SessionPool, default_session_pool
+from .shard_selector import ShardSelector
+from .single_flight import SingleFlight, default_single_flight
 from .svg_renderer import SvgRenderer
+from .tile_cache import (
+    FileTileCache,
+    TieredTileCache,
+    TileCache,
+    TileMetadata,
+    tile_data_is_complete,
+)
 from .tile_downloader import TileDownloader
+from .tile_fallback import SynthesizedTile, synthesize_tile
+from .tile_metrics import LATENCY_BUCKETS, LatencyHistogram, TileEvent, TileMetrics
+from .tile_pack import TilePack, TilePackTileCache, TilePackWriter, pack_tile_cache
 from .tile_provider import (
     TileProvider,
     default_tile_providers,
@@ -44,14 +73,22 @@ from .tile_provider import (
     tile_provider_StamenToner,
     tile_provider_StamenTonerLite,
 )
+from .tile_seeder import SeedProgress, TileSeeder, quadkey
 from .transformer import Transformer
 
 __all__ = [
     "Area",
+    "AsyncTileDownloader",
     "Bounds",
+    "CacheIndex",
+    "CachePruner",
     "CairoRenderer",
     "cairo_is_supported",
+    "CancellationToken",
+    "DegradedTile",
     "Circle",
+    "CircuitBreaker",
+    "CircuitOpenError",
     "BLACK",
     "BLUE",
     "BROWN",
@@ -66,21 +103,55 @@ __all__ = [
     "parse_color",
     "random_color",
     "Context",
+    "DecodedTileCache",
     "create_latlng",
     "parse_latlng",
     "parse_latlngs",
     "parse_latlngs2rect",
+    "FileLock",
+    "file_lock_is_supported",
     "ImageMarker",
+    "ImageRegistry",
+    "ImageSourceT",
+    "RegisteredImage",
+    "default_image_registry",
     "Line",
     "Marker",
+    "MBTilesTileCache",
+    "MemoryTileCache",
+    "default_memory_tile_cache",
     "GITHUB_URL",
     "LIB_NAME",
     "VERSION",
     "Object",
     "PixelBoundsT",
     "PillowRenderer",
+    "RateLimiter",
+    "SessionPool",
+    "default_session_pool",
+    "ShardSelector",
+    "SingleFlight",
+    "default_single_flight",
     "SvgRenderer",
+    "FileTileCache",
+    "TieredTileCache",
+    "TileCache",
+    "TileMetadata",
+    "tile_data_is_complete",
     "TileDownloader",
+    "SynthesizedTile",
+    "synthesize_tile",
+    "LATENCY_BUCKETS",
+    "LatencyHistogram",
+    "TileEvent",
+    "TileMetrics",
+    "TilePack",
+    "TilePackTileCache",
+    "TilePackWriter",
+    "pack_tile_cache",
+    "SeedProgress",
+    "TileSeeder",
+    "quadkey",
     "TileProvider",
     "default_tile_providers",
     "tile_provider_ArcGISWorldImagery",
@@ -5,7 +5,6 @@
 import typing
 
 import s2sphere  # type: ignore
-from PIL import Image as PIL_Image  # type: ignore
 from PIL import ImageDraw as PIL_ImageDraw  # type: ignore
 
 from .cairo_renderer import CairoRenderer
@@ -45,15 +44,27 @@ class Area(Line):
         Parameters:
             renderer (PillowRenderer): pillow renderer
         """
-        xys = [
-            (x + renderer.offset_x(), y)
-            for (x, y) in [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
-        ]
-        overlay = PIL_Image.new("RGBA", renderer.image().size, (255, 255, 255, 0))
-        draw = PIL_ImageDraw.Draw(overlay)
-        draw.polygon(xys, fill=self.fill_color().int_rgba())
-        renderer.alpha_compose(overlay)
-        if self.width() > 0:
+        xys = [(x + renderer.offset_x(), y) for (x, y) in self.pixels(renderer.transformer())]
+        # an opaque outline may share the translucent layer with the fill: it replaces the pixels either way
+        outline = self.width() > 0
+        outline_on_layer = outline and self.color().int_rgba()[3] == 255
+        margin = self.width() if outline_on_layer else 0
+
+        def paint(draw: PIL_ImageDraw.ImageDraw) -> None:
+            draw.polygon(xys, fill=self.fill_color().int_rgba())
+            if outline_on_layer:
+                draw.line(xys, fill=self.color().int_rgba(), width=self.width())
+
+        renderer.draw_translucent(
+            (
+                min(x for x, _ in xys) - margin,
+                min(y for _, y in xys) - margin,
+                max(x for x, _ in xys) + margin,
+                max(y for _, y in xys) + margin,
+            ),
+            paint,
+        )
+        if outline and not outline_on_layer:
             renderer.draw().line(xys, fill=self.color().int_rgba(), width=self.width())
 
     def render_svg(self, renderer: SvgRenderer) -> None:
@@ -62,7 +73,7 @@ class Area(Line):
         Parameters:
             renderer (SvgRenderer): svg renderer
         """
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.pixels(renderer.transformer())
 
         polygon = renderer.drawing().polygon(
             xys,
@@ -87,7 +98,7 @@ class Area(Line):
         Parameters:
             renderer (CairoRenderer): cairo renderer
         """
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.pixels(renderer.transformer())
 
         renderer.context().set_source_rgba(*self.fill_color().float_rgba())
         renderer.context().new_path()
@@ -0,0 +1,96 @@
+"""py-staticmaps - async_tile_downloader"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import asyncio
+import typing
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .cancellation import CancellationToken
+from .tile_downloader import TileDownloader
+from .tile_provider import TileProvider
+
+
+class AsyncTileDownloader(TileDownloader):
+    """A tile downloader class for asyncio applications
+
+    Tiles are fetched by a dedicated thread pool, so the event loop is never blocked. The number of in-flight
+    fetches per tile provider and event loop is bounded by the maximum concurrency of the provider; further fetches
+    wait for a free slot. Share one instance between all contexts of an application to share these bounds.
+    """
+
+    def __init__(self, max_workers: int = 16) -> None:
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="async-tile-fetch")
+        # asyncio semaphores are bound to the event loop they are first used in
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, typing.Dict[str, asyncio.Semaphore]]"
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def close(self) -> None:
+        """Shut down the thread pool of the downloader"""
+        self._executor.shutdown(wait=False)
+
+    async def get_async(
+        self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        """Get tiles without blocking the event loop
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom for static map
+            x (int): x value of center for the static map
+            y (int): y value of center for the static map
+
+        Returns:
+            typing.Optional[bytes]: tiles
+
+        Raises:
+            RuntimeError: raises a runtime error if the server response status is not 200
+        """
+        async with self._semaphore(provider):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.get, provider, cache_dir, zoom, x, y)
+
+    async def get_many_async(
+        self,
+        provider: TileProvider,
+        cache_dir: str,
+        zoom: int,
+        tiles: typing.Iterable[typing.Tuple[int, int]],
+        cancellation: typing.Optional[CancellationToken] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], "asyncio.Task[typing.Optional[bytes]]"]:
+        """Get several tiles concurrently without blocking the event loop
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom for static map
+            tiles (typing.Iterable[typing.Tuple[int, int]]): x and y values of the tiles
+            cancellation (typing.Optional[CancellationToken]): token cancelling the fetches still running
+
+        Returns:
+            typing.Dict[typing.Tuple[int, int], asyncio.Task]: completed tasks holding the tile data (or the raised
+            exception) per (x, y); tasks still running when the token was cancelled are cancelled
+        """
+        result = {
+            (x, y): asyncio.create_task(self.get_async(provider, cache_dir, zoom, x, y))
+            for (x, y) in dict.fromkeys(tiles)
+        }
+        pending = set(result.values())
+        while pending and not (cancellation is not None and cancellation.cancelled()):
+            # wake up regularly to notice explicit cancellations
+            timeout = None if cancellation is None else min(0.05, cancellation.remaining() or 0.05)
+            _, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return result
+
+    def _semaphore(self, provider: TileProvider) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        semaphore = semaphores.get(provider.name())
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(provider.max_concurrency())
+            semaphores[provider.name()] = semaphore
+        return semaphore
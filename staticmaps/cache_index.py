@@ -0,0 +1,342 @@
+"""py-staticmaps - cache_index"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+
+from .exit_flush import flush_at_exit
+
+INDEX_FILE_NAME = ".index.sqlite"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    provider TEXT, zoom INTEGER, x INTEGER, y INTEGER, size INTEGER, last_access REAL, hits INTEGER,
+    PRIMARY KEY (provider, zoom, x, y)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tiles_lru ON tiles (provider, last_access, zoom, x, y);
+CREATE INDEX IF NOT EXISTS tiles_lfu ON tiles (provider, hits, last_access, zoom, x, y);
+CREATE TABLE IF NOT EXISTS scans (provider TEXT PRIMARY KEY, scanned REAL);
+"""
+
+# directories modified this many seconds before the last scan are read again, since some file systems store
+# modification times with a granularity of seconds
+SCAN_SLACK = 2.0
+
+TileIndexT = typing.Tuple[str, int, int, int]
+"""provider directory, zoom, x and y of a tile"""
+
+
+def scan_tile_files(provider_dir: str) -> typing.Iterator[typing.Tuple[int, int, int, str, os.stat_result]]:
+    """Iterate over the tile files "provider_dir/zoom/x/y.png" of a cache directory
+
+    Parameters:
+        provider_dir (str): provider directory within the cache directory
+
+    Returns:
+        typing.Iterator[typing.Tuple[int, int, int, str, os.stat_result]]: zoom, x, y, file name and stat of the
+        tile files
+    """
+    for zoom_entry in _numeric_entries(provider_dir, ""):
+        for x_entry in _numeric_entries(zoom_entry.path, ""):
+            for y_entry in _numeric_entries(x_entry.path, ".png"):
+                try:
+                    stat = y_entry.stat()
+                except OSError:
+                    continue
+                yield int(zoom_entry.name), int(x_entry.name), int(y_entry.name[: -len(".png")]), y_entry.path, stat
+
+
+def _numeric_entries(directory: str, suffix: str) -> typing.List[os.DirEntry]:
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                entry
+                for entry in entries
+                if entry.name.endswith(suffix)
+                and entry.name[: len(entry.name) - len(suffix)].isdigit()
+                and (entry.is_file() if suffix else entry.is_dir())
+            ]
+    except OSError:
+        return []
+
+
+ORDER_COLUMNS = {"lru": ("last_access", "zoom", "x", "y"), "lfu": ("hits", "last_access", "zoom", "x", "y")}
+
+
+class CacheIndex:
+    """A lightweight index of the tiles in a cache directory, recording their sizes, last access times and hits
+
+    The index is a SQLite file in the cache directory. Accesses and new tiles are buffered and written in batches, so
+    recording them costs almost nothing on the render path; call flush() to write them immediately.
+    """
+
+    def __init__(self, cache_dir: str, batch_size: int = 256) -> None:
+        self._cache_dir = cache_dir
+        self._batch_size = max(1, batch_size)
+        self._accesses: typing.Dict[TileIndexT, typing.Tuple[float, int]] = {}
+        self._sizes: typing.Dict[TileIndexT, typing.Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        flush_at_exit(self)
+
+    def file_name(self) -> str:
+        """Return the file name of the index
+
+        Returns:
+            str: file name of the index
+        """
+        return os.path.join(self._cache_dir, INDEX_FILE_NAME)
+
+    def record_access(self, provider: str, zoom: int, x: int, y: int) -> None:
+        """Record a cache hit of a tile
+
+        Parameters:
+            provider (str): provider directory of the tile
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+        """
+        key = (provider, zoom, x, y)
+        with self._lock:
+            hits = self._accesses.get(key, (0.0, 0))[1]
+            self._accesses[key] = (time.time(), hits + 1)
+            if len(self._accesses) < self._batch_size:
+                return
+        self.flush()
+
+    def record_put(self, provider: str, zoom: int, x: int, y: int, size: int) -> None:
+        """Record a new or replaced tile
+
+        Parameters:
+            provider (str): provider directory of the tile
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            size (int): size of the tile file in bytes
+        """
+        with self._lock:
+            self._sizes[(provider, zoom, x, y)] = (size, time.time())
+            if len(self._sizes) < self._batch_size:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered accesses and tiles"""
+        with self._lock:
+            accesses = self._accesses
+            sizes = self._sizes
+            self._accesses = {}
+            self._sizes = {}
+        if not accesses and not sizes:
+            return
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO tiles (provider, zoom, x, y, size, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT (provider, zoom, x, y) DO UPDATE SET size = excluded.size, "
+                "last_access = max(last_access, excluded.last_access)",
+                [(*key, size, put_time) for key, (size, put_time) in sizes.items()],
+            )
+            connection.executemany(
+                "UPDATE tiles SET last_access = max(last_access, ?), hits = hits + ? "
+                "WHERE provider = ? AND zoom = ? AND x = ? AND y = ?",
+                [(access_time, hits, *key) for key, (access_time, hits) in accesses.items()],
+            )
+
+    def providers(self) -> typing.List[str]:
+        """Return the provider directories known to the index
+
+        Returns:
+            typing.List[str]: provider directories
+        """
+        self.flush()
+        rows = self._connection().execute("SELECT DISTINCT provider FROM tiles ORDER BY provider").fetchall()
+        return [row[0] for row in rows]
+
+    def usage(self, provider: str) -> typing.Tuple[int, int]:
+        """Return the number of indexed tiles of a provider and their total size
+
+        Parameters:
+            provider (str): provider directory
+
+        Returns:
+            typing.Tuple[int, int]: number of tiles and their total size in bytes
+        """
+        self.flush()
+        row = (
+            self._connection()
+            .execute("SELECT count(*), coalesce(sum(size), 0) FROM tiles WHERE provider = ?", (provider,))
+            .fetchone()
+        )
+        return row[0], row[1]
+
+    def candidates(
+        self, provider: str, policy: str = "lru", batch_size: int = 256
+    ) -> typing.Iterator[typing.Tuple[int, int, int, int]]:
+        """Iterate over the tiles of a provider in eviction order
+
+        The tiles are read in batches, so tiles may be removed from the index while iterating.
+
+        Parameters:
+            provider (str): provider directory
+            policy (str): "lru" (least recently used first) or "lfu" (least frequently used first)
+            batch_size (int): number of tiles read at once
+
+        Returns:
+            typing.Iterator[typing.Tuple[int, int, int, int]]: zoom, x, y and size of the tiles
+
+        Raises:
+            RuntimeError: raises a runtime error if the policy is unknown
+        """
+        columns = ORDER_COLUMNS.get(policy)
+        if columns is None:
+            raise RuntimeError(f"Unknown eviction policy: {policy}")
+        self.flush()
+        order = ", ".join(columns)
+        after: typing.Optional[typing.Tuple[typing.Any, ...]] = None
+        while True:
+            if after is None:
+                rows = (
+                    self._connection()
+                    .execute(
+                        f"SELECT {order}, size FROM tiles WHERE provider = ? ORDER BY {order} LIMIT ?",
+                        (provider, batch_size),
+                    )
+                    .fetchall()
+                )
+            else:
+                placeholders = ", ".join("?" * len(columns))
+                rows = (
+                    self._connection()
+                    .execute(
+                        f"SELECT {order}, size FROM tiles WHERE provider = ? AND ({order}) > ({placeholders}) "
+                        f"ORDER BY {order} LIMIT ?",
+                        (provider, *after, batch_size),
+                    )
+                    .fetchall()
+                )
+            if not rows:
+                return
+            for row in rows:
+                zoom, x, y, size = row[-4:]
+                yield zoom, x, y, size
+            after = tuple(rows[-1][: len(columns)])
+
+    def remove(self, provider: str, tiles: typing.Iterable[typing.Tuple[int, int, int]]) -> None:
+        """Remove tiles from the index
+
+        Parameters:
+            provider (str): provider directory
+            tiles (typing.Iterable[typing.Tuple[int, int, int]]): zoom, x and y values of the tiles
+        """
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "DELETE FROM tiles WHERE provider = ? AND zoom = ? AND x = ? AND y = ?",
+                [(provider, zoom, x, y) for zoom, x, y in tiles],
+            )
+
+    def rescan(self, provider: str) -> None:
+        """Synchronize the index with the tile files of a provider on disk
+
+        Tiles missing from the index (e.g. cached before the index existed) are added with their modification time
+        as last access; tiles whose files are gone are removed.
+
+        Parameters:
+            provider (str): provider directory
+        """
+        self.flush()
+        start = time.time()
+        connection = self._connection()
+        known = set(connection.execute("SELECT zoom, x, y FROM tiles WHERE provider = ?", (provider,)))
+        found = []
+        for zoom, x, y, _, stat in scan_tile_files(os.path.join(self._cache_dir, provider)):
+            found.append((provider, zoom, x, y, stat.st_size, stat.st_mtime))
+            known.discard((zoom, x, y))
+            if len(found) >= self._batch_size:
+                self._insert_scanned(connection, found)
+                found = []
+        self._insert_scanned(connection, found)
+        self.remove(provider, known)
+        self._record_scan(connection, provider, start)
+
+    def update(self, provider: str) -> None:
+        """Synchronize the index with the tile files of a provider written or removed since the last scan
+
+        Only the tile directories modified since the last scan are read, so tiles written without the access index
+        are found without scanning the whole cache directory. A provider that was never scanned is rescanned.
+
+        Parameters:
+            provider (str): provider directory
+        """
+        self.flush()
+        start = time.time()
+        connection = self._connection()
+        row = connection.execute("SELECT scanned FROM scans WHERE provider = ?", (provider,)).fetchone()
+        if row is None:
+            self.rescan(provider)
+            return
+        for zoom_entry in _numeric_entries(os.path.join(self._cache_dir, provider), ""):
+            for x_entry in _numeric_entries(zoom_entry.path, ""):
+                try:
+                    if x_entry.stat().st_mtime < row[0] - SCAN_SLACK:
+                        continue
+                except OSError:
+                    continue
+                self._update_directory(connection, provider, int(zoom_entry.name), int(x_entry.name), x_entry.path)
+        self._record_scan(connection, provider, start)
+
+    def _update_directory(self, connection: sqlite3.Connection, provider: str, zoom: int, x: int, path: str) -> None:
+        known = {
+            row[0]
+            for row in connection.execute(
+                "SELECT y FROM tiles WHERE provider = ? AND zoom = ? AND x = ?", (provider, zoom, x)
+            )
+        }
+        found = []
+        for y_entry in _numeric_entries(path, ".png"):
+            try:
+                stat = y_entry.stat()
+            except OSError:
+                continue
+            y = int(y_entry.name[: -len(".png")])
+            found.append((provider, zoom, x, y, stat.st_size, stat.st_mtime))
+            known.discard(y)
+        self._insert_scanned(connection, found)
+        self.remove(provider, [(zoom, x, y) for y in known])
+
+    @staticmethod
+    def _record_scan(connection: sqlite3.Connection, provider: str, scanned: float) -> None:
+        with connection:
+            connection.execute(
+                "INSERT INTO scans (provider, scanned) VALUES (?, ?) "
+                "ON CONFLICT (provider) DO UPDATE SET scanned = excluded.scanned",
+                (provider, scanned),
+            )
+
+    @staticmethod
+    def _insert_scanned(connection: sqlite3.Connection, tiles: typing.List[typing.Tuple[typing.Any, ...]]) -> None:
+        with connection:
+            connection.executemany(
+                "INSERT INTO tiles (provider, zoom, x, y, size, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT (provider, zoom, x, y) DO UPDATE SET size = excluded.size",
+                tiles,
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the connection of the current thread to the index, creating the index if necessary"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            pathlib.Path(self._cache_dir).mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.file_name(), timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(INDEX_SCHEMA)
+            connection.commit()
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,185 @@
+"""py-staticmaps - cache_pruner"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import time
+import typing
+
+import s2sphere  # type: ignore
+import slugify  # type: ignore
+
+from .cache_index import CacheIndex
+from .transformer import Transformer
+
+
+class CachePruner:
+    """Enforces size limits on a tile cache directory by evicting tiles in least recently or least frequently used
+    order, as recorded in the access index of the directory
+
+    Tiles in pinned zoom ranges or regions are never evicted. Tiles are removed in small batches, so pruning can run
+    next to renders using the same cache directory.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: typing.Optional[int] = None, policy: str = "lru") -> None:
+        self._cache_dir = cache_dir
+        self._index = CacheIndex(cache_dir)
+        self._max_bytes = max_bytes
+        self._provider_max_bytes: typing.Dict[str, int] = {}
+        self._policy = policy
+        self._pinned_zooms: typing.List[typing.Tuple[int, int]] = []
+        self._pinned_regions: typing.List[typing.Tuple[s2sphere.LatLngRect, int, int]] = []
+
+    def set_max_bytes(self, max_bytes: typing.Optional[int], provider: typing.Optional[str] = None) -> None:
+        """Set the maximum cache size per tile provider
+
+        Parameters:
+            max_bytes (typing.Optional[int]): maximum size of the tiles of a provider in bytes, or None for no limit
+            provider (typing.Optional[str]): name of the tile provider the limit applies to, or None for the default
+                limit of all providers
+        """
+        if provider is None:
+            self._max_bytes = max_bytes
+        elif max_bytes is None:
+            self._provider_max_bytes.pop(self._provider_dir(provider), None)
+        else:
+            self._provider_max_bytes[self._provider_dir(provider)] = max_bytes
+
+    def max_bytes(self, provider: str) -> typing.Optional[int]:
+        """Return the maximum cache size of a tile provider
+
+        Parameters:
+            provider (str): name of the tile provider
+
+        Returns:
+            typing.Optional[int]: maximum size of the tiles of the provider in bytes, or None for no limit
+        """
+        return self._provider_max_bytes.get(self._provider_dir(provider), self._max_bytes)
+
+    def set_policy(self, policy: str) -> None:
+        """Set the eviction policy
+
+        Parameters:
+            policy (str): "lru" (least recently used first) or "lfu" (least frequently used first)
+
+        Raises:
+            RuntimeError: raises a runtime error if the policy is unknown
+        """
+        if policy not in ("lru", "lfu"):
+            raise RuntimeError(f"Unknown eviction policy: {policy}")
+        self._policy = policy
+
+    def pin_zooms(self, min_zoom: int, max_zoom: int) -> None:
+        """Pin a zoom range, so its tiles are never evicted
+
+        Parameters:
+            min_zoom (int): minimum pinned zoom
+            max_zoom (int): maximum pinned zoom
+        """
+        self._pinned_zooms.append((min_zoom, max_zoom))
+
+    def pin_region(self, region: s2sphere.LatLngRect, min_zoom: int = 0, max_zoom: int = 30) -> None:
+        """Pin a region, so its tiles within the zoom range are never evicted
+
+        Parameters:
+            region (s2sphere.LatLngRect): pinned region
+            min_zoom (int): minimum pinned zoom
+            max_zoom (int): maximum pinned zoom
+        """
+        self._pinned_regions.append((region, min_zoom, max_zoom))
+
+    def is_pinned(self, zoom: int, x: int, y: int) -> bool:
+        """Check whether a tile is pinned
+
+        Parameters:
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile pinned
+        """
+        if any(min_zoom <= zoom <= max_zoom for min_zoom, max_zoom in self._pinned_zooms):
+            return True
+        for region, min_zoom, max_zoom in self._pinned_regions:
+            if min_zoom <= zoom <= max_zoom and self._region_contains(region, zoom, x, y):
+                return True
+        return False
+
+    def prune(
+        self, rescan: bool = False, batch_size: int = 256, pause: float = 0.0
+    ) -> typing.Dict[str, typing.Dict[str, int]]:
+        """Evict tiles until every tile provider is within its size limit
+
+        Parameters:
+            rescan (bool): synchronize the access index with all tile files on disk first; otherwise only the tile
+                directories modified since the last prune are scanned, so tiles written without the access index are
+                counted as well
+            batch_size (int): number of tiles removed at once
+            pause (float): seconds to sleep between two batches, to leave disk bandwidth to renders
+
+        Returns:
+            typing.Dict[str, typing.Dict[str, int]]: per provider directory the number of removed tiles and bytes,
+            and the number of remaining tiles and bytes
+        """
+        result = {}
+        for provider in self._providers_on_disk() | set(self._index.providers()):
+            if rescan:
+                self._index.rescan(provider)
+            else:
+                self._index.update(provider)
+            result[provider] = self._prune_provider(provider, max(1, batch_size), pause)
+        return result
+
+    def _prune_provider(self, provider: str, batch_size: int, pause: float) -> typing.Dict[str, int]:
+        tiles, total = self._index.usage(provider)
+        max_bytes = self._provider_max_bytes.get(provider, self._max_bytes)
+        removed_tiles = 0
+        removed_bytes = 0
+        batch: typing.List[typing.Tuple[int, int, int]] = []
+        if max_bytes is not None and total > max_bytes:
+            for zoom, x, y, size in self._index.candidates(provider, self._policy, batch_size):
+                if total - removed_bytes <= max_bytes:
+                    break
+                if self.is_pinned(zoom, x, y):
+                    continue
+                self._remove_tile(provider, zoom, x, y)
+                removed_bytes += size
+                removed_tiles += 1
+                batch.append((zoom, x, y))
+                if len(batch) >= batch_size:
+                    self._index.remove(provider, batch)
+                    batch = []
+                    if pause > 0:
+                        time.sleep(pause)
+        self._index.remove(provider, batch)
+        return {
+            "removed_tiles": removed_tiles,
+            "removed_bytes": removed_bytes,
+            "tiles": tiles - removed_tiles,
+            "bytes": total - removed_bytes,
+        }
+
+    def _remove_tile(self, provider: str, zoom: int, x: int, y: int) -> None:
+        file_name = os.path.join(self._cache_dir, provider, str(zoom), str(x), f"{y}.png")
+        for name in (file_name, f"{file_name}.meta"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+    def _providers_on_disk(self) -> typing.Set[str]:
+        try:
+            with os.scandir(self._cache_dir) as entries:
+                return {entry.name for entry in entries if entry.is_dir() and not entry.name.startswith(".")}
+        except OSError:
+            return set()
+
+    @staticmethod
+    def _provider_dir(provider: str) -> str:
+        return slugify.slugify(provider) or "_"
+
+    @staticmethod
+    def _region_contains(region: s2sphere.LatLngRect, zoom: int, x: int, y: int) -> bool:
+        x_min, y_min, x_max, y_max = Transformer.tile_bounds(region, zoom)
+        return y_min <= y <= y_max and (x - x_min) % (2**zoom) <= x_max - x_min
@@ -18,6 +18,7 @@ except ImportError:
 from PIL import Image as PIL_Image  # type: ignore
 
 from .color import BLACK, WHITE, Color
+from .decoded_tile_cache import DecodedTileCache
 from .renderer import Renderer
 from .transformer import Transformer
 
@@ -43,6 +44,8 @@ cairo_ImageSurface = typing.Any  # pylint: disable=invalid-name
 class CairoRenderer(Renderer):
     """An image renderer using cairo that extends a generic renderer class"""
 
+    _decoded_tiles = DecodedTileCache()
+
     def __init__(self, transformer: Transformer) -> None:
         Renderer.__init__(self, transformer)
 
@@ -129,26 +132,15 @@ class CairoRenderer(Renderer):
             objects (typing.List["Object"]): objects of static map
             tighten (bool): tighten to boundaries
         """
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    self._context.save()
-                    self._context.translate(
-                        int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
-                        int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
-                    )
-                    self._context.set_source_surface(tile_img)
-                    self._context.paint()
-                    self._context.restore()
-                except RuntimeError:
-                    pass
+        for xx, yy, tile_img in self.tile_images(download):
+            self._context.save()
+            self._context.translate(
+                int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
+                int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
+            )
+            self._context.set_source_surface(tile_img)
+            self._context.paint()
+            self._context.restore()
 
     def render_attribution(self, attribution: typing.Optional[str]) -> None:
         """Render attribution from given tiles provider
@@ -194,4 +186,15 @@ class CairoRenderer(Renderer):
         image_data = download(self._trans.zoom(), x, y)
         if image_data is None:
             return None
-        return self.create_image(image_data)
+        return CairoRenderer._decoded_tiles.get_or_create(
+            image_data, CairoRenderer.create_image, lambda surface: surface.get_stride() * surface.get_height()
+        )
+
+    @staticmethod
+    def decoded_tile_cache() -> DecodedTileCache:
+        """Return the cache of decoded tiles shared by all cairo renderers
+
+        Returns:
+            DecodedTileCache: cache of tile image surfaces
+        """
+        return CairoRenderer._decoded_tiles
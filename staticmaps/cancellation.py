@@ -0,0 +1,76 @@
+"""py-staticmaps - cancellation"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import time
+import typing
+
+
+class CancellationToken:
+    """A thread-safe token cancelling a render, either explicitly or when its deadline has passed
+
+    A token is usually created per render, e.g. CancellationToken(timeout=0.3) for a render that must finish within
+    300 ms, and may be cancelled from any thread.
+    """
+
+    def __init__(self, timeout: typing.Optional[float] = None) -> None:
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        """Cancel the token"""
+        self._event.set()
+
+    def cancelled(self) -> bool:
+        """Check whether the token has been cancelled or its deadline has passed
+
+        Returns:
+            bool: is the token cancelled
+        """
+        return self._event.is_set() or (self._deadline is not None and time.monotonic() >= self._deadline)
+
+    def remaining(self) -> typing.Optional[float]:
+        """Return the time left until the deadline
+
+        Returns:
+            typing.Optional[float]: seconds until the deadline (0 if cancelled), or None if there is no deadline
+        """
+        if self._event.is_set():
+            return 0.0
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """Wait until the token is cancelled, its deadline has passed, or the timeout has elapsed
+
+        Parameters:
+            timeout (typing.Optional[float]): maximum time to wait in seconds, None waits for the token
+
+        Returns:
+            bool: is the token cancelled
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled()
+
+
+class DegradedTile(typing.NamedTuple):
+    """A tile of a rendered map that could not be rendered from its own data"""
+
+    # pylint: disable=invalid-name
+
+    zoom: int
+    """zoom of the tile"""
+    x: int
+    """x value of the tile"""
+    y: int
+    """y value of the tile"""
+    reason: str
+    """"cancelled" if the fetch did not finish in time, "failed" if it failed, "synthesized" if the tile was
+    synthesized from other zooms"""
+    filled: bool
+    """whether the tile was filled with a fallback tile; otherwise the background shows through"""
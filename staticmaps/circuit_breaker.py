@@ -0,0 +1,76 @@
+"""py-staticmaps - circuit_breaker"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import time
+import typing
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request while the circuit breaker of the tile provider is open"""
+
+
+class CircuitBreaker:
+    """A thread-safe circuit breaker for the requests to one tile provider
+
+    The circuit opens after a number of consecutive failures; while it is open, requests fail fast. After the reset
+    timeout, a single probe request is let through (half-open): its success closes the circuit, its failure opens it
+    again for another reset timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened = 0.0
+        self._probe_started: typing.Optional[float] = None
+        self._lock = threading.Lock()
+
+    def state(self) -> str:
+        """Return the state of the circuit
+
+        Returns:
+            str: "closed", "open" or "half-open"
+        """
+        return self._state
+
+    def allow(self) -> bool:
+        """Check whether a request may be sent, and start a probe if the reset timeout of the open circuit is over
+
+        Returns:
+            bool: may the request be sent
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == CIRCUIT_OPEN and now - self._opened < self._reset_timeout:
+                return False
+            # a probe that never reported back (e.g. due to an unexpected exception) is replaced after a while
+            if self._probe_started is not None and now - self._probe_started < self._reset_timeout:
+                return False
+            self._state = CIRCUIT_HALF_OPEN
+            self._probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the circuit"""
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        """Record a failed request, opening the circuit after too many consecutive failures or a failed probe"""
+        with self._lock:
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self._failure_threshold:
+                self._state = CIRCUIT_OPEN
+                self._opened = time.monotonic()
+                self._probe_started = None
@@ -6,9 +6,15 @@
 import argparse
 import enum
 import os
+import sys
+import typing
+
+import appdirs  # type: ignore
 
 import staticmaps
 
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
 
 class FileFormat(enum.Enum):
     """FileFormat"""
@@ -42,8 +48,267 @@ def determine_file_format(file_format: FileFormat, file_name: str) -> FileFormat
     raise RuntimeError("Cannot guess the image type from the given file name: {file_name}")
 
 
+def parse_size(s: str) -> int:
+    """
+    parse_size Parse a size like "500M" or "2G" into bytes
+
+    Parameters:
+        s (str): size with an optional unit K, M, G or T (powers of 1024)
+
+    Raises:
+        ValueError: If the size cannot be parsed
+
+    Returns:
+        int: size in bytes
+    """
+    value = s.strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    try:
+        return int(float(value[: len(value) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError as e:
+        raise ValueError(f'Cannot parse size "{s}"') from e
+
+
+def parse_zoom_range(s: str) -> typing.Tuple[int, int]:
+    """
+    parse_zoom_range Parse a zoom range like "5-15" or a single zoom like "8"
+
+    Parameters:
+        s (str): zoom range
+
+    Raises:
+        ValueError: If the zoom range cannot be parsed
+
+    Returns:
+        typing.Tuple[int, int]: minimum and maximum zoom
+    """
+    try:
+        min_zoom, _, max_zoom = s.partition("-")
+        result = int(min_zoom), int(max_zoom or min_zoom)
+    except ValueError as e:
+        raise ValueError(f'Cannot parse zoom range "{s}"') from e
+    if result[0] > result[1]:
+        raise ValueError(f'Cannot parse zoom range "{s}" (minimum zoom exceeds maximum zoom)')
+    return result
+
+
+def cache_args_parser() -> argparse.ArgumentParser:
+    """
+    cache_args_parser Create the argument parser of the "cache" subcommands
+
+    Returns:
+        argparse.ArgumentParser: argument parser
+    """
+    args_parser = argparse.ArgumentParser(prog="createstaticmap cache")
+    subparsers = args_parser.add_subparsers(dest="command", required=True)
+    prune_parser = subparsers.add_parser("prune", help="Evict tiles until the cache is within its size limits")
+    prune_parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=str,
+        default=os.path.join(appdirs.user_cache_dir(staticmaps.LIB_NAME), "tiles"),
+    )
+    prune_parser.add_argument(
+        "--max-size",
+        metavar="SIZE",
+        type=parse_size,
+        help="Maximum cache size per tile provider, e.g. 500M or 2G",
+    )
+    prune_parser.add_argument(
+        "--provider-max-size",
+        metavar="TILEPROVIDER=SIZE",
+        type=str,
+        action="append",
+        help="Maximum cache size of a single tile provider",
+    )
+    prune_parser.add_argument(
+        "--policy",
+        type=str,
+        choices=["lru", "lfu"],
+        default="lru",
+    )
+    prune_parser.add_argument(
+        "--pin-zooms",
+        metavar="MIN-MAX",
+        type=parse_zoom_range,
+        action="append",
+        help="Never evict tiles of this zoom range",
+    )
+    prune_parser.add_argument(
+        "--pin-region",
+        metavar="LAT,LNG LAT,LNG[:MIN-MAX]",
+        type=str,
+        action="append",
+        help="Never evict tiles of this region, optionally limited to a zoom range",
+    )
+    prune_parser.add_argument(
+        "--rescan",
+        action="store_true",
+        default=False,
+        help="Synchronize the access index with all tile files on disk first, not only with the tile directories "
+        "modified since the last prune (default: False)",
+    )
+    prune_parser.add_argument(
+        "--batch-size",
+        metavar="TILES",
+        type=int,
+        default=256,
+    )
+    prune_parser.add_argument(
+        "--pause",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="Sleep between two batches of removed tiles (default: 0)",
+    )
+    pack_parser = subparsers.add_parser("pack", help="Convert the cache directory into memory-mappable tile packs")
+    pack_parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=str,
+        default=os.path.join(appdirs.user_cache_dir(staticmaps.LIB_NAME), "tiles"),
+    )
+    pack_parser.add_argument(
+        "--output",
+        metavar="DIR",
+        type=str,
+        required=True,
+    )
+    pack_parser.add_argument(
+        "--provider",
+        metavar="TILEPROVIDER",
+        type=str,
+        action="append",
+        help="Convert only the tiles of this tile provider (default: all)",
+    )
+    pack_parser.add_argument(
+        "--zooms",
+        metavar="MIN-MAX",
+        type=parse_zoom_range,
+        action="append",
+        help="Write one pack for this zoom range (default: one pack for all zooms)",
+    )
+    return args_parser
+
+
+def cache_main(argv: typing.List[str]) -> None:
+    """
+    cache_main Entry point of the "cache" subcommands
+
+    Parameters:
+        argv (typing.List[str]): command line arguments following "cache"
+    """
+    args = cache_args_parser().parse_args(argv)
+    if args.command == "pack":
+        for file_name in staticmaps.pack_tile_cache(args.cache_dir, args.output, args.provider, args.zooms):
+            print(f"wrote tile pack {file_name}")
+        return
+
+    pruner = staticmaps.CachePruner(args.cache_dir, args.max_size, args.policy)
+    for provider_max_size in args.provider_max_size or []:
+        name, _, size = provider_max_size.partition("=")
+        pruner.set_max_bytes(parse_size(size), name)
+    for min_zoom, max_zoom in args.pin_zooms or []:
+        pruner.pin_zooms(min_zoom, max_zoom)
+    for pin_region in args.pin_region or []:
+        coords, _, zooms = pin_region.partition(":")
+        pruner.pin_region(staticmaps.parse_latlngs2rect(coords), *(parse_zoom_range(zooms) if zooms else (0, 30)))
+
+    for provider, stats in sorted(pruner.prune(args.rescan, args.batch_size, args.pause).items()):
+        print(
+            f"{provider}: removed {stats['removed_tiles']} tiles ({stats['removed_bytes']} bytes), "
+            f"kept {stats['tiles']} tiles ({stats['bytes']} bytes)"
+        )
+
+
+def seed_main(argv: typing.List[str]) -> None:
+    """
+    seed_main Entry point of the "seed" subcommand
+
+    Parameters:
+        argv (typing.List[str]): command line arguments following "seed"
+    """
+    args_parser = argparse.ArgumentParser(prog="createstaticmap seed")
+    args_parser.add_argument(
+        "--provider",
+        metavar="TILEPROVIDER",
+        type=str,
+        choices=staticmaps.default_tile_providers.keys(),
+        default=staticmaps.tile_provider_OSM.name(),
+    )
+    args_parser.add_argument(
+        "--provider-api-key",
+        dest="provider_api_key",
+        metavar="API_KEY",
+        type=str,
+        default=None,
+    )
+    args_parser.add_argument(
+        "--bbox",
+        metavar="LAT,LNG LAT,LNG",
+        type=str,
+        nargs="+",
+        required=True,
+    )
+    args_parser.add_argument(
+        "--zooms",
+        metavar="MIN-MAX",
+        type=parse_zoom_range,
+        required=True,
+    )
+    args_parser.add_argument(
+        "--concurrency",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Number of concurrent fetches, bounded by the tile provider (default: maximum of the tile provider)",
+    )
+    args_parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=str,
+        default=os.path.join(appdirs.user_cache_dir(staticmaps.LIB_NAME), "tiles"),
+    )
+
+    args = args_parser.parse_args(argv)
+
+    provider = staticmaps.default_tile_providers[args.provider]
+    if args.provider_api_key is not None:
+        provider.set_api_key(args.provider_api_key)
+    rect = staticmaps.parse_latlngs2rect(" ".join(args.bbox))
+    downloader = staticmaps.TileDownloader()
+    # seeded tiles are not rendered, so keep them out of the in-memory cache
+    downloader.set_memory_cache(None)
+    seeder = staticmaps.TileSeeder(downloader, provider, args.cache_dir)
+
+    def report(progress: staticmaps.SeedProgress) -> None:
+        percent = 100 * progress.done() / progress.total if progress.total else 100
+        print(
+            f"\r{progress.done()}/{progress.total} tiles ({percent:.1f}%): {progress.fetched} fetched, "
+            f"{progress.skipped} cached, {progress.failed} failed, {progress.tiles_per_second():.1f} tiles/s, "
+            f"{progress.fetched_bytes / max(progress.elapsed, 1e-9) / 1024:.1f} KiB/s",
+            end="",
+            flush=True,
+        )
+
+    seeder.seed(rect, args.zooms[0], args.zooms[1], args.concurrency, report)
+    print()
+
+
 def main() -> None:
     """main Entry point"""
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        cache_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "seed":
+        seed_main(sys.argv[2:])
+    else:
+        render_main()
+
+
+def render_main() -> None:
+    """render_main Entry point of rendering a static map"""
     args_parser = argparse.ArgumentParser(prog="createstaticmap")
     args_parser.add_argument(
         "--center",
@@ -3,6 +3,7 @@
 # py-staticmaps
 # Copyright (c) 2022 Florian Pigorsch; see /LICENSE for licensing information
 
+import asyncio
 import math
 import os
 import typing
@@ -13,11 +14,22 @@ import svgwrite  # type: ignore
 from PIL import Image as PIL_Image  # type: ignore
 
 from .cairo_renderer import CairoRenderer, cairo_is_supported
+from .cancellation import CancellationToken, DegradedTile
 from .color import Color
 from .meta import LIB_NAME
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
+from .prefetched_tiles import (
+    PrefetchedTiles,
+    TileSource,
+    last_degraded_tiles,
+    prefetch_tiles,
+    prefetch_tiles_async,
+)
+from .render_pipeline import RenderPipeline
+from .renderer import Renderer
 from .svg_renderer import SvgRenderer
+from .tile_cache import TileCache
 from .tile_downloader import TileDownloader
 from .tile_provider import TileProvider, tile_provider_OSM
 from .transformer import Transformer
@@ -36,6 +48,8 @@ class Context:
         self._tile_downloader = TileDownloader()
         self._cache_dir = os.path.join(appdirs.user_cache_dir(LIB_NAME), "tiles")
         self._tighten_to_bounds: bool = False
+        self._fallback_tile: typing.Optional[bytes] = None
+        self._render_pipeline = RenderPipeline()
 
     def set_zoom(self, zoom: int) -> None:
         """Set zoom for static map
@@ -74,6 +88,15 @@ class Context:
         """
         self._cache_dir = directory
 
+    def set_tile_cache(self, tile_cache: typing.Optional[TileCache]) -> None:
+        """Set a tile cache of the tile downloader replacing the cache dir
+
+        Parameters:
+            tile_cache (typing.Optional[TileCache]): tile cache (e.g. MBTilesTileCache or TieredTileCache), None
+                selects the cache dir
+        """
+        self._tile_downloader.set_tile_cache(tile_cache)
+
     def set_tile_downloader(self, downloader: TileDownloader) -> None:
         """Set tile downloader
 
@@ -82,6 +105,38 @@ class Context:
         """
         self._tile_downloader = downloader
 
+    def set_fallback_tile(self, data: typing.Optional[bytes]) -> None:
+        """Set the tile filling tiles that are neither fetched in time nor cached
+
+        Parameters:
+            data (typing.Optional[bytes]): encoded fallback tile, None lets the background color show through
+        """
+        self._fallback_tile = data
+
+    def set_pipelined_render(self, pipelined: bool = True) -> None:
+        """Set pipelined rendering
+
+        A pipelined render starts painting as soon as the first tiles arrive instead of waiting for all of them:
+        tiles are decoded concurrently while being fetched, and the geometry of the objects is prepared while the
+        tiles are being painted. Tiles are still painted in a fixed order, so the output is the same.
+
+        Parameters:
+            pipelined (bool): pipeline the render or not
+        """
+        self._render_pipeline.set_pipelined(pipelined)
+
+    def set_decode_workers(self, workers: typing.Optional[int] = None) -> None:
+        """Set the number of threads decoding the tiles of a render in parallel
+
+        Decoding PNG and JPEG data releases the GIL, so large maps render faster with several decode threads. The
+        tiles are still painted in a fixed order, so the output is the same as with serial decoding.
+
+        Parameters:
+            workers (typing.Optional[int]): number of decode threads, None uses one thread per CPU, 0 decodes the
+                tiles on the render thread
+        """
+        self._render_pipeline.set_decode_workers(workers)
+
     def set_tile_provider(self, provider: TileProvider, api_key: typing.Optional[str] = None) -> None:
         """Set tile provider
 
@@ -101,6 +156,17 @@ class Context:
         """
         self._tighten_to_bounds = tighten
 
+    def degraded_tiles(self) -> typing.List[DegradedTile]:
+        """Return the tiles of the last render in the current thread or asyncio task that were not rendered from their
+        own data
+
+        Renders running concurrently in other threads or tasks keep their own reports.
+
+        Returns:
+            typing.List[DegradedTile]: tiles that were cancelled, failed or synthesized from other zooms
+        """
+        return last_degraded_tiles(self)
+
     def add_object(self, obj: Object) -> None:
         """Add object for the static map (e.g. line, area, marker)
 
@@ -109,12 +175,16 @@ class Context:
         """
         self._objects.append(obj)
 
-    def render_cairo(self, width: int, height: int) -> typing.Any:
+    def render_cairo(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> typing.Any:
         """Render area using cairo
 
         Parameters:
             width (int): width of static map
             height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
 
         Returns:
             cairo.ImageSurface: cairo image
@@ -127,26 +197,21 @@ class Context:
         if not cairo_is_supported():
             raise RuntimeError('You need to install the "cairo" module to enable "render_cairo".')
 
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
-
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
-
+        trans = self._create_transformer(width, height)
         renderer = CairoRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile, self._objects, self._tighten_to_bounds)
-        renderer.render_objects(self._objects, self._tighten_to_bounds)
-        renderer.render_attribution(self._tile_provider.attribution())
-
+        self._render(renderer, self._prefetch_tiles(trans, cancellation))
         return renderer.image_surface()
 
-    def render_pillow(self, width: int, height: int) -> PIL_Image.Image:
+    def render_pillow(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> PIL_Image.Image:
         """Render context using PILLOW
 
         Parameters:
             width (int): width of static map
             height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
 
         Returns:
             PIL_Image: pillow image
@@ -154,26 +219,21 @@ class Context:
         Raises:
             RuntimeError: raises runtime error if map has no center and zoom
         """
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
-
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
-
+        trans = self._create_transformer(width, height)
         renderer = PillowRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile, self._objects, self._tighten_to_bounds)
-        renderer.render_objects(self._objects, self._tighten_to_bounds)
-        renderer.render_attribution(self._tile_provider.attribution())
-
+        self._render(renderer, self._prefetch_tiles(trans, cancellation))
         return renderer.image()
 
-    def render_svg(self, width: int, height: int) -> svgwrite.Drawing:
+    def render_svg(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> svgwrite.Drawing:
         """Render context using svgwrite
 
         Parameters:
             width (int): width of static map
             height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
 
         Returns:
             svgwrite.Drawing: svg drawing
@@ -181,18 +241,89 @@ class Context:
         Raises:
             RuntimeError: raises runtime error if map has no center and zoom
         """
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
+        trans = self._create_transformer(width, height)
+        renderer = SvgRenderer(trans)
+        self._render(renderer, self._prefetch_tiles(trans, cancellation))
+        return renderer.drawing()
 
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
+    async def render_cairo_async(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> typing.Any:
+        """Render area using cairo without blocking the event loop
 
-        renderer = SvgRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile, self._objects, self._tighten_to_bounds)
-        renderer.render_objects(self._objects, self._tighten_to_bounds)
-        renderer.render_attribution(self._tile_provider.attribution())
+        Tiles are fetched concurrently; decoding and compositing run in the default executor of the event loop.
+
+        Parameters:
+            width (int): width of static map
+            height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
+
+        Returns:
+            cairo.ImageSurface: cairo image
+
+        Raises:
+            RuntimeError: raises runtime error if cairo is not available
+            RuntimeError: raises runtime error if map has no center and
+                zoom
+        """
+        if not cairo_is_supported():
+            raise RuntimeError('You need to install the "cairo" module to enable "render_cairo_async".')
+
+        trans = self._create_transformer(width, height)
+        renderer = CairoRenderer(trans)
+        download = await self._prefetch_tiles_async(trans, cancellation)
+        await asyncio.get_running_loop().run_in_executor(None, self._render, renderer, download)
+        return renderer.image_surface()
+
+    async def render_pillow_async(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> PIL_Image.Image:
+        """Render context using PILLOW without blocking the event loop
+
+        Tiles are fetched concurrently; decoding and compositing run in the default executor of the event loop.
+
+        Parameters:
+            width (int): width of static map
+            height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
+
+        Returns:
+            PIL_Image: pillow image
+
+        Raises:
+            RuntimeError: raises runtime error if map has no center and zoom
+        """
+        trans = self._create_transformer(width, height)
+        renderer = PillowRenderer(trans)
+        download = await self._prefetch_tiles_async(trans, cancellation)
+        await asyncio.get_running_loop().run_in_executor(None, self._render, renderer, download)
+        return renderer.image()
+
+    async def render_svg_async(
+        self, width: int, height: int, cancellation: typing.Optional[CancellationToken] = None
+    ) -> svgwrite.Drawing:
+        """Render context using svgwrite without blocking the event loop
+
+        Tiles are fetched concurrently; encoding and compositing run in the default executor of the event loop.
+
+        Parameters:
+            width (int): width of static map
+            height (int): height of static map
+            cancellation (typing.Optional[CancellationToken]): token bounding the time spent waiting for tiles;
+                tiles missing when it is cancelled are filled from the cache or with the fallback tile
 
+        Returns:
+            svgwrite.Drawing: svg drawing
+
+        Raises:
+            RuntimeError: raises runtime error if map has no center and zoom
+        """
+        trans = self._create_transformer(width, height)
+        renderer = SvgRenderer(trans)
+        download = await self._prefetch_tiles_async(trans, cancellation)
+        await asyncio.get_running_loop().run_in_executor(None, self._render, renderer, download)
         return renderer.drawing()
 
     def object_bounds(self) -> typing.Optional[s2sphere.LatLngRect]:
@@ -333,8 +464,30 @@ class Context:
 
         return trans.pixel2ll((max_x + min_x) * 0.5, (max_y + min_y) * 0.5)
 
-    def _fetch_tile(self, z: int, x: int, y: int) -> typing.Optional[bytes]:
-        return self._tile_downloader.get(self._tile_provider, self._cache_dir, z, x, y)
+    def _create_transformer(self, width: int, height: int) -> Transformer:
+        center, zoom = self.determine_center_zoom(width, height)
+        if center is None or zoom is None:
+            raise RuntimeError("Cannot render map without center/zoom.")
+        return Transformer(width, height, zoom, center, self._tile_provider.tile_size())
+
+    def _render(self, renderer: Renderer, download: typing.Callable[[int, int, int], typing.Optional[bytes]]) -> None:
+        renderer.render_background(self._background_color)
+        self._render_pipeline.render_tiles(renderer, download, self._objects, self._tighten_to_bounds)
+        renderer.render_objects(self._objects, self._tighten_to_bounds)
+        renderer.render_attribution(self._tile_provider.attribution())
+
+    def _prefetch_tiles(
+        self, trans: Transformer, cancellation: typing.Optional[CancellationToken] = None
+    ) -> PrefetchedTiles:
+        return prefetch_tiles(self, self._tile_source(), trans, self._render_pipeline.pipelined(), cancellation)
+
+    async def _prefetch_tiles_async(
+        self, trans: Transformer, cancellation: typing.Optional[CancellationToken] = None
+    ) -> PrefetchedTiles:
+        return await prefetch_tiles_async(self, self._tile_source(), trans, cancellation)
+
+    def _tile_source(self) -> TileSource:
+        return TileSource(self._tile_downloader, self._tile_provider, self._cache_dir, self._fallback_tile)
 
     def _clamp_zoom(self, zoom: typing.Optional[int]) -> typing.Optional[int]:
         if zoom is None:
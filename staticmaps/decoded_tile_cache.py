@@ -0,0 +1,84 @@
+"""py-staticmaps - decoded_tile_cache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import hashlib
+import threading
+import typing
+
+T = typing.TypeVar("T")
+
+
+class DecodedTileCache:
+    """A thread-safe cache of renderer-ready tile objects with a memory limit and least-recently-used eviction
+
+    The objects are keyed by a digest of the encoded tile data: identical tiles (e.g. sea tiles) share one object,
+    and updated tile data never yields an outdated object.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024) -> None:
+        self._max_bytes = max_bytes
+        self._entries: typing.OrderedDict[bytes, typing.Tuple[typing.Any, int]] = collections.OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Set the memory limit of the cache, evicting objects if necessary
+
+        Parameters:
+            max_bytes (int): maximum (estimated) number of bytes held by the cache
+        """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict(0)
+
+    def get_or_create(self, data: bytes, create: typing.Callable[[bytes], T], size: typing.Callable[[T], int]) -> T:
+        """Return the cached object for the given tile data, creating it if necessary
+
+        Parameters:
+            data (bytes): encoded tile data
+            create (typing.Callable[[bytes], T]): creates the object from the tile data
+            size (typing.Callable[[T], int]): estimates the memory size of the object in bytes
+
+        Returns:
+            T: renderer-ready tile object
+        """
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return typing.cast(T, entry[0])
+            self._misses += 1
+        obj = create(data)
+        obj_size = size(obj)
+        with self._lock:
+            if key not in self._entries and obj_size <= self._max_bytes:
+                self._evict(obj_size)
+                self._entries[key] = (obj, obj_size)
+                self._bytes += obj_size
+        return obj
+
+    def clear(self) -> None:
+        """Remove all objects from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Return the counters of the cache
+
+        Returns:
+            typing.Dict[str, int]: hits, misses, number of cached objects and their estimated size in bytes
+        """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "tiles": len(self._entries), "bytes": self._bytes}
+
+    def _evict(self, extra_bytes: int) -> None:
+        while self._entries and self._bytes + extra_bytes > self._max_bytes:
+            _, (_, obj_size) = self._entries.popitem(last=False)
+            self._bytes -= obj_size
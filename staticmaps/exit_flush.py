@@ -0,0 +1,34 @@
+"""py-staticmaps - exit_flush"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import atexit
+import threading
+import typing
+import weakref
+
+_flushables: "weakref.WeakSet[typing.Any]" = weakref.WeakSet()
+_lock = threading.Lock()
+
+
+def flush_at_exit(flushable: typing.Any) -> None:
+    """Flush an object when the interpreter exits, without keeping the object alive until then
+
+    Parameters:
+        flushable (typing.Any): object buffering writes with a flush() method, e.g. a tile cache
+    """
+    with _lock:
+        _flushables.add(flushable)
+
+
+def _flush_all() -> None:
+    with _lock:
+        flushables = list(_flushables)
+    for flushable in flushables:
+        try:
+            flushable.flush()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+
+atexit.register(_flush_all)
@@ -0,0 +1,101 @@
+"""py-staticmaps - file_lock"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import contextlib
+import hashlib
+import os
+import pathlib
+import sys
+import threading
+import typing
+
+try:
+    import fcntl
+except ImportError:
+    pass
+
+LOCK_FILE_NAME = ".tile-locks"
+
+
+def file_lock_is_supported() -> bool:
+    """Check whether file locks are supported on this platform
+
+    Returns:
+        bool: Are file locks supported
+    """
+    return "fcntl" in sys.modules
+
+
+class FileLock:
+    """Locks shared between processes, keyed by strings
+
+    Each key maps to one of a fixed number of slots, which are byte-range locks in a single lock file, so no lock
+    files pile up. Threads of one process are serialized per slot, too.
+    """
+
+    def __init__(self, file_name: str, slots: int = 65536) -> None:
+        if not file_lock_is_supported():
+            raise RuntimeError("Cannot use file locks since the 'fcntl' module could not be imported.")
+        self._file_name = file_name
+        self._slots = max(1, slots)
+        self._fd: typing.Optional[int] = None
+        self._slot_locks: typing.Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def file_name(self) -> str:
+        """Return the name of the lock file
+
+        Returns:
+            str: name of the lock file
+        """
+        return self._file_name
+
+    @contextlib.contextmanager
+    def locked(self, key: str) -> typing.Iterator[None]:
+        """Hold the lock of a key
+
+        Parameters:
+            key (str): key to lock
+
+        Returns:
+            typing.Iterator[None]: context manager holding the lock
+        """
+        slot = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big") % self._slots
+        with self._lock:
+            slot_lock = self._slot_locks.setdefault(slot, threading.Lock())
+            if self._fd is None:
+                pathlib.Path(os.path.dirname(self._file_name) or ".").mkdir(parents=True, exist_ok=True)
+                self._fd = os.open(self._file_name, os.O_RDWR | os.O_CREAT, 0o666)
+            fd = self._fd
+        with slot_lock:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, slot)
+            try:
+                yield
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+
+
+_file_locks: typing.Dict[str, FileLock] = {}
+_file_locks_lock = threading.Lock()
+
+
+def cache_dir_lock(cache_dir: str) -> FileLock:
+    """Return the process-wide file lock of a cache directory
+
+    POSIX byte-range locks are owned by the process, so all users of one lock file within a process must share one
+    FileLock.
+
+    Parameters:
+        cache_dir (str): cache directory
+
+    Returns:
+        FileLock: file lock of the cache directory
+    """
+    file_name = os.path.abspath(os.path.join(cache_dir, LOCK_FILE_NAME))
+    with _file_locks_lock:
+        file_lock = _file_locks.get(file_name)
+        if file_lock is None:
+            file_lock = FileLock(file_name)
+            _file_locks[file_name] = file_lock
+        return file_lock
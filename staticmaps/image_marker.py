@@ -2,13 +2,18 @@
 
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
-import io
 import typing
 
 import s2sphere  # type: ignore
 from PIL import Image as PIL_Image  # type: ignore
 
 from .cairo_renderer import CairoRenderer
+from .image_registry import (
+    ImageRegistry,
+    ImageSourceT,
+    RegisteredImage,
+    default_image_registry,
+)
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
 from .svg_renderer import SvgRenderer
@@ -19,15 +24,21 @@ class ImageMarker(Object):
     ImageMarker A marker for an image object
     """
 
-    def __init__(self, latlng: s2sphere.LatLng, png_file: str, origin_x: int, origin_y: int) -> None:
+    def __init__(
+        self,
+        latlng: s2sphere.LatLng,
+        png_file: ImageSourceT,
+        origin_x: int,
+        origin_y: int,
+        registry: typing.Optional[ImageRegistry] = None,
+    ) -> None:
         Object.__init__(self)
         self._latlng = latlng
         self._png_file = png_file
         self._origin_x = origin_x
         self._origin_y = origin_y
-        self._width = 0
-        self._height = 0
-        self._image_data: typing.Optional[bytes] = None
+        self._registry = registry if registry is not None else default_image_registry
+        self._image: typing.Optional[RegisteredImage] = None
 
     def origin_x(self) -> int:
         """Return x origin of the image marker
@@ -51,9 +62,7 @@ class ImageMarker(Object):
         Returns:
             int: width of the image marker
         """
-        if self._image_data is None:
-            self.load_image_data()
-        return self._width
+        return self.registered_image().width()
 
     def height(self) -> int:
         """Return height of the image marker
@@ -61,9 +70,7 @@ class ImageMarker(Object):
         Returns:
             int: height of the image marker
         """
-        if self._image_data is None:
-            self.load_image_data()
-        return self._height
+        return self.registered_image().height()
 
     def image_data(self) -> bytes:
         """Return image data of the image marker
@@ -71,10 +78,18 @@ class ImageMarker(Object):
         Returns:
             bytes: image data of the image marker
         """
-        if self._image_data is None:
+        return self.registered_image().data()
+
+    def registered_image(self) -> RegisteredImage:
+        """Return the registered image of the image marker, registering it if necessary
+
+        Returns:
+            RegisteredImage: registered image of the image marker
+        """
+        if self._image is None:
             self.load_image_data()
-        assert self._image_data
-        return self._image_data
+        assert self._image
+        return self._image
 
     def latlng(self) -> s2sphere.LatLng:
         """Return LatLng of the image marker
@@ -112,17 +127,10 @@ class ImageMarker(Object):
             renderer (PillowRenderer): pillow renderer
         """
         x, y = renderer.transformer().ll2pixel(self.latlng())
-        image = renderer.create_image(self.image_data())
-        overlay = PIL_Image.new("RGBA", renderer.image().size, (255, 255, 255, 0))
-        overlay.paste(
-            image,
-            (
-                int(x - self.origin_x() + renderer.offset_x()),
-                int(y - self.origin_y()),
-            ),
-            mask=image,
+        overlay = self._registry.sprite(
+            self.registered_image(), "pillow", _create_pillow_overlay, lambda image: 4 * image.width * image.height
         )
-        renderer.alpha_compose(overlay)
+        renderer.alpha_compose(overlay, (int(x - self.origin_x() + renderer.offset_x()), int(y - self.origin_y())))
 
     def render_svg(self, renderer: SvgRenderer) -> None:
         """Render marker using svgwrite
@@ -131,7 +139,7 @@ class ImageMarker(Object):
             renderer (SvgRenderer): svg renderer
         """
         x, y = renderer.transformer().ll2pixel(self.latlng())
-        image = renderer.create_inline_image(self.image_data())
+        image = self._registry.sprite(self.registered_image(), "svg", renderer.create_inline_image, len)
 
         renderer.group().add(
             renderer.drawing().image(
@@ -148,15 +156,24 @@ class ImageMarker(Object):
             renderer (CairoRenderer): cairo renderer
         """
         x, y = renderer.transformer().ll2pixel(self.latlng())
-        image = renderer.create_image(self.image_data())
+        image = self._registry.sprite(
+            self.registered_image(),
+            "cairo",
+            renderer.create_image,
+            lambda surface: surface.get_stride() * surface.get_height(),
+        )
 
         renderer.context().translate(x - self.origin_x(), y - self.origin_y())
         renderer.context().set_source_surface(image)
         renderer.context().paint()
 
     def load_image_data(self) -> None:
-        """Load image data for the image marker"""
-        with open(self._png_file, "rb") as f:
-            self._image_data = f.read()
-        image = PIL_Image.open(io.BytesIO(self._image_data))
-        self._width, self._height = image.size
+        """Load image data for the image marker from the image registry"""
+        self._image = self._registry.register(self._png_file)
+
+
+def _create_pillow_overlay(image_data: bytes) -> PIL_Image.Image:
+    image = PillowRenderer.create_image(image_data)
+    overlay = PIL_Image.new("RGBA", image.size, (255, 255, 255, 0))
+    overlay.paste(image, (0, 0), mask=image)
+    return overlay
@@ -0,0 +1,184 @@
+"""py-staticmaps - image_registry"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import hashlib
+import io
+import os
+import threading
+import typing
+
+from PIL import Image as PIL_Image  # type: ignore
+
+T = typing.TypeVar("T")
+
+
+class RegisteredImage:
+    """Encoded image data of a registered image, with its size
+
+    Markers keep their registered image, so the image data stays available even if the registry evicts it.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self._width, self._height = PIL_Image.open(io.BytesIO(data)).size
+
+    def data(self) -> bytes:
+        """Return the encoded image data
+
+        Returns:
+            bytes: encoded image data
+        """
+        return self._data
+
+    def digest(self) -> str:
+        """Return the content hash of the image data
+
+        Returns:
+            str: hex digest of the image data
+        """
+        return self._digest
+
+    def width(self) -> int:
+        """Return the width of the image
+
+        Returns:
+            int: width of the image
+        """
+        return self._width
+
+    def height(self) -> int:
+        """Return the height of the image
+
+        Returns:
+            int: height of the image
+        """
+        return self._height
+
+
+ImageSourceT = typing.Union[str, bytes, PIL_Image.Image, RegisteredImage]  # pylint: disable=invalid-name
+
+
+class ImageRegistry:
+    """A thread-safe registry of marker images and their decoded sprites with a memory limit and least-recently-used
+    eviction
+
+    Images are registered by file path (with the modification time and size of the file) or by their content hash
+    (for in-memory data and pillow images), so markers sharing an icon share one registered image. Each renderer
+    backend decodes a registered image only once into a sprite, which is shared by all markers using the image.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self._max_bytes = max_bytes
+        self._entries: typing.OrderedDict[typing.Tuple[str, ...], typing.Tuple[typing.Any, int]] = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Set the memory limit of the registry, evicting images and sprites if necessary
+
+        Parameters:
+            max_bytes (int): maximum (estimated) number of bytes held by the registry
+        """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict(0)
+
+    def register(self, source: ImageSourceT) -> RegisteredImage:
+        """Return the registered image for a file path, encoded image data or a pillow image, registering it if
+        necessary
+
+        Pillow images are encoded as PNG; register them once and pass the registered image to the markers.
+
+        Parameters:
+            source (ImageSourceT): path of an image file, encoded image data, pillow image or registered image
+
+        Returns:
+            RegisteredImage: registered image
+        """
+        if isinstance(source, RegisteredImage):
+            return source
+        if isinstance(source, str):
+            # a file replaced on disk gets a new key, so the registry never serves outdated images
+            stat = os.stat(source)
+            key: typing.Tuple[str, ...] = ("path", os.path.abspath(source), str(stat.st_mtime_ns), str(stat.st_size))
+            image = self._get(key)
+            if image is None:
+                with open(source, "rb") as f:
+                    image = RegisteredImage(f.read())
+                self._put(key, image, len(image.data()))
+            return typing.cast(RegisteredImage, image)
+        if isinstance(source, PIL_Image.Image):
+            output = io.BytesIO()
+            source.save(output, format="PNG")
+            source = output.getvalue()
+        key = ("data", hashlib.blake2b(source, digest_size=16).hexdigest())
+        image = self._get(key)
+        if image is None:
+            image = RegisteredImage(source)
+            self._put(key, image, len(source))
+        return typing.cast(RegisteredImage, image)
+
+    def sprite(
+        self, image: RegisteredImage, backend: str, create: typing.Callable[[bytes], T], size: typing.Callable[[T], int]
+    ) -> T:
+        """Return the decoded sprite of a registered image for a renderer backend, creating it if necessary
+
+        Parameters:
+            image (RegisteredImage): registered image
+            backend (str): name of the renderer backend, e.g. "pillow"
+            create (typing.Callable[[bytes], T]): creates the sprite from the image data
+            size (typing.Callable[[T], int]): estimates the memory size of the sprite in bytes
+
+        Returns:
+            T: renderer-ready sprite
+        """
+        key = ("sprite", image.digest(), backend)
+        sprite = self._get(key)
+        if sprite is None:
+            sprite = create(image.data())
+            self._put(key, sprite, size(sprite))
+        return typing.cast(T, sprite)
+
+    def clear(self) -> None:
+        """Remove all images and sprites from the registry"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Return the counters of the registry
+
+        Returns:
+            typing.Dict[str, int]: number of registered images and sprites, and their estimated size in bytes
+        """
+        with self._lock:
+            sprites = sum(1 for key in self._entries if key[0] == "sprite")
+            return {"images": len(self._entries) - sprites, "sprites": sprites, "bytes": self._bytes}
+
+    def _get(self, key: typing.Tuple[str, ...]) -> typing.Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key: typing.Tuple[str, ...], obj: typing.Any, obj_size: int) -> None:
+        with self._lock:
+            if key not in self._entries and obj_size <= self._max_bytes:
+                self._evict(obj_size)
+                self._entries[key] = (obj, obj_size)
+                self._bytes += obj_size
+
+    def _evict(self, extra_bytes: int) -> None:
+        while self._entries and self._bytes + extra_bytes > self._max_bytes:
+            _, (_, obj_size) = self._entries.popitem(last=False)
+            self._bytes -= obj_size
+
+
+default_image_registry = ImageRegistry()
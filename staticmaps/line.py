@@ -15,6 +15,7 @@ from .coordinates import create_latlng
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
 from .svg_renderer import SvgRenderer
+from .transformer import Transformer
 
 
 class Line(Bounds):
@@ -34,6 +35,7 @@ class Line(Bounds):
         self._color = color
         self._width = width
         self._interpolation_cache: typing.Optional[typing.List[s2sphere.LatLng]] = None
+        self._pixel_cache: typing.Optional[typing.Tuple[Transformer, typing.List[typing.Tuple[float, float]]]] = None
 
     def color(self) -> Color:
         """Return color of the line
@@ -110,6 +112,30 @@ class Line(Bounds):
             last = current
         return self._interpolation_cache
 
+    def prepare(self, trans: Transformer) -> None:
+        """Interpolate the line and project it to pixel coordinates
+
+        Parameters:
+            trans (Transformer): transformer
+        """
+        self.pixels(trans)
+
+    def pixels(self, trans: Transformer) -> typing.List[typing.Tuple[float, float]]:
+        """Return the pixel coordinates of the interpolated line, cached for the last transformer
+
+        Parameters:
+            trans (Transformer): transformer
+
+        Returns:
+            typing.List[typing.Tuple[float, float]]: pixel coordinates
+        """
+        cache = self._pixel_cache
+        if cache is not None and cache[0] is trans:
+            return cache[1]
+        xys = [trans.ll2pixel(latlng) for latlng in self.interpolate()]
+        self._pixel_cache = (trans, xys)
+        return xys
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render line using PILLOW
 
@@ -118,10 +144,7 @@ class Line(Bounds):
         """
         if self.width() == 0:
             return
-        xys = [
-            (x + renderer.offset_x(), y)
-            for (x, y) in [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
-        ]
+        xys = [(x + renderer.offset_x(), y) for (x, y) in self.pixels(renderer.transformer())]
         renderer.draw().line(xys, self.color().int_rgba(), self.width())
 
     def render_svg(self, renderer: SvgRenderer) -> None:
@@ -132,7 +155,7 @@ class Line(Bounds):
         """
         if self.width() == 0:
             return
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.pixels(renderer.transformer())
         polyline = renderer.drawing().polyline(
             xys,
             fill="none",
@@ -150,7 +173,7 @@ class Line(Bounds):
         """
         if self.width() == 0:
             return
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.pixels(renderer.transformer())
         renderer.context().set_source_rgba(*self.color().float_rgba())
         renderer.context().set_line_width(self.width())
         renderer.context().new_path()
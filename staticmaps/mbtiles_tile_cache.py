@@ -0,0 +1,292 @@
+"""py-staticmaps - mbtiles_tile_cache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import contextlib
+import os
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import slugify  # type: ignore
+
+from .exit_flush import flush_at_exit
+from .tile_cache import TileCache, TileMetadata
+from .tile_provider import TileProvider
+
+MBTILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT, UNIQUE (name));
+CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+CREATE TABLE IF NOT EXISTS tiles_metadata (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, fetched REAL, etag TEXT, last_modified TEXT,
+    status INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tiles_metadata_index ON tiles_metadata (zoom_level, tile_column, tile_row);
+"""
+
+TileIndexT = typing.Tuple[int, int, int]
+
+MAX_IDLE_CONNECTIONS = 8
+"""maximum number of idle connections kept per MBTiles file"""
+
+
+class MBTilesTileCache(TileCache):
+    """A tile cache storing the tiles of each tile provider in one MBTiles (SQLite) file
+
+    The files use the WAL journal mode, so any number of threads and processes may read while one of them writes.
+    Connections are pooled, so short-lived fetch threads reuse them. New tiles are buffered and inserted in batches;
+    call flush() to write them immediately.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, directory: str, batch_size: int = 64) -> None:
+        self._directory = directory
+        self._batch_size = max(1, batch_size)
+        self._pending: typing.Dict[str, typing.Dict[TileIndexT, bytes]] = {}
+        self._pending_metadata: typing.Dict[str, typing.Dict[TileIndexT, TileMetadata]] = {}
+        self._lock = threading.Lock()
+        self._writing: typing.Set[str] = set()
+        self._idle_connections: typing.Dict[str, typing.List[sqlite3.Connection]] = {}
+        self._created_files: typing.Set[str] = set()
+        flush_at_exit(self)
+
+    def directory(self) -> str:
+        """Return the directory of the MBTiles files
+
+        Returns:
+            str: directory of the MBTiles files
+        """
+        return self._directory
+
+    def file_name(self, provider: TileProvider) -> str:
+        """Return the MBTiles file name of a tile provider
+
+        Parameters:
+            provider (TileProvider): tile provider
+
+        Returns:
+            str: MBTiles file name
+        """
+        return os.path.join(self._directory, f"{slugify.slugify(provider.name()) or '_'}.mbtiles")
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the cache
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if the tile is not cached
+        """
+        file_name = self.file_name(provider)
+        with self._lock:
+            data = self._pending.get(file_name, {}).get((zoom, x, y))
+        if data is not None:
+            return data
+        if not os.path.isfile(file_name):
+            return None
+        with self._connected(file_name) as connection:
+            row = connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (zoom, x, self._tile_row(zoom, y)),
+            ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Put a tile into the cache; the tile is written with the next batch
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+        file_name = self.file_name(provider)
+        with self._lock:
+            pending = self._pending.setdefault(file_name, {})
+            pending[(zoom, x, y)] = data
+            if len(pending) < self._batch_size or file_name in self._writing:
+                # while a batch is being written, the next put after its commit writes the tiles added meanwhile
+                return
+            self._writing.add(file_name)
+        try:
+            self._write_pending(file_name)
+        finally:
+            with self._lock:
+                self._writing.discard(file_name)
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Check whether a tile is cached, without reading its data
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile cached
+        """
+        file_name = self.file_name(provider)
+        with self._lock:
+            if (zoom, x, y) in self._pending.get(file_name, {}):
+                return True
+        if not os.path.isfile(file_name):
+            return False
+        with self._connected(file_name) as connection:
+            row = connection.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (zoom, x, self._tile_row(zoom, y)),
+            ).fetchone()
+        return row is not None
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a cached tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if unknown
+        """
+        file_name = self.file_name(provider)
+        with self._lock:
+            metadata = self._pending_metadata.get(file_name, {}).get((zoom, x, y))
+        if metadata is not None:
+            return metadata
+        if not os.path.isfile(file_name):
+            return None
+        with self._connected(file_name) as connection:
+            row = connection.execute(
+                "SELECT fetched, etag, last_modified, status FROM tiles_metadata "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (zoom, x, self._tile_row(zoom, y)),
+            ).fetchone()
+        return None if row is None else TileMetadata(*row)
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Set the metadata of a cached tile; the metadata is written with the next batch
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            metadata (TileMetadata): metadata of the tile
+        """
+        file_name = self.file_name(provider)
+        with self._lock:
+            self._pending_metadata.setdefault(file_name, {})[(zoom, x, y)] = metadata
+            if file_name in self._pending:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered tiles"""
+        with self._lock:
+            file_names = set(self._pending) | set(self._pending_metadata)
+        for file_name in file_names:
+            self._write_pending(file_name)
+
+    def _write_pending(self, file_name: str) -> None:
+        """Write the buffered tiles of a file; they stay readable from the buffer until they are committed"""
+        with self._lock:
+            tiles = dict(self._pending.get(file_name, {}))
+            metadata = dict(self._pending_metadata.get(file_name, {}))
+        self._write(file_name, tiles, metadata)
+        with self._lock:
+            self._forget(self._pending, file_name, tiles)
+            self._forget(self._pending_metadata, file_name, metadata)
+
+    @staticmethod
+    def _forget(
+        pending_files: typing.Dict[str, typing.Dict[TileIndexT, typing.Any]],
+        file_name: str,
+        written: typing.Dict[TileIndexT, typing.Any],
+    ) -> None:
+        """Remove written entries from the buffer, unless they were replaced while being written"""
+        pending = pending_files.get(file_name)
+        if pending is None:
+            return
+        for key, value in written.items():
+            if pending.get(key) is value:
+                del pending[key]
+        if not pending:
+            del pending_files[file_name]
+
+    def _write(
+        self,
+        file_name: str,
+        tiles: typing.Dict[TileIndexT, bytes],
+        metadata: typing.Optional[typing.Dict[TileIndexT, TileMetadata]] = None,
+    ) -> None:
+        with self._connected(file_name) as connection:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                    [(zoom, x, self._tile_row(zoom, y), data) for (zoom, x, y), data in tiles.items()],
+                )
+                metadata = metadata or {}
+                connection.executemany(
+                    "DELETE FROM tiles_metadata WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    [(zoom, x, self._tile_row(zoom, y)) for (zoom, x, y) in tiles if (zoom, x, y) not in metadata],
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO tiles_metadata "
+                    "(zoom_level, tile_column, tile_row, fetched, etag, last_modified, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(zoom, x, self._tile_row(zoom, y), *m) for (zoom, x, y), m in metadata.items()],
+                )
+
+    @contextlib.contextmanager
+    def _connected(self, file_name: str) -> typing.Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection to the given file, creating the file if necessary"""
+        with self._lock:
+            idle = self._idle_connections.get(file_name)
+            connection = idle.pop() if idle else None
+        if connection is None:
+            self._create_file(file_name)
+            connection = sqlite3.connect(file_name, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield connection
+        finally:
+            with self._lock:
+                idle = self._idle_connections.setdefault(file_name, [])
+                if len(idle) < MAX_IDLE_CONNECTIONS:
+                    idle.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+
+    def _create_file(self, file_name: str) -> None:
+        """Create the file and its schema once per cache"""
+        if file_name in self._created_files:
+            return
+        with self._lock:
+            if file_name in self._created_files:
+                return
+            pathlib.Path(os.path.dirname(file_name)).mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(file_name, timeout=30)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(MBTILES_SCHEMA)
+                connection.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', 'png')")
+                connection.commit()
+            finally:
+                connection.close()
+            self._created_files.add(file_name)
+
+    @staticmethod
+    def _tile_row(zoom: int, y: int) -> int:
+        # MBTiles uses the TMS tile scheme, i.e. rows count from the south
+        return (1 << zoom) - 1 - y
@@ -0,0 +1,199 @@
+"""py-staticmaps - memory_tile_cache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import threading
+import typing
+
+from .tile_cache import TileCache, TileMetadata
+from .tile_provider import TileProvider
+
+TileKeyT = typing.Tuple[str, int, int, int]
+
+
+# pylint: disable=too-many-instance-attributes
+class MemoryTileCache(TileCache):
+    """A thread-safe in-memory tile cache with a byte budget and least-recently-used eviction
+
+    Tiles of pinned zoom levels count towards the byte budget, but are never evicted.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self._max_bytes = max_bytes
+        self._pinned_zooms: typing.Set[int] = set()
+        self._entries: typing.OrderedDict[TileKeyT, bytes] = collections.OrderedDict()
+        self._pinned: typing.Dict[TileKeyT, bytes] = {}
+        self._metadata: typing.Dict[TileKeyT, TileMetadata] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def max_bytes(self) -> int:
+        """Return the byte budget of the cache
+
+        Returns:
+            int: maximum number of bytes held by the cache
+        """
+        return self._max_bytes
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Set the byte budget of the cache, evicting tiles if necessary
+
+        Parameters:
+            max_bytes (int): maximum number of bytes held by the cache
+        """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict(0)
+
+    def set_pinned_zooms(self, zooms: typing.Iterable[int]) -> None:
+        """Set the zoom levels whose tiles are never evicted
+
+        Parameters:
+            zooms (typing.Iterable[int]): pinned zoom levels
+        """
+        with self._lock:
+            self._pinned_zooms = set(zooms)
+            for key in [key for key in self._entries if key[1] in self._pinned_zooms]:
+                self._pinned[key] = self._entries.pop(key)
+            for key in [key for key in self._pinned if key[1] not in self._pinned_zooms]:
+                self._entries[key] = self._pinned.pop(key)
+            self._evict(0)
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the cache
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if the tile is not cached
+        """
+        key = (provider.name(), zoom, x, y)
+        with self._lock:
+            data = self._pinned.get(key)
+            if data is None:
+                data = self._entries.get(key)
+                if data is not None:
+                    self._entries.move_to_end(key)
+            if data is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return data
+
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Put a tile into the cache, evicting the least recently used tiles if necessary
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+        key = (provider.name(), zoom, x, y)
+        with self._lock:
+            self._remove(key)
+            if len(data) > self._max_bytes or not self._evict(len(data)):
+                return
+            if zoom in self._pinned_zooms:
+                self._pinned[key] = data
+            else:
+                self._entries[key] = data
+            self._bytes += len(data)
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Check whether a tile is cached, without counting a hit or miss
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile cached
+        """
+        key = (provider.name(), zoom, x, y)
+        with self._lock:
+            return key in self._pinned or key in self._entries
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a cached tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if unknown
+        """
+        with self._lock:
+            return self._metadata.get((provider.name(), zoom, x, y))
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Set the metadata of a cached tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            metadata (TileMetadata): metadata of the tile
+        """
+        key = (provider.name(), zoom, x, y)
+        with self._lock:
+            if key in self._pinned or key in self._entries:
+                self._metadata[key] = metadata
+
+    def clear(self) -> None:
+        """Remove all tiles from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._metadata.clear()
+            self._bytes = 0
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Return the counters of the cache
+
+        Returns:
+            typing.Dict[str, int]: hits, misses, evictions, number of cached tiles and cached bytes
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "tiles": len(self._entries) + len(self._pinned),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key: TileKeyT) -> None:
+        self._metadata.pop(key, None)
+        data = self._entries.pop(key, None)
+        if data is None:
+            data = self._pinned.pop(key, None)
+        if data is not None:
+            self._bytes -= len(data)
+
+    def _evict(self, extra_bytes: int) -> bool:
+        """Evict tiles until extra_bytes fit into the budget; return False if they do not fit at all"""
+        while self._bytes + extra_bytes > self._max_bytes and self._entries:
+            key, data = self._entries.popitem(last=False)
+            self._metadata.pop(key, None)
+            self._bytes -= len(data)
+            self._evictions += 1
+        return self._bytes + extra_bytes <= self._max_bytes
+
+
+default_memory_tile_cache = MemoryTileCache()
@@ -41,6 +41,16 @@ class Object(ABC):
         """
         return s2sphere.LatLngRect()
 
+    def prepare(self, trans: Transformer) -> None:
+        """Prepare the geometry of the object for rendering with the supplied Transformer
+
+        Called before the object is rendered, possibly in another thread while the map tiles are fetched; the
+        default does nothing.
+
+        Parameters:
+            trans (Transformer): transformer
+        """
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render object using PILLOW
 
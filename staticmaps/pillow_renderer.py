@@ -9,9 +9,11 @@ import typing
 
 # import s2sphere  # type: ignore
 from PIL import Image as PIL_Image  # type: ignore
+from PIL import ImageChops as PIL_ImageChops  # type: ignore
 from PIL import ImageDraw as PIL_ImageDraw  # type: ignore
 
 from .color import Color
+from .decoded_tile_cache import DecodedTileCache
 from .renderer import Renderer
 from .transformer import Transformer
 
@@ -19,15 +21,24 @@ if typing.TYPE_CHECKING:
     # avoid circlic import
     from .object import Object  # pylint: disable=cyclic-import
 
+# maps every alpha value but 0 to 255
+_PAINTED = [0] + [255] * 255
+
 
 class PillowRenderer(Renderer):
     """An image renderer using pillow that extends a generic renderer class"""
 
+    _decoded_tiles = DecodedTileCache()
+
     def __init__(self, transformer: Transformer) -> None:
         Renderer.__init__(self, transformer)
         self._image = PIL_Image.new("RGBA", (self._trans.image_width(), self._trans.image_height()))
         self._draw = PIL_ImageDraw.Draw(self._image)
         self._offset_x = 0
+        self._layer: typing.Optional[PIL_Image.Image] = None
+        self._scratch: typing.Optional[PIL_Image.Image] = None
+        self._scratch_draw: typing.Optional[PIL_ImageDraw.ImageDraw] = None
+        self._layer_bounds: typing.Optional[typing.Tuple[int, int, int, int]] = None
 
     def draw(self) -> PIL_ImageDraw.ImageDraw:
         """
@@ -36,6 +47,7 @@ class PillowRenderer(Renderer):
         Returns:
             PIL_ImageDraw.ImageDraw: An PIL_Image draw object
         """
+        self._flush_layer()
         return self._draw
 
     def image(self) -> PIL_Image.Image:
@@ -45,6 +57,7 @@ class PillowRenderer(Renderer):
         Returns:
             PIL_Image.Image: A PIL_Image image object
         """
+        self._flush_layer()
         return self._image
 
     def offset_x(self) -> int:
@@ -56,16 +69,91 @@ class PillowRenderer(Renderer):
         """
         return self._offset_x
 
-    def alpha_compose(self, image: PIL_Image.Image) -> None:
+    def alpha_compose(self, image: PIL_Image.Image, position: typing.Tuple[int, int] = (0, 0)) -> None:
         """
-        alpha_compose Call PIL_Image.alpha_composite()
+        alpha_compose Blend an overlay onto the image in place, limited to the region covered by the overlay
 
         Parameters:
-            image (PIL_Image.Image): A PIL_Image image object
+            image (PIL_Image.Image): A PIL_Image image object, usually just covering the pixel bounds of an object
+            position (typing.Tuple[int, int]): position of the top left corner of the overlay in the image; the
+                overlay is clipped to the image
         """
-        assert image.size == self._image.size
-        self._image = PIL_Image.alpha_composite(self._image, image)
-        self._draw = PIL_ImageDraw.Draw(self._image)
+        self._flush_layer()
+        left, top = position
+        right = min(left + image.width, self._image.width)
+        bottom = min(top + image.height, self._image.height)
+        src_left, src_top = max(0, -left), max(0, -top)
+        left, top = max(0, left), max(0, top)
+        if right <= left or bottom <= top:
+            return
+        if (src_left, src_top, right - left, bottom - top) != (0, 0, image.width, image.height):
+            image = image.crop((src_left, src_top, src_left + right - left, src_top + bottom - top))
+        self._image.alpha_composite(image, (left, top))
+
+    def draw_translucent(
+        self,
+        bounds: typing.Tuple[float, float, float, float],
+        paint: typing.Callable[[PIL_ImageDraw.ImageDraw], None],
+    ) -> None:
+        """
+        draw_translucent Paint onto the translucent layer shared by consecutive objects
+
+        The layer is blended onto the image only once, before anything else is drawn onto the image. Painting onto a
+        part of the layer that is still transparent is the same as blending it onto the image directly; pixels of the
+        layer that the painting overlaps (e.g. the shared edge of adjacent polygons) are blended onto the image
+        first, so the output is identical to blending each painting separately.
+
+        Parameters:
+            bounds (typing.Tuple[float, float, float, float]): pixel bounds (left, top, right, bottom) of the painting
+            paint (typing.Callable[[PIL_ImageDraw.ImageDraw], None]): paints onto the given draw object, using
+                image coordinates
+        """
+        left = max(0, math.floor(bounds[0]))
+        top = max(0, math.floor(bounds[1]))
+        right = min(self._image.width, math.ceil(bounds[2]) + 1)
+        bottom = min(self._image.height, math.ceil(bounds[3]) + 1)
+        if left >= right or top >= bottom:
+            return
+        box = (left, top, right, bottom)
+        if self._layer is None or self._scratch is None or self._scratch_draw is None:
+            self._layer = PIL_Image.new("RGBA", self._image.size, (255, 255, 255, 0))
+            self._scratch = PIL_Image.new("RGBA", self._image.size, (255, 255, 255, 0))
+            self._scratch_draw = PIL_ImageDraw.Draw(self._scratch)
+        # paint onto a scratch image first, to find the pixels the painting actually covers
+        paint(self._scratch_draw)
+        painting = self._scratch.crop(box)
+        self._scratch.paste((255, 255, 255, 0), box)
+        painted = painting.getchannel("A").point(_PAINTED)
+        if self._layer_bounds is not None:
+            overlap = PIL_ImageChops.darker(painted, self._layer.crop(box).getchannel("A")).point(_PAINTED)
+            if overlap.getbbox() is not None:
+                # blending onto painted pixels of the layer would round differently than blending onto the image
+                self._flush_pixels(box, overlap)
+        self._layer.paste(painting, box, painted)
+        if self._layer_bounds is None:
+            self._layer_bounds = box
+        else:
+            self._layer_bounds = (
+                min(left, self._layer_bounds[0]),
+                min(top, self._layer_bounds[1]),
+                max(right, self._layer_bounds[2]),
+                max(bottom, self._layer_bounds[3]),
+            )
+
+    def _flush_pixels(self, box: typing.Tuple[int, int, int, int], mask: PIL_Image.Image) -> None:
+        """Blend the pixels of the layer selected by a mask onto the image, leaving the rest of the layer as is"""
+        assert self._layer is not None
+        blended = PIL_Image.alpha_composite(self._image.crop(box), self._layer.crop(box))
+        self._image.paste(blended, box, mask)
+        self._layer.paste((255, 255, 255, 0), box, mask)
+
+    def _flush_layer(self) -> None:
+        if self._layer is None or self._layer_bounds is None:
+            return
+        left, top, _, _ = self._layer_bounds
+        self._image.alpha_composite(self._layer, (left, top), self._layer_bounds)
+        self._layer.paste((255, 255, 255, 0), self._layer_bounds)
+        self._layer_bounds = None
 
     def render_objects(
         self,
@@ -83,6 +171,7 @@ class PillowRenderer(Renderer):
             for p in range(-x_count, x_count + 1):
                 self._offset_x = p * self._trans.world_width()
                 obj.render_pillow(self)
+        self._flush_layer()
 
     def render_background(self, color: typing.Optional[Color]) -> None:
         """Render background of static map
@@ -107,25 +196,14 @@ class PillowRenderer(Renderer):
             objects (typing.List["Object"]): objects of static map
             tighten (bool): tighten to boundaries
         """
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    self._image.paste(
-                        tile_img,
-                        (
-                            int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
-                            int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
-                        ),
-                    )
-                except RuntimeError:
-                    pass
+        for xx, yy, tile_img in self.tile_images(download):
+            self._image.paste(
+                tile_img,
+                (
+                    int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
+                    int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
+                ),
+            )
 
     def render_attribution(self, attribution: typing.Optional[str]) -> None:
         """Render attribution from given tiles provider
@@ -140,10 +218,9 @@ class PillowRenderer(Renderer):
         h = self._trans.image_height()
         _, top, _, bottom = self.draw().textbbox((margin, h - margin), attribution)
         th = bottom - top
-        overlay = PIL_Image.new("RGBA", self._image.size, (255, 255, 255, 0))
-        draw = PIL_ImageDraw.Draw(overlay)
-        draw.rectangle([(0, h - th - 2 * margin), (w, h)], fill=(255, 255, 255, 204))
-        self.alpha_compose(overlay)
+        band_top = int(h - th - 2 * margin)
+        overlay = PIL_Image.new("RGBA", (w, h - band_top), (255, 255, 255, 204))
+        self.alpha_compose(overlay, (0, band_top))
         self.draw().text((margin, h - th - margin), attribution, fill=(0, 0, 0, 255))
 
     def fetch_tile(
@@ -162,7 +239,18 @@ class PillowRenderer(Renderer):
         image_data = download(self._trans.zoom(), x, y)
         if image_data is None:
             return None
-        return PIL_Image.open(io.BytesIO(image_data))
+        return PillowRenderer._decoded_tiles.get_or_create(
+            image_data, PillowRenderer.create_image, lambda image: 4 * image.width * image.height
+        )
+
+    @staticmethod
+    def decoded_tile_cache() -> DecodedTileCache:
+        """Return the cache of decoded tiles shared by all pillow renderers
+
+        Returns:
+            DecodedTileCache: cache of decoded RGBA tile images
+        """
+        return PillowRenderer._decoded_tiles
 
     @staticmethod
     def create_image(image_data: bytes) -> PIL_Image.Image:
@@ -0,0 +1,206 @@
+"""py-staticmaps - prefetched_tiles"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import asyncio
+import contextvars
+import typing
+import weakref
+from concurrent.futures import Future, wait
+
+import requests  # type: ignore
+
+from .async_tile_downloader import AsyncTileDownloader
+from .cancellation import CancellationToken, DegradedTile
+from .tile_downloader import TileDownloader
+from .tile_fallback import SynthesizedTile
+from .tile_provider import TileProvider
+from .transformer import Transformer
+
+# the degraded tiles of the last render, per thread and asyncio task, with a weak reference to the rendering context
+_last_degraded_tiles: "contextvars.ContextVar[typing.Tuple[typing.Any, typing.List[DegradedTile]]]" = (
+    contextvars.ContextVar("last_degraded_tiles")
+)
+
+
+class TileSource(typing.NamedTuple):
+    """Where the tiles of a render come from"""
+
+    downloader: TileDownloader
+    """tile downloader"""
+    provider: TileProvider
+    """tile provider"""
+    cache_dir: str
+    """cache directory for tiles"""
+    fallback_tile: typing.Optional[bytes]
+    """encoded tile filling tiles that are neither fetched in time nor cached"""
+
+
+def last_degraded_tiles(owner: typing.Any) -> typing.List[DegradedTile]:
+    """Return the degraded tiles of the last render of an owner in the current thread or asyncio task
+
+    Parameters:
+        owner (typing.Any): object rendering the map, e.g. a Context
+
+    Returns:
+        typing.List[DegradedTile]: tiles that were cancelled, failed or synthesized from other zooms
+    """
+    rendering_owner, degraded = _last_degraded_tiles.get((None, []))
+    if rendering_owner is None or rendering_owner() is not owner:
+        return []
+    return list(degraded)
+
+
+def prefetch_tiles(
+    owner: typing.Any,
+    source: TileSource,
+    trans: Transformer,
+    pipelined: bool,
+    cancellation: typing.Optional[CancellationToken] = None,
+) -> "PrefetchedTiles":
+    """Fetch all tiles of a map concurrently and return a download callable serving the fetched tiles
+
+    Parameters:
+        owner (typing.Any): object rendering the map, e.g. a Context
+        source (TileSource): where the tiles come from
+        trans (Transformer): transformer of the map to be rendered
+        pipelined (bool): return at once instead of waiting for the tiles, so the renderer waits for each tile when
+            it needs it
+        cancellation (typing.Optional[CancellationToken]): token ending the wait for the tiles
+
+    Returns:
+        PrefetchedTiles: download callable for the renderers
+    """
+    tiles: typing.Mapping[typing.Tuple[int, int], Future]
+    if pipelined:
+        tiles = source.downloader.submit_many(source.provider, source.cache_dir, trans.zoom(), _tile_xys(trans))
+    else:
+        tiles = source.downloader.get_many(
+            source.provider, source.cache_dir, trans.zoom(), _tile_xys(trans), cancellation=cancellation
+        )
+    return PrefetchedTiles(owner, source, trans.zoom(), tiles, cancellation)
+
+
+async def prefetch_tiles_async(
+    owner: typing.Any, source: TileSource, trans: Transformer, cancellation: typing.Optional[CancellationToken] = None
+) -> "PrefetchedTiles":
+    """Fetch all tiles of a map concurrently without blocking the event loop
+
+    Parameters:
+        owner (typing.Any): object rendering the map, e.g. a Context
+        source (TileSource): where the tiles come from; an AsyncTileDownloader fetches them on the event loop
+        trans (Transformer): transformer of the map to be rendered
+        cancellation (typing.Optional[CancellationToken]): token ending the wait for the tiles
+
+    Returns:
+        PrefetchedTiles: download callable for the renderers
+    """
+    tiles: typing.Mapping[typing.Tuple[int, int], typing.Any]
+    if isinstance(source.downloader, AsyncTileDownloader):
+        tiles = await source.downloader.get_many_async(
+            source.provider, source.cache_dir, trans.zoom(), _tile_xys(trans), cancellation
+        )
+    else:
+        tiles = await asyncio.get_running_loop().run_in_executor(
+            None,
+            source.downloader.get_many,
+            source.provider,
+            source.cache_dir,
+            trans.zoom(),
+            _tile_xys(trans),
+            None,
+            cancellation,
+        )
+    return PrefetchedTiles(owner, source, trans.zoom(), tiles, cancellation)
+
+
+def _tile_xys(trans: Transformer) -> typing.List[typing.Tuple[int, int]]:
+    return [(x, y) for _, _, x, y in trans.tiles()]
+
+
+class PrefetchedTiles:
+    """Download callable of a render serving the prefetched tiles of the map
+
+    Tiles missing when the cancellation token is cancelled, and tiles whose fetch failed, are filled from the cache
+    or with the fallback tile (or left to the background); they are recorded as degraded tiles of the render.
+    """
+
+    def __init__(
+        self,
+        owner: typing.Any,
+        source: TileSource,
+        zoom: int,
+        tiles: typing.Mapping[typing.Tuple[int, int], typing.Any],
+        cancellation: typing.Optional[CancellationToken],
+    ) -> None:
+        self._source = source
+        self._zoom = zoom
+        self._tiles = tiles
+        self._cancellation = cancellation
+        self._degraded: typing.List[DegradedTile] = []
+        _last_degraded_tiles.set((weakref.ref(owner), self._degraded))
+
+    def __call__(self, z: int, x: int, y: int) -> typing.Optional[bytes]:
+        future = self._tiles.get((x, y)) if z == self._zoom else None
+        if future is None and self._cancellation is not None and self._cancellation.cancelled():
+            return self._degrade(z, x, y, "cancelled")
+        if future is not None and (not self._wait_for_tile(future, self._cancellation) or future.cancelled()):
+            future.cancel()
+            return self._degrade(z, x, y, "cancelled")
+        try:
+            if future is None:
+                data = self._source.downloader.get(self._source.provider, self._source.cache_dir, z, x, y)
+            else:
+                data = future.result()
+        except (RuntimeError, requests.RequestException):
+            # without a fill, the background shows through the failed tile
+            return self._degrade(z, x, y, "failed")
+        if isinstance(data, SynthesizedTile):
+            self._degraded.append(DegradedTile(z, x, y, "synthesized", True))
+        return data
+
+    def refetch(self, z: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Download a tile again whose data does not decode, e.g. a corrupt cached tile, replacing the cached data
+
+        Parameters:
+            z (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: downloaded tile, or None if it cannot be downloaded
+        """
+        try:
+            return self._source.downloader.refetch(self._source.provider, self._source.cache_dir, z, x, y)
+        except (RuntimeError, requests.RequestException):
+            self._degraded.append(DegradedTile(z, x, y, "failed", False))
+            return None
+
+    def degraded_tiles(self) -> typing.List[DegradedTile]:
+        """Return the tiles served so far that were not rendered from their own data
+
+        Returns:
+            typing.List[DegradedTile]: tiles that were cancelled, failed or synthesized from other zooms
+        """
+        return list(self._degraded)
+
+    @staticmethod
+    def _wait_for_tile(future: typing.Any, cancellation: typing.Optional[CancellationToken]) -> bool:
+        """Wait for a fetch that is still running (pipelined render), unless the cancellation token is cancelled"""
+        if future.done() or not isinstance(future, Future):
+            return future.done()
+        if cancellation is None:
+            wait([future])
+            return True
+        while not future.done() and not cancellation.cancelled():
+            # wake up regularly to notice explicit cancellations
+            wait([future], timeout=min(0.05, cancellation.remaining() or 0.05))
+        return future.done()
+
+    def _degrade(self, z: int, x: int, y: int, reason: str) -> typing.Optional[bytes]:
+        """Record a degraded tile and return the data filling it: the cached (or synthesized) tile or the fallback"""
+        fill = self._source.downloader.get_cached(self._source.provider, self._source.cache_dir, z, x, y)
+        if fill is None:
+            fill = self._source.fallback_tile
+        self._degraded.append(DegradedTile(z, x, y, reason, fill is not None))
+        return fill
@@ -0,0 +1,95 @@
+"""py-staticmaps - rate_limiter"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import contextlib
+import threading
+import time
+import typing
+
+
+class RateLimiter:
+    """A thread-safe request budget: a token bucket limiting the request rate plus a limit of concurrent requests
+
+    The limiter can also be paused, e.g. when a server asks to retry after some time; all requests wait until the
+    pause is over.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self, max_rate: typing.Optional[float] = None, burst: typing.Optional[int] = None, max_concurrency: int = 4
+    ) -> None:
+        self._max_rate = max_rate
+        self._burst = float(max(1, burst if burst is not None else 1))
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._max_concurrency = max(1, max_concurrency)
+        self._semaphore = threading.BoundedSemaphore(self._max_concurrency)
+        self._lock = threading.Lock()
+
+    def max_rate(self) -> typing.Optional[float]:
+        """Return the maximum request rate
+
+        Returns:
+            typing.Optional[float]: maximum number of requests per second, None for no limit
+        """
+        return self._max_rate
+
+    def max_concurrency(self) -> int:
+        """Return the maximum number of concurrent requests
+
+        Returns:
+            int: maximum number of concurrent requests
+        """
+        return self._max_concurrency
+
+    def set_max_rate(self, max_rate: typing.Optional[float], burst: typing.Optional[int] = None) -> None:
+        """Set the maximum request rate
+
+        Parameters:
+            max_rate (typing.Optional[float]): maximum number of requests per second, None for no limit
+            burst (typing.Optional[int]): number of requests that may be sent at once after an idle period
+        """
+        with self._lock:
+            self._max_rate = max_rate
+            if burst is not None:
+                self._burst = float(max(1, burst))
+            self._tokens = min(self._tokens, self._burst)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests for the given time
+
+        Parameters:
+            seconds (float): pause in seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @contextlib.contextmanager
+    def slot(self) -> typing.Iterator[None]:
+        """Wait for a free request slot and a token, and hold the slot while sending the request
+
+        Returns:
+            typing.Iterator[None]: context manager holding the request slot
+        """
+        with self._semaphore:
+            self._take_token()
+            yield
+
+    def _take_token(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._max_rate:
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._max_rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if not self._max_rate:
+                        return
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._max_rate
+            time.sleep(wait)
@@ -0,0 +1,107 @@
+"""py-staticmaps - render_pipeline"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import typing
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from .object import Object
+from .renderer import Renderer
+from .transformer import Transformer
+
+
+class RenderPipeline:
+    """Renders the tiles of maps, optionally pipelined with the preparation of the objects and decoded by a pool of
+    threads
+    """
+
+    def __init__(self) -> None:
+        self._pipelined = False
+        self._decode_workers = 0
+        self._decode_pool: typing.Optional[ThreadPoolExecutor] = None
+
+    def set_pipelined(self, pipelined: bool) -> None:
+        """Set pipelined rendering
+
+        Parameters:
+            pipelined (bool): pipeline the render or not
+        """
+        self._pipelined = pipelined
+
+    def pipelined(self) -> bool:
+        """Check whether renders are pipelined
+
+        Returns:
+            bool: are renders pipelined
+        """
+        return self._pipelined
+
+    def set_decode_workers(self, workers: typing.Optional[int]) -> None:
+        """Set the number of threads decoding the tiles of a render in parallel
+
+        Parameters:
+            workers (typing.Optional[int]): number of decode threads, None uses one thread per CPU, 0 decodes the
+                tiles on the render thread
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == self._decode_workers:
+            return
+        self._decode_workers = max(0, workers)
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown(wait=False)
+            self._decode_pool = None
+
+    def render_tiles(
+        self,
+        renderer: Renderer,
+        download: typing.Callable[[int, int, int], typing.Optional[bytes]],
+        objects: typing.List[Object],
+        tighten_to_bounds: bool,
+    ) -> None:
+        """Render the tiles of a map, preparing the objects at the same time if the render is pipelined
+
+        Parameters:
+            renderer (Renderer): renderer of the map
+            download (typing.Callable[[int, int, int], typing.Optional[bytes]]): download callable for the renderer
+            objects (typing.List[Object]): objects of the map
+            tighten_to_bounds (bool): tighten the map to the bounds of the objects
+        """
+        decode_pool = self._get_decode_pool()
+        if not self._pipelined:
+            self._render_tiles(renderer, download, objects, tighten_to_bounds, decode_pool)
+            return
+        # without a decode pool, the tiles are fetched and decoded by the pipeline threads
+        with ThreadPoolExecutor(
+            max_workers=1 if decode_pool is not None else None, thread_name_prefix="render-pipeline"
+        ) as executor:
+            prepared = executor.submit(self._prepare_objects, objects, renderer.transformer())
+            self._render_tiles(renderer, download, objects, tighten_to_bounds, decode_pool or executor)
+            prepared.result()
+
+    @staticmethod
+    def _render_tiles(
+        renderer: Renderer,
+        download: typing.Callable[[int, int, int], typing.Optional[bytes]],
+        objects: typing.List[Object],
+        tighten_to_bounds: bool,
+        decode_executor: typing.Optional[Executor],
+    ) -> None:
+        renderer.set_decode_executor(decode_executor)
+        try:
+            renderer.render_tiles(download, objects, tighten_to_bounds)
+        finally:
+            renderer.set_decode_executor(None)
+
+    def _get_decode_pool(self) -> typing.Optional[ThreadPoolExecutor]:
+        if self._decode_workers == 0:
+            return None
+        if self._decode_pool is None:
+            self._decode_pool = ThreadPoolExecutor(max_workers=self._decode_workers, thread_name_prefix="tile-decode")
+        return self._decode_pool
+
+    @staticmethod
+    def _prepare_objects(objects: typing.List[Object], trans: Transformer) -> None:
+        for obj in objects:
+            obj.prepare(trans)
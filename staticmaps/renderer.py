@@ -4,6 +4,7 @@
 
 import typing
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
 
 import s2sphere  # type: ignore
 
@@ -18,12 +19,16 @@ if typing.TYPE_CHECKING:
     from .marker import Marker  # pylint: disable=cyclic-import
     from .object import Object  # pylint: disable=cyclic-import
 
+# errors of decoding tile data, e.g. PIL.UnidentifiedImageError (an OSError) or a broken PNG chunk (a SyntaxError)
+TILE_DECODE_ERRORS = (OSError, SyntaxError, ValueError)
+
 
 class Renderer(ABC):
     """A generic renderer class"""
 
     def __init__(self, transformer: Transformer) -> None:
         self._trans = transformer
+        self._decode_executor: typing.Optional[Executor] = None
 
     def transformer(self) -> Transformer:
         """Return transformer object
@@ -33,6 +38,72 @@ class Renderer(ABC):
         """
         return self._trans
 
+    def set_decode_executor(self, executor: typing.Optional[Executor]) -> None:
+        """Set an executor fetching and decoding the tiles concurrently; the tiles are still painted in order
+
+        Parameters:
+            executor (typing.Optional[Executor]): executor, None fetches and decodes the tiles one after another
+        """
+        self._decode_executor = executor
+
+    @abstractmethod
+    def fetch_tile(
+        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]], x: int, y: int
+    ) -> typing.Any:
+        """Fetch a tile and decode it into the image type of the renderer
+
+        Parameters:
+            download (typing.Callable[[int, int, int], typing.Optional[bytes]]): callable
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Any: decoded tile, or None if there is no tile
+        """
+
+    def tile_images(
+        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+    ) -> typing.Iterator[typing.Tuple[int, int, typing.Any]]:
+        """Fetch and decode the tiles of the map, using the decode executor if set
+
+        Tiles whose fetch fails with a RuntimeError are skipped. A tile whose data does not decode, e.g. a corrupt
+        cached tile, is downloaded once more if the download callable has a refetch method (like the download
+        callables of Context renders), and skipped otherwise.
+
+        Parameters:
+            download (typing.Callable[[int, int, int], typing.Optional[bytes]]): callable
+
+        Returns:
+            typing.Iterator[typing.Tuple[int, int, typing.Any]]: column, row and decoded image of the tiles, in the
+            order of Transformer.tiles()
+        """
+        tiles = self._trans.tiles()
+        images: typing.Iterable[typing.Any]
+        if self._decode_executor is None:
+            images = (self._fetch_tile_or_none(download, x, y) for _, _, x, y in tiles)
+        else:
+            futures = [self._decode_executor.submit(self._fetch_tile_or_none, download, x, y) for _, _, x, y in tiles]
+            images = (future.result() for future in futures)
+        for (xx, yy, _, _), image in zip(tiles, images):
+            if image is not None:
+                yield xx, yy, image
+
+    def _fetch_tile_or_none(
+        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]], x: int, y: int
+    ) -> typing.Any:
+        try:
+            return self.fetch_tile(download, x, y)
+        except RuntimeError:
+            return None
+        except TILE_DECODE_ERRORS:
+            refetch = getattr(download, "refetch", None)
+        if refetch is None:
+            return None
+        try:
+            return self.fetch_tile(refetch, x, y)
+        except (RuntimeError, *TILE_DECODE_ERRORS):
+            return None
+
     @abstractmethod
     def render_objects(
         self,
@@ -0,0 +1,73 @@
+"""py-staticmaps - session_pool"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import typing
+import urllib.parse
+
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+
+
+class SessionPool:
+    """A pool of persistent http sessions, one per host
+
+    Each session keeps a pool of keep-alive connections, so consecutive tile requests to the same host (or shard)
+    reuse established TCP and TLS connections.
+    """
+
+    def __init__(self, pool_size: int = 10, keep_alive: bool = True) -> None:
+        self._pool_size = max(1, pool_size)
+        self._keep_alive = keep_alive
+        self._sessions: typing.Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def pool_size(self) -> int:
+        """Return the maximum number of connections kept per host
+
+        Returns:
+            int: maximum number of connections per host
+        """
+        return self._pool_size
+
+    def keep_alive(self) -> bool:
+        """Return whether connections are kept alive between requests
+
+        Returns:
+            bool: keep connections alive
+        """
+        return self._keep_alive
+
+    def session(self, url: str) -> requests.Session:
+        """Return the session for the host of the given url
+
+        Parameters:
+            url (str): request url
+
+        Returns:
+            requests.Session: session for the host of the url
+        """
+        parsed = urllib.parse.urlsplit(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if not self._keep_alive:
+                    session.headers["Connection"] = "close"
+                self._sessions[key] = session
+            return session
+
+    def close(self) -> None:
+        """Close all sessions and their connections"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+default_session_pool = SessionPool()
@@ -0,0 +1,137 @@
+"""py-staticmaps - shard_selector"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import math
+import threading
+import time
+import typing
+import urllib.parse
+
+from .tile_metrics import TileEvent
+from .tile_provider import TileProvider
+
+MIN_HEDGE_SAMPLES = 20
+ERROR_PENALTY = 1.0
+
+
+class _ShardStats:
+    """Smoothed latency and error rate of one tile server"""
+
+    def __init__(self) -> None:
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.updated = 0.0
+
+
+class ShardSelector:
+    """Tracks the latency and error rate of the tile servers and ranks the shards of a tile provider by their health
+
+    A shard selector is a tile observer: the tile downloader feeds it with the outcome of every request. Requests are
+    spread over the healthy shards like TileProvider.url does; a shard is healthy if its smoothed latency, plus a
+    penalty for its error rate, is within twice the score of the best shard (or 50 ms of it). Errors are forgotten
+    over time, so a failing shard is tried again after a while.
+    """
+
+    def __init__(self, smoothing: float = 0.2, error_half_life: float = 30.0, window: int = 200) -> None:
+        self._smoothing = smoothing
+        self._error_half_life = error_half_life
+        self._stats: typing.Dict[str, _ShardStats] = {}
+        self._latencies: typing.Dict[str, typing.Deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def __call__(self, event: TileEvent) -> None:
+        """Add the outcome of a request
+
+        Parameters:
+            event (TileEvent): tile event; events other than network requests are ignored
+        """
+        if event.source != "network" or event.shard is None:
+            return
+        # missing tiles are no sign of an unhealthy server
+        failed = event.error is not None and (
+            not event.error.isdigit() or int(event.error) >= 500 or event.error == "429"
+        )
+        with self._lock:
+            stats = self._stats.get(event.shard)
+            if stats is None:
+                stats = _ShardStats()
+                stats.latency = event.latency
+                self._stats[event.shard] = stats
+            else:
+                stats.latency += self._smoothing * (event.latency - stats.latency)
+            error_rate = self._decayed_error_rate(stats)
+            stats.error_rate = error_rate + self._smoothing * ((1.0 if failed else 0.0) - error_rate)
+            stats.updated = time.monotonic()
+            if not failed:
+                latencies = self._latencies.get(event.provider)
+                if latencies is None:
+                    latencies = collections.deque(maxlen=self._window)
+                    self._latencies[event.provider] = latencies
+                latencies.append(event.latency)
+
+    def urls(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.List[str]:
+        """Return the urls of a tile for all shards of the provider, the url to request first in front
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.List[str]: urls of the tile, ordered by the health of their shards; empty if the tile has no url
+        """
+        urls = [provider.url(zoom, x, y, shard) for shard in provider.shards()]
+        if len(urls) < 2 or None in urls:
+            url = provider.url(zoom, x, y)
+            return [url] if url is not None else []
+        with self._lock:
+            scores = [self._score(urllib.parse.urlsplit(url).netloc) for url in typing.cast(typing.List[str], urls)]
+        best = min(scores)
+        healthy = [index for index, score in enumerate(scores) if score <= max(2 * best, best + 0.05)]
+        first = healthy[(x + y) % len(healthy)]
+        others = sorted((index for index in range(len(urls)) if index != first), key=lambda index: scores[index])
+        return [typing.cast(str, urls[index]) for index in [first] + others]
+
+    def hedge_delay(self, provider: TileProvider, percentile: float) -> typing.Optional[float]:
+        """Return the latency percentile of successful requests to a provider
+
+        Parameters:
+            provider (TileProvider): tile provider
+            percentile (float): percentile between 0 and 1, e.g. 0.95
+
+        Returns:
+            typing.Optional[float]: latency in seconds, or None if there are too few samples yet
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(provider.name(), ()))
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(percentile * len(latencies)) - 1)]
+
+    def stats(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """Return the smoothed latency and error rate per tile server
+
+        Returns:
+            typing.Dict[str, typing.Dict[str, float]]: "latency" in seconds and "error_rate" per host
+        """
+        with self._lock:
+            return {
+                host: {"latency": stats.latency, "error_rate": self._decayed_error_rate(stats)}
+                for host, stats in self._stats.items()
+            }
+
+    def _score(self, host: str) -> float:
+        stats = self._stats.get(host)
+        if stats is None:
+            # unknown servers are assumed to be healthy, so they are tried
+            return 0.0
+        return stats.latency + ERROR_PENALTY * self._decayed_error_rate(stats)
+
+    def _decayed_error_rate(self, stats: _ShardStats) -> float:
+        if stats.updated == 0.0:
+            return stats.error_rate
+        return stats.error_rate * 0.5 ** ((time.monotonic() - stats.updated) / self._error_half_life)
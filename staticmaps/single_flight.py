@@ -0,0 +1,63 @@
+"""py-staticmaps - single_flight"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import typing
+from concurrent.futures import Future
+
+T = typing.TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key
+
+    The first caller of a key runs the function; callers arriving while it runs wait for its result (or exception)
+    instead of running the function again.
+    """
+
+    def __init__(self) -> None:
+        self._calls: typing.Dict[typing.Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: typing.Hashable, function: typing.Callable[[], T]) -> T:
+        """Run the function, or wait for the result of a concurrent call with the same key
+
+        Parameters:
+            key (typing.Hashable): key identifying the call
+            function (typing.Callable[[], T]): function computing the result
+
+        Returns:
+            T: result of the function
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return typing.cast(T, future.result())
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Return the number of running calls
+
+        Returns:
+            int: number of running calls
+        """
+        with self._lock:
+            return len(self._calls)
+
+
+default_single_flight = SingleFlight()
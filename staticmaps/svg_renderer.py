@@ -11,6 +11,7 @@ import s2sphere  # type: ignore
 import svgwrite  # type: ignore
 
 from .color import BLACK, WHITE, Color
+from .decoded_tile_cache import DecodedTileCache
 from .renderer import Renderer
 from .transformer import Transformer
 
@@ -22,6 +23,8 @@ if typing.TYPE_CHECKING:
 class SvgRenderer(Renderer):
     """An svg image renderer class that extends a generic renderer class"""
 
+    _decoded_tiles = DecodedTileCache(32 * 1024 * 1024)
+
     def __init__(self, transformer: Transformer) -> None:
         Renderer.__init__(self, transformer)
         self._draw = svgwrite.Drawing(
@@ -97,28 +100,17 @@ class SvgRenderer(Renderer):
             tighten (bool): tighten to boundaries
         """
         self._group = self._draw.g(clip_path="url(#page)")
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    self._group.add(
-                        self._draw.image(
-                            tile_img,
-                            insert=(
-                                int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
-                                int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
-                            ),
-                            size=(self._trans.tile_size(), self._trans.tile_size()),
-                        )
-                    )
-                except RuntimeError:
-                    pass
+        for xx, yy, tile_img in self.tile_images(download):
+            self._group.add(
+                self._draw.image(
+                    tile_img,
+                    insert=(
+                        int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
+                        int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
+                    ),
+                    size=(self._trans.tile_size(), self._trans.tile_size()),
+                )
+            )
         tiles_group = self._tighten_to_boundary(self._group, objects, tighten)
         self._draw.add(tiles_group)
         self._group = None
@@ -211,7 +203,16 @@ class SvgRenderer(Renderer):
         image_data = download(self._trans.zoom(), x, y)
         if image_data is None:
             return None
-        return SvgRenderer.create_inline_image(image_data)
+        return SvgRenderer._decoded_tiles.get_or_create(image_data, SvgRenderer.create_inline_image, len)
+
+    @staticmethod
+    def decoded_tile_cache() -> DecodedTileCache:
+        """Return the cache of inline tile images shared by all svg renderers
+
+        Returns:
+            DecodedTileCache: cache of tile data uris
+        """
+        return SvgRenderer._decoded_tiles
 
     @staticmethod
     def guess_image_mime_type(data: bytes) -> str:
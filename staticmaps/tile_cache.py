@@ -0,0 +1,548 @@
+"""py-staticmaps - tile_cache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+# pylint: disable=too-many-lines
+
+import json
+import os
+import pathlib
+import threading
+import time
+import typing
+from abc import ABC, abstractmethod
+
+import slugify  # type: ignore
+
+from .cache_index import CacheIndex
+from .tile_provider import TileProvider
+
+
+class TileMetadata(typing.NamedTuple):
+    """Metadata of a cached tile used for expiry and revalidation"""
+
+    fetched: float
+    """time (seconds since the epoch) the tile was fetched or last revalidated"""
+    etag: typing.Optional[str] = None
+    """ETag header of the tile response"""
+    last_modified: typing.Optional[str] = None
+    """Last-Modified header of the tile response"""
+    status: int = 200
+    """http status of the tile response; a cached tile with empty data and a status other than 200 is a negative
+    cache entry for a missing or failed tile"""
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TRAILER = b"IEND\xaeB`\x82"
+JPEG_SIGNATURE = b"\xff\xd8"
+JPEG_TRAILER = b"\xff\xd9"
+
+
+def tile_data_is_complete(data: bytes) -> bool:
+    """Check whether PNG, JPEG or WebP tile data is complete, i.e. not truncated
+
+    Only the framing of the image is checked, which is cheap enough to do on every cache read. Data of other formats
+    is considered complete.
+
+    Parameters:
+        data (bytes): encoded tile data
+
+    Returns:
+        bool: is the tile data complete
+    """
+    if data.startswith(PNG_SIGNATURE):
+        return data.endswith(PNG_TRAILER)
+    if data.startswith(JPEG_SIGNATURE):
+        # some encoders pad the image after the end-of-image marker
+        return JPEG_TRAILER in data[-64:]
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return len(data) >= 8 + int.from_bytes(data[4:8], "little")
+    return len(data) > 0
+
+
+class TileCache(ABC):
+    """A generic tile cache class"""
+
+    @abstractmethod
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the cache
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if the tile is not cached
+        """
+
+    @abstractmethod
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Put a tile into the cache
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+
+    def get_many(
+        self, provider: TileProvider, zoom: int, tiles: typing.Iterable[typing.Tuple[int, int]]
+    ) -> typing.Dict[typing.Tuple[int, int], bytes]:
+        """Get several tiles from the cache
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tiles
+            tiles (typing.Iterable[typing.Tuple[int, int]]): x and y values of the tiles
+
+        Returns:
+            typing.Dict[typing.Tuple[int, int], bytes]: tile data of the cached tiles per (x, y)
+        """
+        result = {}
+        for x, y in tiles:
+            data = self.get(provider, zoom, x, y)
+            if data is not None:
+                result[(x, y)] = data
+        return result
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Check whether a tile is cached
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile cached
+        """
+        return self.get(provider, zoom, x, y) is not None
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a cached tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if unknown
+        """
+        # pylint: disable=unused-argument
+        return None
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Set the metadata of a cached tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            metadata (TileMetadata): metadata of the tile
+        """
+
+    def record_access(self, provider: TileProvider, zoom: int, x: int, y: int) -> None:
+        """Record a hit of a tile that was served by a faster cache in front of this one
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+        """
+
+    def flush(self) -> None:
+        """Write all buffered tiles"""
+
+
+class FileTileCache(TileCache):
+    """A tile cache storing each tile in a file "cache_dir/provider/zoom/x/y.png"
+
+    Files are written to a temporary file first and then atomically renamed, so any number of processes can share
+    the cache directory without locks. Truncated or corrupt files (e.g. left by a crash before this layout was used)
+    are treated as missing, so the tile is fetched again.
+
+    If access_index is set, hits and new tiles are recorded in the access index of the cache directory, which drives
+    the eviction of CachePruner; otherwise CachePruner falls back to the modification times of the tile files.
+    """
+
+    def __init__(self, cache_dir: str, access_index: bool = False, fsync: bool = False) -> None:
+        self._cache_dir = cache_dir
+        self._fsync = fsync
+        self._sanitized_name_cache: typing.Dict[str, str] = {}
+        self._index = CacheIndex(cache_dir) if access_index else None
+
+    def cache_dir(self) -> str:
+        """Return the cache directory
+
+        Returns:
+            str: cache directory
+        """
+        return self._cache_dir
+
+    def file_name(self, provider: TileProvider, zoom: int, x: int, y: int) -> str:
+        """Return the file name of a tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            str: file name of the tile
+        """
+        return os.path.join(self._cache_dir, self._provider_dir(provider), str(zoom), str(x), f"{y}.png")
+
+    def access_index(self) -> typing.Optional[CacheIndex]:
+        """Return the access index of the cache directory
+
+        Returns:
+            typing.Optional[CacheIndex]: access index, or None if accesses are not recorded
+        """
+        return self._index
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from its file
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if the tile is not cached
+        """
+        file_name = self.file_name(provider, zoom, x, y)
+        try:
+            with open(file_name, "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            # the tile is not cached, or has just been evicted by a pruner
+            return None
+        if not tile_data_is_complete(data) and not self._is_negative_entry(file_name, data):
+            return None
+        self.record_access(provider, zoom, x, y)
+        return data
+
+    def record_access(self, provider: TileProvider, zoom: int, x: int, y: int) -> None:
+        """Record a hit of a tile in the access index
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+        """
+        if self._index is not None:
+            self._index.record_access(self._provider_dir(provider), zoom, x, y)
+
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Put a tile into its file, replacing the file atomically
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+        file_name = self.file_name(provider, zoom, x, y)
+        self._write_atomically(file_name, data)
+        try:
+            os.remove(f"{file_name}.meta")
+        except FileNotFoundError:
+            pass
+        if self._index is not None:
+            self._index.record_put(self._provider_dir(provider), zoom, x, y, len(data))
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Check whether the file of a tile exists
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile cached
+        """
+        return os.path.isfile(self.file_name(provider, zoom, x, y))
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a tile from its metadata file, or from the modification time of its file
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if the tile is not cached
+        """
+        file_name = self.file_name(provider, zoom, x, y)
+        try:
+            with open(f"{file_name}.meta", encoding="utf-8") as f:
+                return TileMetadata(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            pass
+        try:
+            return TileMetadata(os.path.getmtime(file_name))
+        except OSError:
+            return None
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Set the metadata of a tile in its metadata file
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            metadata (TileMetadata): metadata of the tile
+        """
+        file_name = self.file_name(provider, zoom, x, y)
+        # pylint: disable=protected-access
+        self._write_atomically(f"{file_name}.meta", json.dumps(metadata._asdict()).encode("utf-8"))
+
+    def flush(self) -> None:
+        """Write all buffered accesses to the access index"""
+        if self._index is not None:
+            self._index.flush()
+
+    def _write_atomically(self, file_name: str, data: bytes) -> None:
+        """Write data to a temporary file next to the target file, then rename it to the target file"""
+        directory = os.path.dirname(file_name)
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        temp_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_file_name, "wb") as f:
+                f.write(data)
+                if self._fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_file_name, file_name)
+        except BaseException:
+            try:
+                os.remove(temp_file_name)
+            except OSError:
+                pass
+            raise
+        if self._fsync:
+            self._fsync_directory(directory)
+
+    @staticmethod
+    def _fsync_directory(directory: str) -> None:
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            # directories cannot be opened on all platforms (e.g. Windows)
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _is_negative_entry(self, file_name: str, data: bytes) -> bool:
+        """Check whether empty data is a negative cache entry, i.e. has metadata with a status other than 200"""
+        if data:
+            return False
+        try:
+            with open(f"{file_name}.meta", encoding="utf-8") as f:
+                return TileMetadata(**json.load(f)).status != 200
+        except (OSError, ValueError, TypeError):
+            return False
+
+    def _provider_dir(self, provider: TileProvider) -> str:
+        name = provider.name()
+        sanitized = self._sanitized_name_cache.get(name)
+        if sanitized is None:
+            sanitized = slugify.slugify(name) or "_"
+            self._sanitized_name_cache[name] = sanitized
+        return sanitized
+
+
+class TieredTileCache(TileCache):
+    """A tile cache combining several tile caches, ordered from the fastest to the largest one
+
+    Tiles are looked up tier by tier; a tile found in a slower tier is promoted into all faster tiers, and a hit is
+    recorded in the slower tiers (e.g. the access index of a FileTileCache behind a memory cache). New tiles are put
+    into all tiers.
+    """
+
+    def __init__(self, tiers: typing.List[TileCache]) -> None:
+        self._tiers = tiers
+
+    def tiers(self) -> typing.List[TileCache]:
+        """Return the tiers of the cache
+
+        Returns:
+            typing.List[TileCache]: tile caches ordered from the fastest to the largest one
+        """
+        return self._tiers
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the first tier holding it and promote it into the faster tiers
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if the tile is not cached
+        """
+        return self.lookup(provider, zoom, x, y)[0]
+
+    def lookup(
+        self, provider: TileProvider, zoom: int, x: int, y: int
+    ) -> typing.Tuple[typing.Optional[bytes], typing.List[typing.Tuple[TileCache, float]]]:
+        """Get a tile like get, and report the tiers looked up
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Tuple[typing.Optional[bytes], typing.List[typing.Tuple[TileCache, float]]]: tile data (or None if
+            the tile is not cached), and the tiers looked up with the duration of each lookup in seconds; the last
+            tier holds the tile if it is cached
+        """
+        lookups = []
+        for index, tier in enumerate(self._tiers):
+            start = time.monotonic()
+            data = tier.get(provider, zoom, x, y)
+            lookups.append((tier, time.monotonic() - start))
+            if data is not None:
+                self._promote(index, provider, zoom, x, y, data)
+                self._record_access(index, provider, zoom, x, y)
+                return data, lookups
+        return None, lookups
+
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Put a tile into all tiers
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+        for tier in self._tiers:
+            tier.put(provider, zoom, x, y, data)
+
+    def get_many(
+        self, provider: TileProvider, zoom: int, tiles: typing.Iterable[typing.Tuple[int, int]]
+    ) -> typing.Dict[typing.Tuple[int, int], bytes]:
+        """Get several tiles tier by tier, promoting tiles found in slower tiers
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tiles
+            tiles (typing.Iterable[typing.Tuple[int, int]]): x and y values of the tiles
+
+        Returns:
+            typing.Dict[typing.Tuple[int, int], bytes]: tile data of the cached tiles per (x, y)
+        """
+        result: typing.Dict[typing.Tuple[int, int], bytes] = {}
+        missing = list(tiles)
+        for index, tier in enumerate(self._tiers):
+            if not missing:
+                break
+            found = tier.get_many(provider, zoom, missing)
+            for (x, y), data in found.items():
+                self._promote(index, provider, zoom, x, y, data)
+                self._record_access(index, provider, zoom, x, y)
+            result.update(found)
+            missing = [xy for xy in missing if xy not in found]
+        return result
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Check whether any tier holds a tile
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: is the tile cached
+        """
+        return any(tier.contains(provider, zoom, x, y) for tier in self._tiers)
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a tile from the first tier knowing it
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if unknown
+        """
+        for tier in self._tiers:
+            metadata = tier.get_metadata(provider, zoom, x, y)
+            if metadata is not None:
+                return metadata
+        return None
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Set the metadata of a tile in all tiers
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            metadata (TileMetadata): metadata of the tile
+        """
+        for tier in self._tiers:
+            tier.set_metadata(provider, zoom, x, y, metadata)
+
+    def _promote(self, index: int, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        metadata = self._tiers[index].get_metadata(provider, zoom, x, y)
+        for faster_tier in self._tiers[:index]:
+            faster_tier.put(provider, zoom, x, y, data)
+            if metadata is not None:
+                faster_tier.set_metadata(provider, zoom, x, y, metadata)
+
+    def record_access(self, provider: TileProvider, zoom: int, x: int, y: int) -> None:
+        """Record a hit of a tile in all tiers
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+        """
+        self._record_access(-1, provider, zoom, x, y)
+
+    def _record_access(self, index: int, provider: TileProvider, zoom: int, x: int, y: int) -> None:
+        first_slower = index + 1
+        for slower_tier in self._tiers[first_slower:]:
+            slower_tier.record_access(provider, zoom, x, y)
+
+    def flush(self) -> None:
+        """Write all buffered tiles of all tiers"""
+        for tier in self._tiers:
+            tier.flush()
@@ -2,33 +2,132 @@
 
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
-import os
-import pathlib
+# pylint: disable=too-many-lines
+
+import threading
+import time
 import typing
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 import requests  # type: ignore
 import slugify  # type: ignore
 
-from .meta import GITHUB_URL, LIB_NAME, VERSION
+from .cancellation import CancellationToken
+from .circuit_breaker import CircuitOpenError
+from .file_lock import cache_dir_lock, file_lock_is_supported
+from .memory_tile_cache import MemoryTileCache, default_memory_tile_cache
+from .single_flight import SingleFlight, default_single_flight
+from .tile_cache import (
+    FileTileCache,
+    TieredTileCache,
+    TileCache,
+    TileMetadata,
+    tile_data_is_complete,
+)
+from .tile_fallback import ZoomFallback
+from .tile_metrics import TileEvent
 from .tile_provider import TileProvider
+from .tile_requester import TileRequester
 
-REQUEST_TIMEOUT = 10
+NEGATIVE_TTL = 600.0
 
 
-class TileDownloader:
+class TileDownloader(TileRequester, ZoomFallback):
     """A tile downloader class"""
 
+    # pylint: disable=too-many-instance-attributes
     def __init__(self) -> None:
-        self._user_agent = f"Mozilla/5.0+(compatible; {LIB_NAME}/{VERSION}; {GITHUB_URL})"
+        super().__init__()
         self._sanitized_name_cache: typing.Dict[str, str] = {}
+        self._single_flight = default_single_flight
+        self._file_locking = False
+        self._memory_cache: typing.Optional[MemoryTileCache] = default_memory_tile_cache
+        self._tile_cache: typing.Optional[TileCache] = None
+        self._file_caches: typing.Dict[str, FileTileCache] = {}
+        self._access_index = False
+        self._combined_caches: typing.Dict[typing.Optional[str], typing.Optional[TileCache]] = {}
+        self._stale_while_revalidate = False
+        self._negative_ttl: typing.Optional[float] = NEGATIVE_TTL
+        self._revalidation_executor: typing.Optional[ThreadPoolExecutor] = None
+        self._revalidation_lock = threading.Lock()
+        self._revalidating: typing.Set[typing.Tuple[str, int, int, int]] = set()
+
+    def set_single_flight(self, single_flight: SingleFlight) -> None:
+        """Set the coalescer of concurrent fetches of the same tile
+
+        By default, all downloaders share one process-wide coalescer, so a tile missing from the cache is fetched
+        only once, however many threads request it at the same time.
+
+        Parameters:
+            single_flight (SingleFlight): coalescer of concurrent fetches
+        """
+        self._single_flight = single_flight
+
+    def set_file_locking(self, file_locking: bool) -> None:
+        """Set whether fetches of missing tiles hold a file lock in the cache directory
+
+        With file locking, processes sharing one cache directory coalesce their fetches, too: a process waits for
+        another process fetching the same tile and then reads it from the cache.
+
+        Parameters:
+            file_locking (bool): lock tiles in the cache directory while fetching them
+
+        Raises:
+            RuntimeError: raises a runtime error if file locks are not supported on this platform
+        """
+        if file_locking and not file_lock_is_supported():
+            raise RuntimeError("Cannot use file locking since the 'fcntl' module could not be imported.")
+        self._file_locking = file_locking
+
+    def set_memory_cache(self, memory_cache: typing.Optional[MemoryTileCache]) -> None:
+        """Set the in-memory tile cache in front of the cache directory
+
+        By default, all downloaders share one process-wide in-memory cache.
+
+        Parameters:
+            memory_cache (typing.Optional[MemoryTileCache]): in-memory tile cache, None disables it
+        """
+        self._memory_cache = memory_cache
+        self._combined_caches.clear()
+
+    def set_access_index(self, access_index: bool) -> None:
+        """Set whether hits and new tiles are recorded in the access index of the cache directories
+
+        Enable this for cache directories pruned by a CachePruner, so it evicts the least used tiles first; hits
+        served by the in-memory cache are recorded as well.
+
+        Parameters:
+            access_index (bool): record accesses or not
+        """
+        self._access_index = access_index
+        self._file_caches.clear()
+        self._combined_caches.clear()
+
+    def set_tile_cache(self, tile_cache: typing.Optional[TileCache]) -> None:
+        """Set a tile cache replacing the file-per-tile layout of the cache directory
+
+        Parameters:
+            tile_cache (typing.Optional[TileCache]): tile cache (e.g. MBTilesTileCache or TieredTileCache), None
+                selects the cache directory
+        """
+        self._tile_cache = tile_cache
+        self._combined_caches.clear()
 
-    def set_user_agent(self, user_agent: str) -> None:
-        """Set the user agent for the downloader
+    def set_stale_while_revalidate(self, stale_while_revalidate: bool) -> None:
+        """Set whether expired tiles are served immediately while being revalidated in the background
 
         Parameters:
-            user_agent (str): user agent
+            stale_while_revalidate (bool): serve expired tiles and revalidate them in the background
         """
-        self._user_agent = user_agent
+        self._stale_while_revalidate = stale_while_revalidate
+
+    def set_negative_ttl(self, negative_ttl: typing.Optional[float]) -> None:
+        """Set the time to live of negative cache entries for missing and failed tiles
+
+        Parameters:
+            negative_ttl (typing.Optional[float]): time to live in seconds, None disables negative caching
+        """
+        self._negative_ttl = negative_ttl
 
     def get(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
         """Get tiles
@@ -41,33 +140,347 @@ class TileDownloader:
             y (int): y value of center for the static map
 
         Returns:
-            typing.Optional[bytes]: tiles
+            typing.Optional[bytes]: tiles, a SynthesizedTile if the tile was synthesized from other zooms
 
         Raises:
             RuntimeError: raises a runtime error if the server response status is not 200
         """
-        file_name = None
-        if cache_dir is not None:
-            file_name = self.cache_file_name(provider, cache_dir, zoom, x, y)
-            if os.path.isfile(file_name):
-                with open(file_name, "rb") as f:
-                    return f.read()
+        cache = self._caches(cache_dir)
+        data = None
+        if cache is not None:
+            data = self._lookup(provider, cache, zoom, x, y)
+            if data and (self._offline or not self._is_expired(provider, cache, zoom, x, y)):
+                return data
+            if data and self._stale_while_revalidate:
+                self._revalidate_in_background(provider, cache, zoom, x, y, data)
+                return data
+        if self._offline:
+            return self._synthesize(provider, cache, zoom, x, y)
+        try:
+            return self._single_flight.do(
+                (provider.name(), cache_dir, zoom, x, y),
+                lambda: self._fetch(provider, cache_dir, cache, zoom, x, y, data),
+            )
+        except (RuntimeError, requests.RequestException):
+            synthesized = self._synthesize(provider, cache, zoom, x, y)
+            if synthesized is None:
+                raise
+            return synthesized
 
-        url = provider.url(zoom, x, y)
-        if url is None:
-            return None
-        res = requests.get(url, headers={"user-agent": self._user_agent}, timeout=REQUEST_TIMEOUT)
-        if res.status_code == 200:
-            data = res.content
+    def _lookup(self, provider: TileProvider, cache: TileCache, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Look up a tile in the cache, notifying the observers of the lookup in each tier"""
+        if isinstance(cache, TieredTileCache):
+            data, lookups = cache.lookup(provider, zoom, x, y)
         else:
+            start = time.monotonic()
+            data = cache.get(provider, zoom, x, y)
+            lookups = [(cache, time.monotonic() - start)]
+        size = len(data) if data else 0
+        for index, (tier, latency) in enumerate(lookups):
+            hit = bool(data) and index == len(lookups) - 1
+            source = "memory" if isinstance(tier, MemoryTileCache) else "disk"
+            self._notify(TileEvent(source, provider.name(), zoom, hit, latency, size if hit else 0))
+        self._notify(TileEvent("cache", provider.name(), zoom, bool(data), sum(l for _, l in lookups), size))
+        return data
+
+    def needs_fetch(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> bool:
+        """Check whether a tile has to be fetched, i.e. is neither cached with complete data nor failed so recently
+        that its negative cache entry still holds
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: does the tile have to be fetched
+        """
+        cache = self.tile_cache(cache_dir)
+        if cache is None or not cache.contains(provider, zoom, x, y):
+            return True
+        data = cache.get(provider, zoom, x, y)
+        if data is None:
+            return True
+        if data:
+            return not tile_data_is_complete(data)
+        try:
+            self._check_negative_entry(provider, cache, zoom, x, y)
+        except RuntimeError:
+            return False
+        return True
+
+    def get_cached(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the cache only, synthesizing it from other zooms if a zoom fallback is set
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: cached tile (even if expired), a SynthesizedTile, or None
+        """
+        cache = self._caches(cache_dir)
+        data = cache.get(provider, zoom, x, y) if cache is not None else None
+        return data or self._synthesize(provider, cache, zoom, x, y)
+
+    def refetch(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Download a tile again, replacing its cached data, e.g. because the cached data does not decode
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: downloaded tile, or None if the tile provider has no url for the tile
+
+        Raises:
+            RuntimeError: raises if the tile cannot be downloaded
+        """
+        cache = self._caches(cache_dir)
+        if cache is None or not self._file_locking:
+            return self._download(provider, cache, zoom, x, y)
+        with cache_dir_lock(cache_dir).locked(f"{provider.name()}/{zoom}/{x}/{y}"):
+            return self._download(provider, cache, zoom, x, y)
+
+    def _fetch(
+        self,
+        provider: TileProvider,
+        cache_dir: str,
+        cache: typing.Optional[TileCache],
+        zoom: int,
+        x: int,
+        y: int,
+        data: typing.Optional[bytes],
+    ) -> typing.Optional[bytes]:
+        """Fetch a missing, failed or expired tile; runs only once at a time per tile"""
+        if cache is None:
+            return self._download(provider, None, zoom, x, y)
+        if not self._file_locking:
+            return self._fetch_into_cache(provider, cache, zoom, x, y, data)
+        with cache_dir_lock(cache_dir).locked(f"{provider.name()}/{zoom}/{x}/{y}"):
+            # another process may have fetched the tile while this one waited for the lock
+            return self._fetch_into_cache(provider, cache, zoom, x, y, None)
+
+    def _fetch_into_cache(
+        self, provider: TileProvider, cache: TileCache, zoom: int, x: int, y: int, data: typing.Optional[bytes]
+    ) -> typing.Optional[bytes]:
+        if data is None and cache.contains(provider, zoom, x, y):
+            # fetched by a concurrent call that finished after this call missed the cache
+            data = cache.get(provider, zoom, x, y)
+        if data is None:
+            return self._download(provider, cache, zoom, x, y)
+        if not data:
+            self._check_negative_entry(provider, cache, zoom, x, y)
+            return self._download(provider, cache, zoom, x, y)
+        if not self._is_expired(provider, cache, zoom, x, y):
+            return data
+        return self._download(provider, cache, zoom, x, y, data)
+
+    def _download(
+        self,
+        provider: TileProvider,
+        cache: typing.Optional[TileCache],
+        zoom: int,
+        x: int,
+        y: int,
+        stale_data: typing.Optional[bytes] = None,
+    ) -> typing.Optional[bytes]:
+        """Download a tile and store it in the cache
+
+        If stale data is given, the tile is revalidated: a "304 Not Modified" response only refreshes the fetch time
+        of the cached tile. The stale data is also returned if the revalidation fails.
+        """
+        urls = self._urls(provider, zoom, x, y)
+        if not urls:
+            return None
+        url = urls[0]
+        metadata = None
+        if stale_data is not None and cache is not None:
+            metadata = cache.get_metadata(provider, zoom, x, y)
+        try:
+            res = self._request(provider, zoom, urls, self._headers(metadata))
+        except (requests.RequestException, CircuitOpenError):
+            if stale_data is not None:
+                return stale_data
+            raise
+        if res.status_code == 304 and stale_data is not None and cache is not None:
+            etag, last_modified = (metadata.etag, metadata.last_modified) if metadata is not None else (None, None)
+            cache.set_metadata(provider, zoom, x, y, TileMetadata(time.time(), etag, last_modified))
+            return stale_data
+        if res.status_code != 200:
+            if stale_data is not None:
+                return stale_data
+            if cache is not None and self._negative_ttl:
+                cache.put(provider, zoom, x, y, b"")
+                cache.set_metadata(provider, zoom, x, y, TileMetadata(time.time(), status=res.status_code))
             raise RuntimeError(f"fetch {url} yields {res.status_code}")
 
-        if file_name is not None:
-            pathlib.Path(os.path.dirname(file_name)).mkdir(parents=True, exist_ok=True)
-            with open(file_name, "wb") as f:
-                f.write(data)
+        data = res.content
+        if data and not tile_data_is_complete(data):
+            if stale_data is not None:
+                return stale_data
+            raise RuntimeError(f"fetch {url} yields truncated tile data")
+        if cache is not None:
+            cache.put(provider, zoom, x, y, data)
+            if provider.ttl() is not None:
+                cache.set_metadata(
+                    provider,
+                    zoom,
+                    x,
+                    y,
+                    TileMetadata(time.time(), res.headers.get("etag"), res.headers.get("last-modified")),
+                )
         return data
 
+    def _check_negative_entry(self, provider: TileProvider, cache: TileCache, zoom: int, x: int, y: int) -> None:
+        """Raise the cached error of a missing or failed tile, unless the negative cache entry expired"""
+        metadata = cache.get_metadata(provider, zoom, x, y)
+        if metadata is None or metadata.status == 200 or not self._negative_ttl:
+            return
+        if metadata.fetched + self._negative_ttl >= time.time():
+            raise RuntimeError(f"fetch {provider.url(zoom, x, y)} yields {metadata.status} (cached)")
+
+    @staticmethod
+    def _is_expired(provider: TileProvider, cache: TileCache, zoom: int, x: int, y: int) -> bool:
+        ttl = provider.ttl()
+        if ttl is None:
+            return False
+        metadata = cache.get_metadata(provider, zoom, x, y)
+        return metadata is None or metadata.fetched + ttl < time.time()
+
+    def _revalidate_in_background(
+        self, provider: TileProvider, cache: TileCache, zoom: int, x: int, y: int, stale_data: bytes
+    ) -> None:
+        key = (provider.name(), zoom, x, y)
+        with self._revalidation_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            if self._revalidation_executor is None:
+                self._revalidation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tile-revalidate")
+
+        def revalidate() -> None:
+            try:
+                self._download(provider, cache, zoom, x, y, stale_data)
+            except Exception:  # pylint: disable=broad-except
+                pass
+            finally:
+                with self._revalidation_lock:
+                    self._revalidating.discard(key)
+
+        self._revalidation_executor.submit(revalidate)
+
+    def _caches(self, cache_dir: typing.Optional[str]) -> typing.Optional[TileCache]:
+        """Return the in-memory cache combined with the tile cache for the given cache directory"""
+        caches = self._combined_caches.get(cache_dir)
+        if caches is None:
+            tiers = [cache for cache in (self._memory_cache, self.tile_cache(cache_dir)) if cache is not None]
+            caches = None if not tiers else tiers[0] if len(tiers) == 1 else TieredTileCache(tiers)
+            self._combined_caches[cache_dir] = caches
+        return caches
+
+    def tile_cache(self, cache_dir: typing.Optional[str]) -> typing.Optional[TileCache]:
+        """Return the tile cache used for the given cache directory
+
+        Parameters:
+            cache_dir (typing.Optional[str]): cache directory for tiles
+
+        Returns:
+            typing.Optional[TileCache]: the tile cache set by set_tile_cache, a file tile cache for the cache
+            directory, or None if there is neither
+        """
+        if self._tile_cache is not None:
+            return self._tile_cache
+        if cache_dir is None:
+            return None
+        return self._file_cache(cache_dir)
+
+    def _file_cache(self, cache_dir: str) -> FileTileCache:
+        file_cache = self._file_caches.get(cache_dir)
+        if file_cache is None:
+            file_cache = FileTileCache(cache_dir, access_index=self._access_index)
+            self._file_caches[cache_dir] = file_cache
+        return file_cache
+
+    def submit_many(
+        self,
+        provider: TileProvider,
+        cache_dir: str,
+        zoom: int,
+        tiles: typing.Iterable[typing.Tuple[int, int]],
+        max_workers: typing.Optional[int] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], Future]:
+        """Start fetching several tiles concurrently, without waiting for them
+
+        The tiles are fetched by a bounded thread pool in the given order, so the results can be consumed while the
+        remaining tiles are still being fetched.
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom for static map
+            tiles (typing.Iterable[typing.Tuple[int, int]]): x and y values of the tiles
+            max_workers (typing.Optional[int]): maximum number of concurrent fetches, defaults to the maximum
+                concurrency of the tile provider
+
+        Returns:
+            typing.Dict[typing.Tuple[int, int], Future]: futures holding the tile data (or the raised exception) per
+            (x, y); cancel the futures of tiles that are no longer needed
+        """
+        if max_workers is None:
+            max_workers = provider.max_concurrency()
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tile-fetch")
+        result = {(x, y): executor.submit(self.get, provider, cache_dir, zoom, x, y) for (x, y) in dict.fromkeys(tiles)}
+        # the queued fetches still run; the worker threads exit when the queue is drained
+        executor.shutdown(wait=False)
+        return result
+
+    def get_many(
+        self,
+        provider: TileProvider,
+        cache_dir: str,
+        zoom: int,
+        tiles: typing.Iterable[typing.Tuple[int, int]],
+        max_workers: typing.Optional[int] = None,
+        cancellation: typing.Optional[CancellationToken] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], Future]:
+        """Get several tiles concurrently
+
+        The tiles are fetched by a bounded thread pool; the call returns after all tiles have been fetched, or as
+        soon as the cancellation token is cancelled. Queued fetches are cancelled then, while running fetches finish
+        in the background (and still fill the cache).
+
+        Parameters:
+            provider (TileProvider): tile provider
+            cache_dir (str): cache directory for tiles
+            zoom (int): zoom for static map
+            tiles (typing.Iterable[typing.Tuple[int, int]]): x and y values of the tiles
+            max_workers (typing.Optional[int]): maximum number of concurrent fetches, defaults to the maximum
+                concurrency of the tile provider
+            cancellation (typing.Optional[CancellationToken]): token ending the wait for the fetches
+
+        Returns:
+            typing.Dict[typing.Tuple[int, int], Future]: futures holding the tile data (or the raised exception) per
+            (x, y); futures of fetches ended by the cancellation token are not done or cancelled
+        """
+        result = self.submit_many(provider, cache_dir, zoom, tiles, max_workers)
+        pending = set(result.values())
+        while pending and not (cancellation is not None and cancellation.cancelled()):
+            # wake up regularly to notice explicit cancellations
+            timeout = None if cancellation is None else min(0.05, cancellation.remaining() or 0.05)
+            _, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in pending:
+            future.cancel()
+        return result
+
     def sanitized_name(self, name: str) -> str:
         """Return sanitized name
 
@@ -98,4 +511,4 @@ class TileDownloader:
         Returns:
             str: cache file name
         """
-        return os.path.join(cache_dir, self.sanitized_name(provider.name()), str(zoom), str(x), f"{y}.png")
+        return self._file_cache(cache_dir).file_name(provider, zoom, x, y)
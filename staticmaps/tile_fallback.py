@@ -0,0 +1,161 @@
+"""py-staticmaps - tile_fallback"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+import typing
+
+from PIL import Image as PIL_Image  # type: ignore
+
+from .tile_cache import TileCache
+from .tile_provider import TileProvider
+
+
+class SynthesizedTile(bytes):
+    """Encoded tile data synthesized from cached tiles of another zoom
+
+    Synthesized tiles are never written to a tile cache; check for them with isinstance.
+    """
+
+    _source_zoom: int
+
+    def __new__(cls, data: bytes, source_zoom: int) -> "SynthesizedTile":
+        tile = super().__new__(cls, data)
+        tile._source_zoom = source_zoom
+        return tile
+
+    def source_zoom(self) -> int:
+        """Return the zoom of the cached tiles the tile was synthesized from
+
+        Returns:
+            int: zoom of the source tiles
+        """
+        return self._source_zoom
+
+
+class ZoomFallback:
+    """Base class of the tile downloaders synthesizing missing tiles from cached tiles of other zooms
+
+    In offline mode, tiles are served from the cache only, and missing tiles are synthesized.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._offline = False
+        self._max_overzoom = 0
+        self._max_underzoom = 0
+
+    def set_offline(self, offline: bool) -> None:
+        """Set whether tiles are served from the cache only, without any network access
+
+        In offline mode, cached tiles are served even if they are expired, and missing tiles are synthesized from
+        cached tiles of other zooms if a zoom fallback is set; otherwise they are left out of the map.
+
+        Parameters:
+            offline (bool): never download tiles
+        """
+        self._offline = offline
+
+    def set_zoom_fallback(self, max_overzoom: int, max_underzoom: int = 1) -> None:
+        """Set how missing tiles are synthesized from cached tiles of other zooms
+
+        A tile that is neither cached nor downloadable (or any missing tile in offline mode) is downsampled from its
+        cached child tiles or upscaled from the matching part of its nearest cached ancestor tile. Synthesized tiles
+        are returned as SynthesizedTile and never written to the cache.
+
+        Parameters:
+            max_overzoom (int): maximum zoom difference to an ancestor tile, 0 disables upscaling
+            max_underzoom (int): maximum zoom difference to child tiles, 0 disables downsampling
+        """
+        self._max_overzoom = max(0, max_overzoom)
+        self._max_underzoom = max(0, max_underzoom)
+
+    def _synthesize(
+        self, provider: TileProvider, cache: typing.Optional[TileCache], zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        if cache is None or (self._max_overzoom == 0 and self._max_underzoom == 0):
+            return None
+        return synthesize_tile(cache, provider, zoom, x, y, self._max_overzoom, self._max_underzoom)
+
+
+def synthesize_tile(
+    cache: TileCache, provider: TileProvider, zoom: int, x: int, y: int, max_overzoom: int = 5, max_underzoom: int = 1
+) -> typing.Optional[SynthesizedTile]:
+    """Synthesize a missing tile from cached tiles of other zooms, without any network access
+
+    Child tiles give the sharpest result, so the tile is downsampled from the cached child tiles of the next zooms
+    first; otherwise the matching part of the nearest cached ancestor tile is cropped and upscaled.
+
+    Parameters:
+        cache (TileCache): tile cache to look up the source tiles
+        provider (TileProvider): tile provider
+        zoom (int): zoom of the missing tile
+        x (int): x value of the missing tile
+        y (int): y value of the missing tile
+        max_overzoom (int): maximum zoom difference to an ancestor tile
+        max_underzoom (int): maximum zoom difference to child tiles
+
+    Returns:
+        typing.Optional[SynthesizedTile]: PNG data of the synthesized tile, or None if the cache holds no source tiles
+    """
+    for depth in range(1, max_underzoom + 1):
+        if zoom + depth > provider.max_zoom():
+            break
+        image = _from_children(cache, provider, zoom + depth, x, y, depth)
+        if image is not None:
+            return SynthesizedTile(_encode(image), zoom + depth)
+    for depth in range(1, min(max_overzoom, zoom) + 1):
+        image = _from_ancestor(cache, provider, zoom - depth, x, y, depth)
+        if image is not None:
+            return SynthesizedTile(_encode(image), zoom - depth)
+    return None
+
+
+def _from_ancestor(
+    cache: TileCache, provider: TileProvider, ancestor_zoom: int, x: int, y: int, depth: int
+) -> typing.Optional[PIL_Image.Image]:
+    data = cache.get(provider, ancestor_zoom, x >> depth, y >> depth)
+    if not data:
+        return None
+    ancestor = _decode(data)
+    if ancestor is None:
+        return None
+    size = ancestor.width >> depth
+    if size == 0:
+        return None
+    left = (x & ((1 << depth) - 1)) * size
+    top = (y & ((1 << depth) - 1)) * size
+    return ancestor.crop((left, top, left + size, top + size)).resize(ancestor.size, PIL_Image.Resampling.BILINEAR)
+
+
+def _from_children(
+    cache: TileCache, provider: TileProvider, child_zoom: int, x: int, y: int, depth: int
+) -> typing.Optional[PIL_Image.Image]:
+    count = 1 << depth
+    offsets = [(dx, dy) for dy in range(count) for dx in range(count)]
+    children = cache.get_many(provider, child_zoom, [((x << depth) + dx, (y << depth) + dy) for dx, dy in offsets])
+    if len(children) < len(offsets) or not all(children.values()):
+        return None
+    child_size = provider.tile_size() >> depth
+    image = PIL_Image.new("RGBA", (provider.tile_size(), provider.tile_size()))
+    for dx, dy in offsets:
+        child = _decode(children[((x << depth) + dx, (y << depth) + dy)])
+        if child is None:
+            return None
+        image.paste(
+            child.resize((child_size, child_size), PIL_Image.Resampling.LANCZOS), (dx * child_size, dy * child_size)
+        )
+    return image
+
+
+def _decode(data: bytes) -> typing.Optional[PIL_Image.Image]:
+    try:
+        return PIL_Image.open(io.BytesIO(data)).convert("RGBA")
+    except OSError:
+        return None
+
+
+def _encode(image: PIL_Image.Image) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
@@ -0,0 +1,146 @@
+"""py-staticmaps - tile_metrics"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import bisect
+import collections
+import threading
+import typing
+
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+"""upper bounds of the latency histogram buckets in seconds; a last bucket counts all slower events"""
+
+
+class TileEvent(typing.NamedTuple):
+    """A lookup of a tile in a cache tier or a request of a tile from the network"""
+
+    source: str
+    """"memory" or "disk" for a lookup in a cache tier, "cache" for the lookup in all tiers, "network" for a request,
+    "circuit" for a state change of the circuit breaker of the tile provider"""
+    provider: str
+    """name of the tile provider"""
+    zoom: int
+    """zoom of the tile"""
+    hit: bool
+    """whether the tile was found (for network requests: status 200 or 304, for circuit events: circuit closed)"""
+    latency: float
+    """duration of the lookup or request in seconds"""
+    size: int = 0
+    """size of the found or transferred tile data in bytes"""
+    shard: typing.Optional[str] = None
+    """host the tile was requested from (network requests only)"""
+    error: typing.Optional[str] = None
+    """status code of a failed request, or the name of the exception raised by it (network requests only)"""
+    state: typing.Optional[str] = None
+    """new state of the circuit breaker: "closed", "open" or "half-open" (circuit events only)"""
+
+
+TileObserverT = typing.Callable[[TileEvent], None]
+
+
+class LatencyHistogram:
+    """A histogram of latencies with the fixed buckets of LATENCY_BUCKETS"""
+
+    def __init__(self) -> None:
+        self._counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._sum = 0.0
+
+    def add(self, latency: float) -> None:
+        """Add a latency to the histogram
+
+        Parameters:
+            latency (float): latency in seconds
+        """
+        self._counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self._sum += latency
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        """Return the state of the histogram
+
+        Returns:
+            typing.Dict[str, typing.Any]: number of latencies ("count"), their sum in seconds ("sum") and the number
+            of latencies per bucket ("buckets"), aligned with LATENCY_BUCKETS plus one bucket for slower latencies
+        """
+        return {"count": sum(self._counts), "sum": self._sum, "buckets": list(self._counts)}
+
+
+class TileMetrics:
+    """A thread-safe aggregation of tile events
+
+    Counts hits, misses and bytes per source, cache hits and misses per zoom, errors by status code, and keeps
+    latency histograms per source, tile provider and shard, and the circuit states of the tile providers. A
+    TileMetrics is a tile observer itself.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: typing.Dict[str, typing.Dict[str, int]] = {}
+        self._zooms: typing.Dict[int, typing.Dict[str, int]] = {}
+        self._errors: typing.Counter[str] = collections.Counter()
+        self._latencies: typing.Dict[typing.Tuple[str, str], LatencyHistogram] = {}
+        self._circuits: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self.reset()
+
+    def __call__(self, event: TileEvent) -> None:
+        """Add a tile event
+
+        Parameters:
+            event (TileEvent): tile event
+        """
+        with self._lock:
+            if event.source == "circuit":
+                circuit = self._circuits.setdefault(event.provider, {"state": event.state, "opened": 0})
+                circuit["state"] = event.state
+                circuit["opened"] += 1 if event.state == "open" else 0
+                return
+            counters = self._counters.setdefault(event.source, {"hits": 0, "misses": 0, "bytes": 0})
+            counters["hits" if event.hit else "misses"] += 1
+            counters["bytes"] += event.size
+            if event.error is not None:
+                self._errors[event.error] += 1
+            self._histogram("sources", event.source).add(event.latency)
+            if event.source == "network":
+                self._histogram("providers", event.provider).add(event.latency)
+                self._histogram("shards", event.shard or "").add(event.latency)
+            elif event.source == "cache":
+                self._zooms.setdefault(event.zoom, {"hits": 0, "misses": 0})["hits" if event.hit else "misses"] += 1
+
+    def reset(self) -> None:
+        """Reset all counters and histograms"""
+        with self._lock:
+            self._counters = {
+                source: {"hits": 0, "misses": 0, "bytes": 0} for source in ("memory", "disk", "cache", "network")
+            }
+            self._zooms = {}
+            self._errors = collections.Counter()
+            self._latencies = {}
+            self._circuits = {
+                provider: {"state": circuit["state"], "opened": 0} for provider, circuit in self._circuits.items()
+            }
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        """Return the current state of the metrics
+
+        Returns:
+            typing.Dict[str, typing.Any]: hits, misses and bytes per source ("memory", "disk", "cache", "network"),
+            cache hits and misses per zoom ("zooms"), error counts by status code or exception ("errors"), latency
+            histograms per source, tile provider and shard ("latency"), and the circuit state and the number of
+            times the circuit opened per tile provider ("circuits")
+        """
+        with self._lock:
+            latency: typing.Dict[str, typing.Dict[str, typing.Any]] = {"sources": {}, "providers": {}, "shards": {}}
+            for (kind, name), histogram in self._latencies.items():
+                latency[kind][name] = histogram.snapshot()
+            snapshot: typing.Dict[str, typing.Any] = {source: dict(c) for source, c in self._counters.items()}
+            snapshot["zooms"] = {zoom: dict(counters) for zoom, counters in sorted(self._zooms.items())}
+            snapshot["errors"] = dict(self._errors)
+            snapshot["latency"] = latency
+            snapshot["circuits"] = {provider: dict(circuit) for provider, circuit in self._circuits.items()}
+            return snapshot
+
+    def _histogram(self, kind: str, name: str) -> LatencyHistogram:
+        histogram = self._latencies.get((kind, name))
+        if histogram is None:
+            histogram = LatencyHistogram()
+            self._latencies[(kind, name)] = histogram
+        return histogram
@@ -0,0 +1,397 @@
+"""py-staticmaps - tile_pack"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import array
+import bisect
+import mmap
+import os
+import pathlib
+import re
+import struct
+import sys
+import threading
+import typing
+
+import slugify  # type: ignore
+
+from .cache_index import scan_tile_files
+from .tile_cache import TileCache, TileMetadata, tile_data_is_complete
+from .tile_provider import TileProvider
+from .tile_seeder import quadkey
+
+PACK_MAGIC = b"SMTPACK1"
+PACK_HEADER = struct.Struct("<8sBBBxIQ")
+"""magic, big-endian index flag, minimum zoom, maximum zoom, number of tiles, offset of the index"""
+PACK_FILE_NAME_RE = re.compile(r"^(?P<provider>[^.]+)\.(?P<min_zoom>\d+)-(?P<max_zoom>\d+)\.pack$")
+MAX_PACK_ZOOM = 29
+
+
+def tile_key(zoom: int, x: int, y: int) -> int:
+    """Return the index key of a tile; keys sort by zoom, x and y
+
+    Parameters:
+        zoom (int): zoom of the tile
+        x (int): x value of the tile
+        y (int): y value of the tile
+
+    Returns:
+        int: 64 bit key of the tile
+    """
+    return (zoom << 58) | (x << 29) | y
+
+
+def pack_file_name(provider: str, min_zoom: int, max_zoom: int) -> str:
+    """Return the file name of a tile pack
+
+    Parameters:
+        provider (str): name of the tile provider
+        min_zoom (int): minimum zoom of the tiles in the pack
+        max_zoom (int): maximum zoom of the tiles in the pack
+
+    Returns:
+        str: file name of the tile pack
+    """
+    return f"{slugify.slugify(provider) or '_'}.{min_zoom}-{max_zoom}.pack"
+
+
+class TilePack:
+    """An immutable file of tiles, memory-mapped for reading
+
+    A pack consists of a header, the concatenated tile data and an index of sorted tile keys with the offsets and
+    lengths of the tiles. Opening a pack maps the file without reading it; looking up a tile is a binary search in
+    the mapped index, and the tile data is returned as a memoryview slice of the mapping, without copying.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, file_name: str) -> None:
+        self._file_name = file_name
+        with open(file_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mtime = os.fstat(f.fileno()).st_mtime
+        magic, big_endian, self._min_zoom, self._max_zoom, count, index_offset = PACK_HEADER.unpack_from(self._mmap)
+        if magic != PACK_MAGIC:
+            raise RuntimeError(f"{file_name} is not a tile pack")
+        if bool(big_endian) != (sys.byteorder == "big"):
+            raise RuntimeError(f"{file_name} was created on a platform with a different byte order")
+        self._view = memoryview(self._mmap)
+        keys_end = index_offset + 8 * count
+        offsets_end = keys_end + 8 * count
+        lengths_end = offsets_end + 4 * count
+        self._keys = self._view[index_offset:keys_end].cast("Q")
+        self._offsets = self._view[keys_end:offsets_end].cast("Q")
+        self._lengths = self._view[offsets_end:lengths_end].cast("I")
+
+    def file_name(self) -> str:
+        """Return the file name of the pack
+
+        Returns:
+            str: file name of the pack
+        """
+        return self._file_name
+
+    def zooms(self) -> typing.Tuple[int, int]:
+        """Return the zoom range of the pack
+
+        Returns:
+            typing.Tuple[int, int]: minimum and maximum zoom of the tiles in the pack
+        """
+        return self._min_zoom, self._max_zoom
+
+    def created(self) -> float:
+        """Return the creation time of the pack
+
+        Returns:
+            float: modification time of the pack file (seconds since the epoch)
+        """
+        return self._mtime
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, zoom: int, x: int, y: int) -> typing.Optional[memoryview]:
+        """Get a tile from the pack
+
+        Parameters:
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[memoryview]: tile data as a slice of the mapped file, or None if the pack has no such tile
+        """
+        i = self._find(zoom, x, y)
+        if i is None:
+            return None
+        start = self._offsets[i]
+        end = start + self._lengths[i]
+        return self._view[start:end]
+
+    def contains(self, zoom: int, x: int, y: int) -> bool:
+        """Check whether the pack has a tile, without referencing the mapped file
+
+        Parameters:
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            bool: does the pack have the tile
+        """
+        return self._find(zoom, x, y) is not None
+
+    def _find(self, zoom: int, x: int, y: int) -> typing.Optional[int]:
+        """Return the position of a tile in the index, or None if the pack has no such tile"""
+        if not self._min_zoom <= zoom <= self._max_zoom:
+            return None
+        key = tile_key(zoom, x, y)
+        i = bisect.bisect_left(self._keys, key)  # type: ignore
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        return i
+
+    def close(self) -> None:
+        """Unmap the pack; raises BufferError while memoryviews of tiles are still referenced"""
+        for view in (self._keys, self._offsets, self._lengths, self._view):
+            view.release()
+        self._mmap.close()
+
+
+class TilePackWriter:
+    """Writes a tile pack; the pack file appears atomically when the writer is closed"""
+
+    def __init__(self, file_name: str, min_zoom: int, max_zoom: int) -> None:
+        if not 0 <= min_zoom <= max_zoom <= MAX_PACK_ZOOM:
+            raise RuntimeError(f"Invalid zoom range of tile pack: {min_zoom}-{max_zoom}")
+        self._file_name = file_name
+        self._temp_file_name = f"{file_name}.{os.getpid()}.tmp"
+        self._min_zoom = min_zoom
+        self._max_zoom = max_zoom
+        self._entries: typing.Dict[int, typing.Tuple[int, int]] = {}
+        pathlib.Path(os.path.dirname(file_name) or ".").mkdir(parents=True, exist_ok=True)
+        self._file = open(self._temp_file_name, "wb")  # pylint: disable=consider-using-with
+        self._file.write(b"\0" * PACK_HEADER.size)
+
+    def __enter__(self) -> "TilePackWriter":
+        return self
+
+    def __exit__(self, exc_type: typing.Any, *args: typing.Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Append a tile to the pack
+
+        Parameters:
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+        if not self._min_zoom <= zoom <= self._max_zoom:
+            raise RuntimeError(f"Zoom {zoom} is outside of the zoom range of the tile pack")
+        offset = self._file.tell()
+        self._file.write(data)
+        self._entries[tile_key(zoom, x, y)] = (offset, len(data))
+
+    def close(self) -> None:
+        """Write the index and publish the pack file"""
+        keys = sorted(self._entries)
+        padding = -self._file.tell() % 8
+        self._file.write(b"\0" * padding)
+        index_offset = self._file.tell()
+        self._file.write(array.array("Q", keys).tobytes())
+        self._file.write(array.array("Q", [self._entries[key][0] for key in keys]).tobytes())
+        self._file.write(array.array("I", [self._entries[key][1] for key in keys]).tobytes())
+        self._file.seek(0)
+        self._file.write(
+            PACK_HEADER.pack(
+                PACK_MAGIC, sys.byteorder == "big", self._min_zoom, self._max_zoom, len(keys), index_offset
+            )
+        )
+        self._file.close()
+        os.replace(self._temp_file_name, self._file_name)
+
+    def abort(self) -> None:
+        """Discard the pack"""
+        self._file.close()
+        try:
+            os.remove(self._temp_file_name)
+        except OSError:
+            pass
+
+
+class TilePackTileCache(TileCache):
+    """A read-only tile cache serving the tile packs "provider.min_zoom-max_zoom.pack" of a directory
+
+    Packs are mapped when a tile of their provider is requested for the first time. Tiles are copied out of the
+    mapped packs, since other cache tiers keep them; use TilePack.get for zero-copy access. Putting tiles is ignored,
+    so the cache can be a tier of a TieredTileCache.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+        self._packs: typing.Dict[str, typing.List[TilePack]] = {}
+        self._lock = threading.Lock()
+
+    def directory(self) -> str:
+        """Return the directory of the tile packs
+
+        Returns:
+            str: directory of the tile packs
+        """
+        return self._directory
+
+    def packs(self, provider: TileProvider) -> typing.List[TilePack]:
+        """Return the tile packs of a tile provider
+
+        Parameters:
+            provider (TileProvider): tile provider
+
+        Returns:
+            typing.List[TilePack]: tile packs of the provider
+        """
+        name = provider.name()
+        packs = self._packs.get(name)
+        if packs is not None:
+            return packs
+        with self._lock:
+            packs = self._packs.get(name)
+            if packs is None:
+                packs = self._open_packs(slugify.slugify(name) or "_")
+                self._packs[name] = packs
+            return packs
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        """Get a tile from the packs of the provider
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[bytes]: tile data, or None if no pack has the tile
+        """
+        for pack in self.packs(provider):
+            data = pack.get(zoom, x, y)
+            if data is not None:
+                # a memoryview kept by another tier (e.g. the memory cache) would keep the pack mapped forever
+                with data:
+                    return bytes(data)
+        return None
+
+    def put(self, provider: TileProvider, zoom: int, x: int, y: int, data: bytes) -> None:
+        """Ignore a tile, since tile packs are immutable
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+            data (bytes): tile data
+        """
+
+    def get_metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Get the metadata of a tile; the fetch time of a tile is the creation time of its pack
+
+        Parameters:
+            provider (TileProvider): tile provider
+            zoom (int): zoom of the tile
+            x (int): x value of the tile
+            y (int): y value of the tile
+
+        Returns:
+            typing.Optional[TileMetadata]: metadata of the tile, or None if no pack has the tile
+        """
+        for pack in self.packs(provider):
+            if pack.contains(zoom, x, y):
+                return TileMetadata(pack.created())
+        return None
+
+    def _open_packs(self, provider_dir: str) -> typing.List[TilePack]:
+        try:
+            file_names = sorted(os.listdir(self._directory))
+        except OSError:
+            return []
+        packs = []
+        for file_name in file_names:
+            match = PACK_FILE_NAME_RE.match(file_name)
+            if match is not None and match.group("provider") == provider_dir:
+                packs.append(TilePack(os.path.join(self._directory, file_name)))
+        return packs
+
+
+def pack_tile_cache(
+    cache_dir: str,
+    output_dir: str,
+    providers: typing.Optional[typing.List[str]] = None,
+    zoom_ranges: typing.Optional[typing.List[typing.Tuple[int, int]]] = None,
+) -> typing.List[str]:
+    """Convert the tile files of a cache directory into tile packs
+
+    Tiles are written in quadkey order per zoom, so tiles close to each other on the map are close to each other in
+    the pack. Negative cache entries and truncated tiles are skipped.
+
+    Parameters:
+        cache_dir (str): cache directory with the layout of FileTileCache
+        output_dir (str): directory of the tile packs
+        providers (typing.Optional[typing.List[str]]): names of the tile providers to convert, defaults to all
+        zoom_ranges (typing.Optional[typing.List[typing.Tuple[int, int]]]): zoom ranges of the packs, defaults to one
+            pack per provider covering all cached zooms
+
+    Returns:
+        typing.List[str]: file names of the written packs
+    """
+    if providers is None:
+        with os.scandir(cache_dir) as entries:
+            provider_dirs = sorted(entry.name for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+    else:
+        provider_dirs = [slugify.slugify(provider) or "_" for provider in providers]
+    written = []
+    for provider_dir in provider_dirs:
+        written.extend(_pack_provider(os.path.join(cache_dir, provider_dir), output_dir, provider_dir, zoom_ranges))
+    return written
+
+
+def _pack_provider(
+    provider_path: str,
+    output_dir: str,
+    provider_dir: str,
+    zoom_ranges: typing.Optional[typing.List[typing.Tuple[int, int]]],
+) -> typing.List[str]:
+    tiles = sorted(
+        (zoom, quadkey(zoom, x, y), x, y, file_name)
+        for zoom, x, y, file_name, _ in scan_tile_files(provider_path)
+        if zoom <= MAX_PACK_ZOOM
+    )
+    if not tiles:
+        return []
+    written = []
+    for min_zoom, max_zoom in zoom_ranges if zoom_ranges is not None else [(tiles[0][0], tiles[-1][0])]:
+        selected = [tile for tile in tiles if min_zoom <= tile[0] <= max_zoom]
+        if not selected:
+            continue
+        file_name = os.path.join(output_dir, pack_file_name(provider_dir, min_zoom, max_zoom))
+        _write_pack(
+            file_name, min_zoom, max_zoom, [(zoom, x, y, tile_file_name) for zoom, _, x, y, tile_file_name in selected]
+        )
+        written.append(file_name)
+    return written
+
+
+def _write_pack(
+    file_name: str, min_zoom: int, max_zoom: int, tiles: typing.List[typing.Tuple[int, int, int, str]]
+) -> None:
+    with TilePackWriter(file_name, min_zoom, max_zoom) as writer:
+        for zoom, x, y, tile_file_name in tiles:
+            try:
+                with open(tile_file_name, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if tile_data_is_complete(data):
+                writer.add(zoom, x, y, data)
@@ -5,10 +5,17 @@
 import string
 import typing
 
+from .rate_limiter import RateLimiter
+
 
 class TileProvider:
-    """A tile provider class with several pre-defined tile providers"""
+    """A tile provider class with several pre-defined tile providers
+
+    Each tile provider owns a rate limiter shared by all downloads from the provider in the process, which bounds the
+    request rate and the number of concurrent requests.
+    """
 
+    # pylint: disable=too-many-instance-attributes
     def __init__(
         self,
         name: str,
@@ -17,6 +24,10 @@ class TileProvider:
         api_key: typing.Optional[str] = None,
         attribution: typing.Optional[str] = None,
         max_zoom: int = 24,
+        max_concurrency: int = 4,
+        ttl: typing.Optional[float] = None,
+        max_rate: typing.Optional[float] = None,
+        burst: typing.Optional[int] = None,
     ) -> None:
         self._name = name
         self._url_pattern = string.Template(url_pattern)
@@ -24,6 +35,9 @@ class TileProvider:
         self._api_key = api_key
         self._attribution = attribution
         self._max_zoom = max_zoom if ((max_zoom is not None) and (max_zoom <= 20)) else 20
+        self._max_concurrency = max(1, max_concurrency)
+        self._ttl = ttl
+        self._rate_limiter = RateLimiter(max_rate, burst, self._max_concurrency)
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, TileProvider):
@@ -47,6 +61,22 @@ class TileProvider:
         """
         self._api_key = key
 
+    def set_ttl(self, ttl: typing.Optional[float]) -> None:
+        """Set the time to live of cached tiles
+
+        Parameters:
+            ttl (typing.Optional[float]): time to live in seconds, None if cached tiles never expire
+        """
+        self._ttl = ttl
+
+    def ttl(self) -> typing.Optional[float]:
+        """Return the time to live of cached tiles
+
+        Returns:
+            typing.Optional[float]: time to live in seconds, None if cached tiles never expire
+        """
+        return self._ttl
+
     def name(self) -> str:
         """Return the name of the tile provider
 
@@ -81,13 +111,55 @@ class TileProvider:
         """
         return self._max_zoom
 
-    def url(self, zoom: int, x: int, y: int) -> typing.Optional[str]:
+    def max_concurrency(self) -> int:
+        """Return the maximum number of concurrent requests to the tile provider
+
+        Returns:
+            int: maximum number of concurrent requests
+        """
+        return self._max_concurrency
+
+    def set_max_rate(self, max_rate: typing.Optional[float], burst: typing.Optional[int] = None) -> None:
+        """Set the maximum request rate to the tile provider
+
+        Parameters:
+            max_rate (typing.Optional[float]): maximum number of requests per second, None for no limit
+            burst (typing.Optional[int]): number of requests that may be sent at once after an idle period
+        """
+        self._rate_limiter.set_max_rate(max_rate, burst)
+
+    def max_rate(self) -> typing.Optional[float]:
+        """Return the maximum request rate to the tile provider
+
+        Returns:
+            typing.Optional[float]: maximum number of requests per second, None for no limit
+        """
+        return self._rate_limiter.max_rate()
+
+    def rate_limiter(self) -> RateLimiter:
+        """Return the rate limiter shared by all downloads from the tile provider
+
+        Returns:
+            RateLimiter: rate limiter of the tile provider
+        """
+        return self._rate_limiter
+
+    def shards(self) -> typing.List[str]:
+        """Return the shards of the tile provider
+
+        Returns:
+            typing.List[str]: values substituted for "$s" in the url pattern, empty if the provider has no shards
+        """
+        return list(self._shards or [])
+
+    def url(self, zoom: int, x: int, y: int, shard: typing.Optional[str] = None) -> typing.Optional[str]:
         """Return the url of the tile provider
 
         Parameters:
             zoom (int): zoom for static map
             x (int): x value of center for the static map
             y (int): y value of center for the static map
+            shard (typing.Optional[str]): shard to use, defaults to a shard chosen by x and y
 
         Returns:
             typing.Optional[str]: url with zoom, x and y values
@@ -96,8 +168,7 @@ class TileProvider:
             return None
         if (zoom < 0) or (zoom > self._max_zoom):
             return None
-        shard = None
-        if self._shards is not None and len(self._shards) > 0:
+        if shard is None and self._shards is not None and len(self._shards) > 0:
             shard = self._shards[(x + y) % len(self._shards)]
         return self._url_pattern.substitute(s=shard, z=zoom, x=x, y=y, k=self._api_key)
 
@@ -109,6 +180,7 @@ tile_provider_OSM = TileProvider(
     shards=["a", "b", "c"],
     attribution="Maps & Data (C) OpenStreetMap.org contributors",
     max_zoom=19,
+    max_concurrency=2,
 )
 
 tile_provider_StamenTerrain = TileProvider(
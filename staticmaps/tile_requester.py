@@ -0,0 +1,360 @@
+"""py-staticmaps - tile_requester"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import email.utils
+import random
+import threading
+import time
+import typing
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests  # type: ignore
+
+from .circuit_breaker import CIRCUIT_CLOSED, CircuitBreaker, CircuitOpenError
+from .meta import GITHUB_URL, LIB_NAME, VERSION
+from .session_pool import SessionPool, default_session_pool
+from .shard_selector import ShardSelector
+from .tile_cache import TileMetadata
+from .tile_metrics import TileEvent, TileMetrics, TileObserverT
+from .tile_provider import TileProvider
+
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 10.0
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30.0
+
+T = typing.TypeVar("T")
+
+
+class TileRequester:
+    """Base class of the tile downloaders sending the tile requests
+
+    Requests are routed to the healthiest shards, retried with backoff, hedged if they are slow, and skipped while
+    the circuit of the tile provider is open.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self) -> None:
+        super().__init__()
+        self._user_agent = f"Mozilla/5.0+(compatible; {LIB_NAME}/{VERSION}; {GITHUB_URL})"
+        self._session_pool = default_session_pool
+        self._connect_timeout = CONNECT_TIMEOUT
+        self._read_timeout = READ_TIMEOUT
+        self._max_retries = MAX_RETRIES
+        self._backoff_base = BACKOFF_BASE
+        self._backoff_max = BACKOFF_MAX
+        self._metrics = TileMetrics()
+        self._shard_selector: typing.Optional[ShardSelector] = ShardSelector()
+        self._observers: typing.List[TileObserverT] = [self._metrics, self._shard_selector]
+        self._hedge_percentile: typing.Optional[float] = None
+        self._hedge_executor: typing.Optional[ThreadPoolExecutor] = None
+        self._hedge_lock = threading.Lock()
+        self._circuit_failure_threshold: typing.Optional[int] = CIRCUIT_FAILURE_THRESHOLD
+        self._circuit_reset_timeout = CIRCUIT_RESET_TIMEOUT
+        self._circuit_breakers: typing.Dict[str, CircuitBreaker] = {}
+
+    def set_user_agent(self, user_agent: str) -> None:
+        """Set the user agent for the downloader
+
+        Parameters:
+            user_agent (str): user agent
+        """
+        self._user_agent = user_agent
+
+    def set_session_pool(self, session_pool: SessionPool) -> None:
+        """Set the pool of http sessions used for downloading tiles
+
+        By default, all downloaders share one process-wide session pool.
+
+        Parameters:
+            session_pool (SessionPool): pool of http sessions
+        """
+        self._session_pool = session_pool
+
+    def metrics(self) -> TileMetrics:
+        """Return the metrics of the tile lookups and requests of the downloader
+
+        Returns:
+            TileMetrics: metrics of the downloader; call snapshot() for the current counters and histograms
+        """
+        return self._metrics
+
+    def add_observer(self, observer: TileObserverT) -> None:
+        """Add an observer called with each tile lookup and request, e.g. to feed a metrics system
+
+        Observers are called synchronously by the fetching threads, so they must be fast and must not raise.
+
+        Parameters:
+            observer (TileObserverT): callable receiving TileEvent objects
+        """
+        self._observers = self._observers + [observer]
+
+    def remove_observer(self, observer: TileObserverT) -> None:
+        """Remove an observer
+
+        Parameters:
+            observer (TileObserverT): observer added by add_observer
+        """
+        self._observers = [o for o in self._observers if o != observer]
+
+    def set_shard_selector(self, shard_selector: typing.Optional[ShardSelector]) -> None:
+        """Set the selector routing requests to the healthiest shards of the tile providers
+
+        By default, each downloader tracks the health of the shards with its own selector.
+
+        Parameters:
+            shard_selector (typing.Optional[ShardSelector]): shard selector, None selects shards by x and y only
+        """
+        if self._shard_selector is not None:
+            self.remove_observer(self._shard_selector)
+        self._shard_selector = shard_selector
+        if shard_selector is not None:
+            self.add_observer(shard_selector)
+
+    def set_hedging(self, percentile: typing.Optional[float]) -> None:
+        """Set whether slow requests are hedged with a duplicate request to another shard
+
+        A request still running after the given latency percentile of the tile provider is duplicated to the next
+        healthiest shard; the first response wins, and the other request is cancelled (or its response discarded if
+        it is already running). Hedging needs a shard selector and providers with several shards.
+
+        Parameters:
+            percentile (typing.Optional[float]): latency percentile between 0 and 1 (e.g. 0.95), None disables hedging
+        """
+        self._hedge_percentile = percentile
+
+    def set_circuit_breaker(
+        self, failure_threshold: typing.Optional[int], reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ) -> None:
+        """Set when the circuit breakers of the tile providers open
+
+        After the given number of consecutive failed requests (connection errors, timeouts and the statuses 429,
+        500, 502, 503 and 504, each after its retries) the circuit of the tile provider opens: requests fail fast
+        with a CircuitOpenError, so tiles are served from the cache, synthesized or left out instead. After the reset
+        timeout, a single probe request closes the circuit again if it succeeds.
+
+        Parameters:
+            failure_threshold (typing.Optional[int]): consecutive failures opening the circuit, None disables the
+                circuit breakers
+            reset_timeout (float): seconds until an open circuit lets a probe request through
+        """
+        self._circuit_failure_threshold = failure_threshold
+        self._circuit_reset_timeout = reset_timeout
+        self._circuit_breakers.clear()
+
+    def circuit_breaker(self, provider: TileProvider) -> typing.Optional[CircuitBreaker]:
+        """Return the circuit breaker of a tile provider
+
+        Parameters:
+            provider (TileProvider): tile provider
+
+        Returns:
+            typing.Optional[CircuitBreaker]: circuit breaker, or None if circuit breakers are disabled
+        """
+        if self._circuit_failure_threshold is None:
+            return None
+        breaker = self._circuit_breakers.get(provider.name())
+        if breaker is None:
+            breaker = self._circuit_breakers.setdefault(
+                provider.name(), CircuitBreaker(self._circuit_failure_threshold, self._circuit_reset_timeout)
+            )
+        return breaker
+
+    def _notify(self, event: TileEvent) -> None:
+        for observer in self._observers:
+            observer(event)
+
+    def set_timeouts(self, connect_timeout: float, read_timeout: float) -> None:
+        """Set the timeouts for downloading tiles
+
+        Parameters:
+            connect_timeout (float): timeout for establishing a connection in seconds
+            read_timeout (float): timeout for receiving data from the server in seconds
+        """
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+
+    def set_retries(
+        self, max_retries: int, backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX
+    ) -> None:
+        """Set how failed requests are retried
+
+        Connection errors, timeouts and the statuses 429, 500, 502, 503 and 504 are retried with exponential backoff
+        and full jitter. A Retry-After header of the response replaces the backoff and pauses all requests to the tile
+        provider; a Retry-After exceeding the maximum backoff ends the retries.
+
+        Parameters:
+            max_retries (int): maximum number of retries per tile, 0 disables retries
+            backoff_base (float): backoff before the first retry in seconds, doubled for each further retry
+            backoff_max (float): maximum backoff in seconds
+        """
+        self._max_retries = max(0, max_retries)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+
+    def _urls(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.List[str]:
+        """Return the urls of a tile, the url to request first in front"""
+        if self._shard_selector is not None:
+            return self._shard_selector.urls(provider, zoom, x, y)
+        url = provider.url(zoom, x, y)
+        return [url] if url is not None else []
+
+    def _headers(self, metadata: typing.Optional[TileMetadata]) -> typing.Dict[str, str]:
+        """Return the request headers, making the request conditional if the metadata of a stale tile is given"""
+        headers = {"user-agent": self._user_agent}
+        if metadata is not None and metadata.etag:
+            headers["if-none-match"] = metadata.etag
+        if metadata is not None and metadata.last_modified:
+            headers["if-modified-since"] = metadata.last_modified
+        return headers
+
+    def _request(
+        self, provider: TileProvider, zoom: int, urls: typing.List[str], headers: typing.Dict[str, str]
+    ) -> requests.Response:
+        """Send a request unless the circuit of the tile provider is open, and record its outcome in the circuit"""
+        breaker = self.circuit_breaker(provider)
+        if breaker is None:
+            return self._request_with_retries(provider, zoom, urls, headers)
+        if not self._update_circuit(provider, zoom, breaker, breaker.allow):
+            raise CircuitOpenError(f"fetch {urls[0]} skipped since the circuit of {provider.name()} is open")
+        try:
+            res = self._request_with_retries(provider, zoom, urls, headers)
+        except requests.RequestException:
+            self._update_circuit(provider, zoom, breaker, breaker.record_failure)
+            raise
+        if res.status_code in RETRY_STATUS_CODES:
+            self._update_circuit(provider, zoom, breaker, breaker.record_failure)
+        else:
+            self._update_circuit(provider, zoom, breaker, breaker.record_success)
+        return res
+
+    def _update_circuit(
+        self, provider: TileProvider, zoom: int, breaker: CircuitBreaker, update: typing.Callable[[], T]
+    ) -> T:
+        """Update a circuit breaker, notifying the observers if its state changes"""
+        state = breaker.state()
+        result = update()
+        if breaker.state() != state:
+            self._notify(
+                TileEvent(
+                    "circuit", provider.name(), zoom, breaker.state() == CIRCUIT_CLOSED, 0.0, state=breaker.state()
+                )
+            )
+        return result
+
+    def _request_with_retries(
+        self, provider: TileProvider, zoom: int, urls: typing.List[str], headers: typing.Dict[str, str]
+    ) -> requests.Response:
+        """Send a request within the rate limits of the tile provider, retrying transient failures at other shards"""
+        rate_limiter = provider.rate_limiter()
+        attempt = 0
+        while True:
+            try:
+                res = self._attempt(provider, zoom, urls, headers)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self._max_retries:
+                    raise
+            else:
+                if res.status_code not in RETRY_STATUS_CODES or attempt >= self._max_retries:
+                    return res
+                retry_after = self._retry_after(res)
+                if retry_after is not None:
+                    if retry_after > self._backoff_max:
+                        return res
+                    # the server asks all clients to back off, so hold back all requests to the provider
+                    rate_limiter.pause(retry_after)
+                    attempt += 1
+                    urls = urls[1:] + urls[:1]
+                    continue
+            time.sleep(random.uniform(0, min(self._backoff_max, self._backoff_base * 2**attempt)))
+            attempt += 1
+            urls = urls[1:] + urls[:1]
+
+    def _attempt(
+        self, provider: TileProvider, zoom: int, urls: typing.List[str], headers: typing.Dict[str, str]
+    ) -> requests.Response:
+        """Send a request to the first url, hedged with a request to the second url if it is slow"""
+        delay = None
+        if self._hedge_percentile is not None and self._shard_selector is not None and len(urls) > 1:
+            delay = self._shard_selector.hedge_delay(provider, self._hedge_percentile)
+        if delay is None:
+            with provider.rate_limiter().slot():
+                return self._send(provider, zoom, urls[0], headers)
+
+        def send(url: str) -> requests.Response:
+            with provider.rate_limiter().slot():
+                return self._send(provider, zoom, url, headers)
+
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tile-hedge")
+            executor = self._hedge_executor
+        first = executor.submit(send, urls[0])
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        pending = {first, executor.submit(send, urls[1])}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None or not pending:
+                break
+        for loser in pending:
+            if not loser.cancel():
+                loser.add_done_callback(_close_response)
+        return (winner or first).result()
+
+    def _send(self, provider: TileProvider, zoom: int, url: str, headers: typing.Dict[str, str]) -> requests.Response:
+        """Send a single request, notifying the observers of its outcome"""
+        shard = urllib.parse.urlsplit(url).netloc
+        start = time.monotonic()
+        try:
+            res = self._session_pool.session(url).get(
+                url, headers=headers, timeout=(self._connect_timeout, self._read_timeout)
+            )
+        except requests.RequestException as e:
+            self._notify(
+                TileEvent("network", provider.name(), zoom, False, time.monotonic() - start, 0, shard, type(e).__name__)
+            )
+            raise
+        hit = res.status_code in (200, 304)
+        self._notify(
+            TileEvent(
+                "network",
+                provider.name(),
+                zoom,
+                hit,
+                time.monotonic() - start,
+                len(res.content),
+                shard,
+                None if hit else str(res.status_code),
+            )
+        )
+        return res
+
+    @staticmethod
+    def _retry_after(res: requests.Response) -> typing.Optional[float]:
+        """Return the delay requested by the Retry-After header in seconds, or None if there is none"""
+        value = res.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _close_response(future: Future) -> None:
+    """Release the connection of a response nobody waits for"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,208 @@
+"""py-staticmaps - tile_seeder"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import s2sphere  # type: ignore
+
+from .tile_downloader import TileDownloader
+from .tile_provider import TileProvider
+from .transformer import Transformer
+
+
+def quadkey(zoom: int, x: int, y: int) -> str:
+    """Return the quadkey of a tile
+
+    Tiles sorted by quadkey follow a Z-order curve, so consecutive tiles are close to each other.
+
+    Parameters:
+        zoom (int): zoom of the tile
+        x (int): x value of the tile
+        y (int): y value of the tile
+
+    Returns:
+        str: quadkey of the tile
+    """
+    digits = []
+    for i in range(zoom, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+class SeedProgress(typing.NamedTuple):
+    """Progress of seeding a tile cache"""
+
+    total: int
+    """number of tiles to seed"""
+    fetched: int = 0
+    """number of fetched tiles"""
+    skipped: int = 0
+    """number of tiles skipped since they were cached already or failed recently"""
+    failed: int = 0
+    """number of tiles that could not be fetched"""
+    fetched_bytes: int = 0
+    """size of the fetched tiles in bytes"""
+    elapsed: float = 0.0
+    """elapsed time in seconds"""
+
+    def done(self) -> int:
+        """Return the number of processed tiles
+
+        Returns:
+            int: number of fetched, skipped and failed tiles
+        """
+        return self.fetched + self.skipped + self.failed
+
+    def tiles_per_second(self) -> float:
+        """Return the fetch throughput
+
+        Returns:
+            float: fetched tiles per second
+        """
+        return self.fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class TileSeeder:
+    """Fills a tile cache with all tiles of a rectangle and zoom range
+
+    Tiles are requested zoom by zoom in quadkey order. Tiles already in the cache are skipped, so an interrupted
+    seeding run resumes where it stopped; failed tiles are retried once their negative cache entries expired.
+    Requests go through the tile downloader, so they respect the rate limits of the tile provider.
+    """
+
+    def __init__(self, downloader: TileDownloader, provider: TileProvider, cache_dir: str) -> None:
+        self._downloader = downloader
+        self._provider = provider
+        self._cache_dir = cache_dir
+
+    @staticmethod
+    def tiles(rect: s2sphere.LatLngRect, min_zoom: int, max_zoom: int) -> typing.Iterator[typing.Tuple[int, int, int]]:
+        """Iterate over the tiles covering a rectangle, zoom by zoom in quadkey order
+
+        Parameters:
+            rect (s2sphere.LatLngRect): rectangle
+            min_zoom (int): minimum zoom
+            max_zoom (int): maximum zoom
+
+        Returns:
+            typing.Iterator[typing.Tuple[int, int, int]]: zoom, x and y of the tiles
+        """
+        for zoom in range(min_zoom, max_zoom + 1):
+            number_of_tiles = 2**zoom
+            x_min, y_min, x_max, y_max = Transformer.tile_bounds(rect, zoom)
+            tiles = sorted(
+                (quadkey(zoom, x % number_of_tiles, y), x % number_of_tiles, y)
+                for x in range(x_min, x_max + 1)
+                for y in range(y_min, y_max + 1)
+            )
+            for _, x, y in tiles:
+                yield zoom, x, y
+
+    @staticmethod
+    def count(rect: s2sphere.LatLngRect, min_zoom: int, max_zoom: int) -> int:
+        """Return the number of tiles covering a rectangle
+
+        Parameters:
+            rect (s2sphere.LatLngRect): rectangle
+            min_zoom (int): minimum zoom
+            max_zoom (int): maximum zoom
+
+        Returns:
+            int: number of tiles
+        """
+        total = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            x_min, y_min, x_max, y_max = Transformer.tile_bounds(rect, zoom)
+            total += (x_max - x_min + 1) * (y_max - y_min + 1)
+        return total
+
+    def seed(
+        self,
+        rect: s2sphere.LatLngRect,
+        min_zoom: int,
+        max_zoom: int,
+        concurrency: typing.Optional[int] = None,
+        progress: typing.Optional[typing.Callable[[SeedProgress], None]] = None,
+        progress_interval: float = 1.0,
+    ) -> SeedProgress:
+        """Fetch all tiles covering a rectangle into the cache
+
+        Parameters:
+            rect (s2sphere.LatLngRect): rectangle
+            min_zoom (int): minimum zoom
+            max_zoom (int): maximum zoom
+            concurrency (typing.Optional[int]): number of concurrent fetches, defaults to the maximum concurrency of
+                the tile provider (which also bounds the requests of larger values)
+            progress (typing.Optional[typing.Callable[[SeedProgress], None]]): called with the current progress
+                every progress_interval seconds and once at the end
+            progress_interval (float): seconds between two progress reports
+
+        Returns:
+            SeedProgress: final progress
+        """
+        max_zoom = min(max_zoom, self._provider.max_zoom())
+        concurrency = max(1, concurrency if concurrency is not None else self._provider.max_concurrency())
+        cache = self._downloader.tile_cache(self._cache_dir)
+        run = _SeedRun(self.count(rect, min_zoom, max_zoom), progress, progress_interval)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tile-seed") as executor:
+            for zoom, x, y in self.tiles(rect, min_zoom, max_zoom):
+                if not self._downloader.needs_fetch(self._provider, self._cache_dir, zoom, x, y):
+                    run.skipped += 1
+                else:
+                    # keep the number of queued fetches bounded, so huge areas do not exhaust the memory
+                    run.wait(2 * concurrency - 1)
+                    run.pending.add(executor.submit(self._downloader.get, self._provider, self._cache_dir, zoom, x, y))
+                run.report()
+            run.wait(0)
+        if cache is not None:
+            cache.flush()
+        result = run.progress()
+        if progress is not None:
+            progress(result)
+        return result
+
+
+class _SeedRun:
+    """Counters and pending fetches of a running seed"""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self, total: int, progress: typing.Optional[typing.Callable[[SeedProgress], None]], progress_interval: float
+    ) -> None:
+        self.total = total
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+        self.fetched_bytes = 0
+        self.pending: typing.Set[Future] = set()
+        self.start = time.monotonic()
+        self._progress = progress
+        self._progress_interval = progress_interval
+        self._last_report = self.start
+
+    def wait(self, max_pending: int) -> None:
+        """Wait until at most max_pending fetches are pending"""
+        while len(self.pending) > max_pending:
+            completed, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                try:
+                    data = future.result()
+                except Exception:  # pylint: disable=broad-except
+                    self.failed += 1
+                else:
+                    self.fetched += 1
+                    self.fetched_bytes += len(data or b"")
+
+    def report(self) -> None:
+        if self._progress is not None and time.monotonic() - self._last_report >= self._progress_interval:
+            self._last_report = time.monotonic()
+            self._progress(self.progress())
+
+    def progress(self) -> SeedProgress:
+        return SeedProgress(
+            self.total, self.fetched, self.skipped, self.failed, self.fetched_bytes, time.monotonic() - self.start
+        )
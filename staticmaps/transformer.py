@@ -7,6 +7,9 @@ import typing
 
 import s2sphere  # type: ignore
 
+MAX_LATITUDE = 85.0511287798
+"""maximum latitude covered by web mercator tiles"""
+
 
 # pylint: disable=too-many-instance-attributes
 class Transformer:
@@ -119,6 +122,26 @@ class Transformer:
         """
         return self._tiles_y
 
+    def tiles(self) -> typing.List[typing.Tuple[int, int, int, int]]:
+        """Return all valid tiles covering the requested area
+
+        Tiles outside the valid vertical range are skipped, the horizontal tile index is wrapped around the
+        antimeridian.
+
+        Returns:
+            typing.List[typing.Tuple[int, int, int, int]]: list of (column, row, x, y), where column and row are the
+            position of the tile in the tile grid and x and y are the tile coordinates
+        """
+        result = []
+        for yy in range(0, self._tiles_y):
+            y = self._first_tile_y + yy
+            if y < 0 or y >= self._number_of_tiles:
+                continue
+            for xx in range(0, self._tiles_x):
+                x = (self._first_tile_x + xx) % self._number_of_tiles
+                result.append((xx, yy, x, y))
+        return result
+
     def tile_offset_x(self) -> float:
         """Return tile offset in x
 
@@ -157,6 +180,35 @@ class Transformer:
         lng = latlng.lng().radians
         return lng / (2 * math.pi) + 0.5, (1 - math.log(math.tan(lat) + (1 / math.cos(lat))) / math.pi) / 2
 
+    @staticmethod
+    def tile_bounds(rect: s2sphere.LatLngRect, zoom: int) -> typing.Tuple[int, int, int, int]:
+        """Return the tiles of the given zoom covering a rectangle
+
+        Parameters:
+            rect (s2sphere.LatLngRect): rectangle
+            zoom (int): zoom of the tiles
+
+        Returns:
+            typing.Tuple[int, int, int, int]: x and y of the top-left tile and x and y of the bottom-right tile (all
+            inclusive); if the rectangle crosses the antimeridian, the right x value exceeds the number of tiles and
+            has to be wrapped around
+        """
+        number_of_tiles = 2**zoom
+
+        def tile(lat: float, lng: float) -> typing.Tuple[int, int]:
+            lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+            x, y = Transformer.mercator(s2sphere.LatLng.from_degrees(lat, lng))
+            return (
+                min(number_of_tiles - 1, max(0, int(x * number_of_tiles))),
+                min(number_of_tiles - 1, max(0, int(y * number_of_tiles))),
+            )
+
+        x_min, y_min = tile(rect.lat_hi().degrees, rect.lng_lo().degrees)
+        x_max, y_max = tile(rect.lat_lo().degrees, rect.lng_hi().degrees)
+        if rect.lng().is_inverted():
+            x_max = min(x_max + number_of_tiles, x_min + number_of_tiles - 1)
+        return x_min, y_min, x_max, y_max
+
     @staticmethod
     def mercator_inv(x: float, y: float) -> s2sphere.LatLng:
         """Inverse Mercator projection
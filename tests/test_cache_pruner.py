@@ -0,0 +1,129 @@
+"""py-staticmaps - Test CachePruner"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import pathlib
+import sqlite3
+
+import staticmaps
+from staticmaps import cli
+
+PROVIDER = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+
+
+def test_access_index_records_puts_and_hits(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path), access_index=True)
+    cache.put(PROVIDER, 3, 1, 2, b"tile")
+    cache.put(PROVIDER, 3, 2, 2, b"other tile")
+    assert cache.get(PROVIDER, 3, 1, 2) == b"tile"
+    cache.flush()
+
+    index = staticmaps.CacheIndex(str(tmp_path))
+    assert index.providers() == ["test"]
+    assert index.usage("test") == (2, 14)
+    assert [tile[:3] for tile in index.candidates("test", "lfu")] == [(3, 2, 2), (3, 1, 2)]
+
+
+def test_access_index_records_memory_hits(tmp_path: pathlib.Path) -> None:
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(staticmaps.MemoryTileCache())
+    cache = downloader.tile_cache(str(tmp_path))
+    assert isinstance(cache, staticmaps.FileTileCache) and cache.access_index() is None
+    downloader.set_access_index(True)
+    cache = downloader.tile_cache(str(tmp_path))
+    assert isinstance(cache, staticmaps.FileTileCache)
+    cache.put(PROVIDER, 3, 1, 2, b"tile")
+    cache.put(PROVIDER, 3, 2, 2, b"tile")
+    for _ in range(3):
+        assert downloader.get_cached(PROVIDER, str(tmp_path), 3, 1, 2) == b"tile"
+    cache.flush()
+
+    # the first hit came from the file, the others from the memory cache
+    assert [tile[:3] for tile in staticmaps.CacheIndex(str(tmp_path)).candidates("test", "lfu")] == [
+        (3, 2, 2),
+        (3, 1, 2),
+    ]
+    connection = sqlite3.connect(os.path.join(str(tmp_path), staticmaps.cache_index.INDEX_FILE_NAME))
+    assert connection.execute("SELECT hits FROM tiles WHERE x = 1").fetchone() == (3,)
+    connection.close()
+
+
+def test_prune_evicts_least_recently_used(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path), access_index=True)
+    for x in range(4):
+        cache.put(PROVIDER, 3, x, 0, b"0123456789")
+    cache.get(PROVIDER, 3, 0, 0)
+    cache.flush()
+
+    pruner = staticmaps.CachePruner(str(tmp_path), 25)
+    result = pruner.prune(batch_size=1)
+
+    assert result["test"] == {"removed_tiles": 2, "removed_bytes": 20, "tiles": 2, "bytes": 20}
+    assert cache.contains(PROVIDER, 3, 0, 0)
+    assert cache.contains(PROVIDER, 3, 3, 0)
+    assert not cache.contains(PROVIDER, 3, 1, 0)
+    assert staticmaps.CacheIndex(str(tmp_path)).usage("test") == (2, 20)
+
+
+def test_prune_keeps_pinned_tiles(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path), access_index=True)
+    cache.put(PROVIDER, 2, 0, 0, b"low zoom")
+    cache.put(PROVIDER, 10, 550, 335, b"berlin")
+    cache.put(PROVIDER, 10, 0, 0, b"elsewhere")
+    cache.flush()
+
+    pruner = staticmaps.CachePruner(str(tmp_path), 0)
+    pruner.pin_zooms(0, 5)
+    pruner.pin_region(staticmaps.parse_latlngs2rect("52.3,13.0 52.7,13.8"), 8, 12)
+    pruner.prune()
+
+    assert cache.contains(PROVIDER, 2, 0, 0)
+    assert cache.contains(PROVIDER, 10, 550, 335)
+    assert not cache.contains(PROVIDER, 10, 0, 0)
+
+
+def test_prune_scans_unindexed_tiles(tmp_path: pathlib.Path) -> None:
+    tile = tmp_path / "test" / "3" / "1" / "2.png"
+    tile.parent.mkdir(parents=True)
+    tile.write_bytes(b"tile")
+
+    pruner = staticmaps.CachePruner(str(tmp_path))
+    pruner.set_max_bytes(0, "test")
+    assert pruner.prune()["test"]["removed_tiles"] == 1
+    assert not os.path.exists(tile)
+
+
+def test_prune_counts_tiles_written_after_the_last_prune(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path))
+    for x in range(3):
+        cache.put(PROVIDER, 3, x, 0, b"0123456789")
+
+    pruner = staticmaps.CachePruner(str(tmp_path), 25)
+    assert pruner.prune()["test"]["tiles"] == 2
+
+    for x in range(4):
+        cache.put(PROVIDER, 3, x, 1, b"0123456789")
+    result = pruner.prune()["test"]
+    assert result["removed_tiles"] == 4 and result["tiles"] == 2
+    assert sum(1 for _ in staticmaps.cache_index.scan_tile_files(str(tmp_path / "test"))) == 2
+
+
+def test_cache_prune_command(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path), access_index=True)
+    cache.put(PROVIDER, 3, 1, 2, b"tile")
+    cache.put(PROVIDER, 5, 1, 2, b"tile")
+    cache.flush()
+
+    cli.cache_main(["prune", "--cache-dir", str(tmp_path), "--max-size", "1K", "--provider-max-size", "test=0"])
+
+    assert not cache.contains(PROVIDER, 3, 1, 2)
+    assert not cache.contains(PROVIDER, 5, 1, 2)
+
+
+def test_parse_size() -> None:
+    assert cli.parse_size("512") == 512
+    assert cli.parse_size("2K") == 2048
+    assert cli.parse_size("1.5GB") == 1536 * 1024 * 1024
+    assert cli.parse_zoom_range("5-15") == (5, 15)
+    assert cli.parse_zoom_range("8") == (8, 8)
@@ -0,0 +1,51 @@
+"""py-staticmaps - Test CircuitBreaker"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import pathlib
+import time
+
+import pytest  # type: ignore
+
+import staticmaps
+
+from .tile_server import TileServer
+
+
+def test_circuit_breaker_fails_fast_and_recovers(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.default_response = (503, b"", {})
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        downloader.set_negative_ttl(None)
+        downloader.set_retries(0)
+        downloader.set_circuit_breaker(2, reset_timeout=0.2)
+
+        for x in range(2):
+            with pytest.raises(RuntimeError, match="yields 503"):
+                downloader.get(provider, str(tmp_path), 3, x, 0)
+        with pytest.raises(staticmaps.CircuitOpenError):
+            downloader.get(provider, str(tmp_path), 3, 2, 0)
+        assert len(server.requests) == 2
+        breaker = downloader.circuit_breaker(provider)
+        assert breaker is not None and breaker.state() == "open"
+        assert downloader.metrics().snapshot()["circuits"] == {"test": {"state": "open", "opened": 1}}
+
+        time.sleep(0.25)
+        server.default_response = (200, b"tile", {})
+        assert downloader.get(provider, str(tmp_path), 3, 2, 0) == b"tile"
+        assert breaker.state() == "closed"
+        assert downloader.metrics().snapshot()["circuits"]["test"]["state"] == "closed"
+
+
+def test_circuit_breaker_probe_reopens_circuit() -> None:
+    breaker = staticmaps.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state() == "half-open" and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open" and not breaker.allow()
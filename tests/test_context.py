@@ -3,12 +3,22 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+import asyncio
+import io
+import pathlib
+import random
+import threading
+import time
+import typing
+
 import pytest  # type: ignore
 import s2sphere  # type: ignore
+from PIL import Image as PIL_Image  # type: ignore
 
 import staticmaps
 
 from .mock_tile_downloader import MockTileDownloader
+from .tile_server import TileServer
 
 
 def test_add_marker_adds_bounds_is_point() -> None:
@@ -179,3 +189,158 @@ def test_render_with_center_without_zoom_sets_zoom_15() -> None:
     context.set_center(staticmaps.create_latlng(48, 8))
     context.render_svg(200, 100)
     assert context.determine_center_zoom(200, 100) == (staticmaps.create_latlng(48, 8), 15)
+
+
+def test_render_async_matches_render() -> None:
+    context = staticmaps.Context()
+    context.set_tile_downloader(MockTileDownloader())
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8)))
+
+    image = asyncio.run(context.render_pillow_async(200, 100))
+    assert image.tobytes() == context.render_pillow(200, 100).tobytes()
+    svg = asyncio.run(context.render_svg_async(200, 100))
+    assert svg.tostring() == context.render_svg(200, 100).tostring()
+
+
+class SlowTileDownloader(staticmaps.TileDownloader):
+    def get(
+        self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        time.sleep(random.uniform(0.0, 0.01))
+        output = io.BytesIO()
+        PIL_Image.new("RGBA", (256, 256), (x % 256, y % 256, zoom, 255)).save(output, format="PNG")
+        return output.getvalue()
+
+
+def test_pipelined_render_matches_render() -> None:
+    context = staticmaps.Context()
+    context.set_tile_downloader(SlowTileDownloader())
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    line = [staticmaps.create_latlng(47.99, 7.99), staticmaps.create_latlng(48.01, 8.01)]
+    context.add_object(staticmaps.Line(line))
+    context.add_object(staticmaps.Area(line + [staticmaps.create_latlng(48.01, 7.99)]))
+
+    image = context.render_pillow(500, 300)
+    svg = context.render_svg(500, 300)
+    context.set_pipelined_render(True)
+    assert context.render_pillow(500, 300).tobytes() == image.tobytes()
+    assert context.render_svg(500, 300).tostring() == svg.tostring()
+    assert not context.degraded_tiles()
+
+
+def test_parallel_decoding_matches_serial_decoding(monkeypatch: pytest.MonkeyPatch) -> None:
+    context = staticmaps.Context()
+    context.set_tile_downloader(SlowTileDownloader())
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8)))
+    image = context.render_pillow(500, 300)
+
+    threads = set()
+    create_image = staticmaps.PillowRenderer.create_image
+
+    def recording_create_image(image_data: bytes) -> PIL_Image.Image:
+        threads.add(threading.current_thread().name)
+        return create_image(image_data)
+
+    monkeypatch.setattr(staticmaps.PillowRenderer, "create_image", staticmethod(recording_create_image))
+    staticmaps.PillowRenderer.decoded_tile_cache().clear()
+    context.set_decode_workers(4)
+    assert context.render_pillow(500, 300).tobytes() == image.tobytes()
+    assert threads and all(name.startswith("tile-decode") for name in threads)
+
+    context.set_pipelined_render(True)
+    assert context.render_pillow(500, 300).tobytes() == image.tobytes()
+
+
+def test_degraded_tiles_are_reported_per_thread() -> None:
+    released = threading.Event()
+
+    class BlockingTileDownloader(SlowTileDownloader):
+        def get(
+            self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+        ) -> typing.Optional[bytes]:
+            released.wait(5)
+            return super().get(provider, cache_dir, zoom, x, y)
+
+    context = staticmaps.Context()
+    context.set_tile_downloader(BlockingTileDownloader())
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    cancelled_render_done = threading.Event()
+    other_render_done = threading.Event()
+    reports: typing.Dict[str, typing.List[staticmaps.DegradedTile]] = {}
+
+    def render_cancelled() -> None:
+        cancellation = staticmaps.CancellationToken()
+        cancellation.cancel()
+        context.render_pillow(300, 200, cancellation)
+        cancelled_render_done.set()
+        other_render_done.wait(5)
+        reports["cancelled"] = context.degraded_tiles()
+
+    def render() -> None:
+        context.render_pillow(300, 200)
+        reports["complete"] = context.degraded_tiles()
+
+    cancelled_thread = threading.Thread(target=render_cancelled)
+    cancelled_thread.start()
+    assert cancelled_render_done.wait(5)
+    released.set()
+    other_thread = threading.Thread(target=render)
+    other_thread.start()
+    other_thread.join()
+    other_render_done.set()
+    cancelled_thread.join()
+
+    assert reports["cancelled"] and all(tile.reason == "cancelled" for tile in reports["cancelled"])
+    assert not reports["complete"]
+    assert not context.degraded_tiles()
+
+
+def test_failed_tiles_do_not_abort_the_render(tmp_path: pathlib.Path) -> None:
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(None)
+    downloader.set_retries(0)
+    context = staticmaps.Context()
+    context.set_tile_downloader(downloader)
+    # nothing listens on port 1, so every connection is refused
+    context.set_tile_provider(staticmaps.TileProvider("unreachable", url_pattern="http://127.0.0.1:1/$z/$x/$y.png"))
+    context.set_cache_dir(str(tmp_path))
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.set_background_color(staticmaps.RED)
+
+    image = context.render_pillow(300, 200, staticmaps.CancellationToken(timeout=2))
+
+    assert image.getpixel((150, 100)) == staticmaps.RED.int_rgba()
+    degraded = context.degraded_tiles()
+    assert degraded and all(tile.reason == "failed" and not tile.filled for tile in degraded)
+
+
+def test_corrupt_cached_tiles_are_downloaded_again(tmp_path: pathlib.Path) -> None:
+    tile = io.BytesIO()
+    PIL_Image.new("RGBA", (256, 256), staticmaps.GREEN.int_rgba()).save(tile, format="PNG")
+    with TileServer() as server:
+        server.default_response = (200, tile.getvalue(), {})
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        context = staticmaps.Context()
+        context.set_tile_downloader(downloader)
+        context.set_tile_provider(staticmaps.TileProvider("local", url_pattern=server.url_pattern()))
+        context.set_cache_dir(str(tmp_path))
+        context.set_center(staticmaps.create_latlng(48, 8))
+        context.set_zoom(15)
+        image = context.render_pillow(300, 200)
+        # break the IHDR chunk of the cached tiles; their framing stays intact
+        cached = [path for path in tmp_path.rglob("*") if path.is_file() and path.read_bytes() == tile.getvalue()]
+        for path in cached:
+            path.write_bytes(tile.getvalue()[:12] + b"IHDX" + tile.getvalue()[16:])
+        server.requests.clear()
+
+        assert context.render_pillow(300, 200).tobytes() == image.tobytes()
+        assert len(server.requests) == len(cached) > 0
+        assert all(path.read_bytes() == tile.getvalue() for path in cached)
@@ -0,0 +1,61 @@
+"""py-staticmaps - Test DecodedTileCache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+
+def create_png(color: int) -> bytes:
+    image = PIL_Image.new("P", (256, 256), color)
+    image.putpalette([0, 0, 0, 200, 100, 50, 10, 20, 30])
+    data = io.BytesIO()
+    image.save(data, format="PNG")
+    return data.getvalue()
+
+
+def test_get_or_create_decodes_identical_data_once() -> None:
+    cache = staticmaps.DecodedTileCache(max_bytes=10)
+    created = []
+
+    def create(data: bytes) -> str:
+        created.append(data)
+        return data.decode()
+
+    assert cache.get_or_create(b"abc", create, len) == "abc"
+    assert cache.get_or_create(bytes(b"abc"), create, len) == "abc"
+    assert cache.get_or_create(b"defgh", create, len) == "defgh"
+    assert cache.get_or_create(b"ijklm", create, len) == "ijklm"
+    assert cache.get_or_create(b"abc", create, len) == "abc"
+    assert created == [b"abc", b"defgh", b"ijklm", b"abc"]
+    assert cache.stats() == {"hits": 1, "misses": 4, "tiles": 2, "bytes": 8}
+
+
+def test_pillow_fetch_tile_reuses_decoded_tile() -> None:
+    trans = staticmaps.Transformer(256, 256, 3, staticmaps.create_latlng(48, 8), 256)
+    renderer = staticmaps.PillowRenderer(trans)
+    tile = create_png(1)
+
+    image = renderer.fetch_tile(lambda z, x, y: tile, 0, 0)
+    assert image is not None
+    assert image.mode == "RGBA"
+    assert renderer.fetch_tile(lambda z, x, y: bytes(tile), 1, 0) is image
+
+    expected = PIL_Image.new("RGBA", (256, 256))
+    expected.paste(PIL_Image.open(io.BytesIO(tile)), (0, 0))
+    actual = PIL_Image.new("RGBA", (256, 256))
+    actual.paste(image, (0, 0))
+    assert actual.tobytes() == expected.tobytes()
+
+
+def test_svg_fetch_tile_reuses_inline_image() -> None:
+    trans = staticmaps.Transformer(256, 256, 3, staticmaps.create_latlng(48, 8), 256)
+    renderer = staticmaps.SvgRenderer(trans)
+    tile = create_png(2)
+
+    inline_image = renderer.fetch_tile(lambda z, x, y: tile, 0, 0)
+    assert inline_image == staticmaps.SvgRenderer.create_inline_image(tile)
+    assert renderer.fetch_tile(lambda z, x, y: bytes(tile), 1, 0) is inline_image
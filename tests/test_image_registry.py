@@ -0,0 +1,87 @@
+"""py-staticmaps - Test ImageRegistry"""
+
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+import os
+import pathlib
+
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+PNG_FILE = os.path.join(os.path.dirname(__file__), "..", "examples", "start.png")
+
+
+def _png_data(color: int) -> bytes:
+    output = io.BytesIO()
+    PIL_Image.new("RGBA", (20, 10), (color, 0, 0, 255)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_register_shares_images_by_path_and_content() -> None:
+    registry = staticmaps.ImageRegistry()
+    image = registry.register(PNG_FILE)
+    assert registry.register(os.path.abspath(PNG_FILE)) is image
+
+    data = _png_data(1)
+    registered = registry.register(data)
+    assert registry.register(bytes(data)) is registered
+    assert registry.register(registered) is registered
+    assert (registered.width(), registered.height()) == (20, 10)
+    assert registry.register(PIL_Image.open(io.BytesIO(data))).width() == 20
+
+
+def test_replaced_files_are_registered_again(tmp_path: pathlib.Path) -> None:
+    registry = staticmaps.ImageRegistry()
+    file_name = tmp_path / "icon.png"
+    file_name.write_bytes(_png_data(1))
+    image = registry.register(str(file_name))
+    assert registry.register(str(file_name)) is image
+
+    file_name.write_bytes(_png_data(2))
+    os.utime(file_name, ns=(0, 0))
+    assert registry.register(str(file_name)).data() == _png_data(2)
+
+
+def test_sprite_is_created_once_per_backend() -> None:
+    registry = staticmaps.ImageRegistry()
+    image = registry.register(_png_data(1))
+    calls = []
+
+    def create(data: bytes) -> str:
+        calls.append(data)
+        return "sprite"
+
+    assert registry.sprite(image, "svg", create, len) == "sprite"
+    assert registry.sprite(registry.register(_png_data(1)), "svg", create, len) == "sprite"
+    assert len(calls) == 1
+    registry.sprite(image, "pillow", create, len)
+    assert len(calls) == 2
+    assert registry.stats()["sprites"] == 2
+
+
+def test_registry_evicts_least_recently_used_entries() -> None:
+    data = [_png_data(color) for color in range(3)]
+    registry = staticmaps.ImageRegistry(max_bytes=2 * max(len(d) for d in data))
+    first = registry.register(data[0])
+    registry.register(data[1])
+    registry.register(data[2])
+    assert registry.stats()["images"] == 2
+    assert registry.register(data[0]) is not first
+    assert registry.stats()["bytes"] <= 2 * max(len(d) for d in data)
+
+
+def test_image_markers_share_sprites() -> None:
+    registry = staticmaps.ImageRegistry()
+    context = staticmaps.Context()
+    context.set_tile_provider(staticmaps.tile_provider_None)
+    context.set_zoom(10)
+    context.set_center(staticmaps.create_latlng(48, 8))
+    for i in range(10):
+        marker = staticmaps.ImageMarker(staticmaps.create_latlng(48, 8 + 0.01 * i), PNG_FILE, 27, 35, registry)
+        context.add_object(marker)
+    context.render_pillow(200, 100)
+    context.render_svg(200, 100)
+    assert registry.stats() == {"images": 1, "sprites": 2, "bytes": registry.stats()["bytes"]}
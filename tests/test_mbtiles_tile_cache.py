@@ -0,0 +1,141 @@
+"""py-staticmaps - Test MBTilesTileCache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import gc
+import pathlib
+import sqlite3
+import threading
+import typing
+import weakref
+
+import pytest  # type: ignore
+
+import staticmaps
+
+PROVIDER = staticmaps.TileProvider("Test Provider", url_pattern="$z/$x/$y")
+
+
+def test_put_and_get_batched(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path), batch_size=2)
+    assert cache.get(PROVIDER, 3, 1, 2) is None
+
+    cache.put(PROVIDER, 3, 1, 2, b"a")
+    assert cache.get(PROVIDER, 3, 1, 2) == b"a"
+    assert not pathlib.Path(cache.file_name(PROVIDER)).exists()
+
+    cache.put(PROVIDER, 3, 2, 2, b"b")
+    assert pathlib.Path(cache.file_name(PROVIDER)).name == "test-provider.mbtiles"
+    with sqlite3.connect(cache.file_name(PROVIDER)) as connection:
+        rows = connection.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles").fetchall()
+        assert sorted(rows) == [(3, 1, 5, b"a"), (3, 2, 5, b"b")]
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    other = staticmaps.MBTilesTileCache(str(tmp_path))
+    assert other.get(PROVIDER, 3, 2, 2) == b"b"
+
+
+def test_concurrent_readers_and_writer(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path), batch_size=8)
+    errors = []
+
+    def write() -> None:
+        for x in range(64):
+            cache.put(PROVIDER, 6, x, 0, bytes([x]))
+        cache.flush()
+
+    def read() -> None:
+        for x in range(64):
+            data = cache.get(PROVIDER, 6, x, 0)
+            if data not in (None, bytes([x])):
+                errors.append(data)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert all(cache.get(PROVIDER, 6, x, 0) == bytes([x]) for x in range(64))
+
+
+def test_tiles_stay_readable_while_their_batch_is_written(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path), batch_size=2)
+    writing = threading.Event()
+    committed = threading.Event()
+    write = cache._write  # pylint: disable=protected-access
+
+    def slow_write(*args: typing.Any) -> None:
+        writing.set()
+        committed.wait(5)
+        write(*args)
+
+    monkeypatch.setattr(cache, "_write", slow_write)
+    cache.put(PROVIDER, 3, 1, 2, b"a")
+    writer = threading.Thread(target=cache.put, args=(PROVIDER, 3, 2, 2, b"b"))
+    writer.start()
+    assert writing.wait(5)
+    assert cache.get(PROVIDER, 3, 1, 2) == b"a"
+    assert cache.contains(PROVIDER, 3, 2, 2)
+    cache.put(PROVIDER, 3, 1, 2, b"c")
+    committed.set()
+    writer.join()
+
+    monkeypatch.undo()
+    assert cache.get(PROVIDER, 3, 1, 2) == b"c"
+    assert cache.get(PROVIDER, 3, 2, 2) == b"b"
+    cache.flush()
+    assert staticmaps.MBTilesTileCache(str(tmp_path)).get(PROVIDER, 3, 1, 2) == b"c"
+
+
+def test_downloader_uses_mbtiles_cache(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path))
+    cache.put(PROVIDER, 3, 1, 2, b"cached")
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(None)
+    downloader.set_tile_cache(cache)
+    assert downloader.get(PROVIDER, str(tmp_path / "unused"), 3, 1, 2) == b"cached"
+    assert not (tmp_path / "unused").exists()
+
+
+def test_metadata(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path))
+    cache.put(PROVIDER, 3, 1, 2, b"a")
+    cache.set_metadata(PROVIDER, 3, 1, 2, staticmaps.TileMetadata(12.5, '"etag"', None))
+    cache.flush()
+
+    other = staticmaps.MBTilesTileCache(str(tmp_path))
+    assert other.get_metadata(PROVIDER, 3, 1, 2) == staticmaps.TileMetadata(12.5, '"etag"', None)
+    other.put(PROVIDER, 3, 1, 2, b"b")
+    other.flush()
+    assert other.get_metadata(PROVIDER, 3, 1, 2) is None
+
+
+def test_connections_are_reused_by_new_threads(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path))
+    cache.put(PROVIDER, 3, 1, 2, b"a")
+    cache.flush()
+    connects = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args: typing.Any, **kwargs: typing.Any) -> sqlite3.Connection:
+        connects.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite3, "connect", counting_connect)
+    for _ in range(5):
+        thread = threading.Thread(target=cache.get, args=(PROVIDER, 3, 1, 2))
+        thread.start()
+        thread.join()
+    assert not connects
+
+
+def test_caches_are_not_kept_alive_for_exit(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesTileCache(str(tmp_path))
+    reference = weakref.ref(cache)
+    del cache
+    gc.collect()
+    assert reference() is None
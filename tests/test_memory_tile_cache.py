@@ -0,0 +1,44 @@
+"""py-staticmaps - Test MemoryTileCache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import staticmaps
+
+PROVIDER = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+
+
+def test_evicts_least_recently_used_tiles() -> None:
+    cache = staticmaps.MemoryTileCache(max_bytes=30)
+    cache.put(PROVIDER, 1, 0, 0, b"0" * 10)
+    cache.put(PROVIDER, 1, 0, 1, b"1" * 10)
+    cache.put(PROVIDER, 1, 1, 0, b"2" * 10)
+    assert cache.get(PROVIDER, 1, 0, 0) == b"0" * 10
+
+    cache.put(PROVIDER, 1, 1, 1, b"3" * 10)
+
+    assert cache.get(PROVIDER, 1, 0, 1) is None
+    assert cache.get(PROVIDER, 1, 0, 0) is not None
+    assert cache.get(PROVIDER, 1, 1, 1) is not None
+    assert cache.stats() == {"hits": 3, "misses": 1, "evictions": 1, "tiles": 3, "bytes": 30}
+
+
+def test_never_evicts_pinned_zooms() -> None:
+    cache = staticmaps.MemoryTileCache(max_bytes=20)
+    cache.set_pinned_zooms([5])
+    cache.put(PROVIDER, 5, 0, 0, b"0" * 10)
+    cache.put(PROVIDER, 6, 0, 0, b"1" * 10)
+    cache.put(PROVIDER, 6, 0, 1, b"2" * 10)
+
+    assert cache.get(PROVIDER, 5, 0, 0) is not None
+    assert cache.get(PROVIDER, 6, 0, 0) is None
+    assert cache.get(PROVIDER, 6, 0, 1) is not None
+
+
+def test_skips_tiles_exceeding_budget() -> None:
+    cache = staticmaps.MemoryTileCache(max_bytes=20)
+    cache.put(PROVIDER, 1, 0, 0, b"0" * 10)
+    cache.put(PROVIDER, 1, 0, 1, b"1" * 30)
+
+    assert cache.get(PROVIDER, 1, 0, 0) is not None
+    assert cache.get(PROVIDER, 1, 0, 1) is None
+    assert cache.stats()["bytes"] == 10
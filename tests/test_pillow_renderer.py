@@ -0,0 +1,93 @@
+"""py-staticmaps - Test PillowRenderer"""
+
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import typing
+
+import pytest  # type: ignore
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+
+def test_alpha_compose_clips_overlay_to_image() -> None:
+    trans = staticmaps.Transformer(100, 80, 10, staticmaps.create_latlng(48, 8), 256)
+    renderer = staticmaps.PillowRenderer(trans)
+    renderer.draw().rectangle(((0, 0), (100, 80)), fill=(0, 0, 255, 255))
+    expected = renderer.image().copy()
+
+    overlay = PIL_Image.new("RGBA", (30, 20), (255, 0, 0, 128))
+    renderer.alpha_compose(overlay, (-10, 70))
+    renderer.alpha_compose(overlay, (200, 0))
+
+    full_overlay = PIL_Image.new("RGBA", (100, 80), (0, 0, 0, 0))
+    full_overlay.paste(overlay, (-10, 70))
+    expected = PIL_Image.alpha_composite(expected, full_overlay)
+    assert renderer.image().tobytes() == expected.tobytes()
+
+
+def _render_areas(areas: typing.List[staticmaps.Area], batched: bool) -> PIL_Image.Image:
+    trans = staticmaps.Transformer(300, 200, 12, staticmaps.create_latlng(48, 8), 256)
+    renderer = staticmaps.PillowRenderer(trans)
+    renderer.render_background(staticmaps.Color(20, 120, 220))
+    if batched:
+        renderer.render_objects(list(areas), False)
+    else:
+        # a layer is blended onto the image at the end of every render_objects call
+        for area in areas:
+            renderer.render_objects([area], False)
+    return renderer.image()
+
+
+def _square(lat: float, lng: float, size: float, fill_color: staticmaps.Color) -> staticmaps.Area:
+    latlngs = [
+        staticmaps.create_latlng(lat, lng),
+        staticmaps.create_latlng(lat + size, lng),
+        staticmaps.create_latlng(lat + size, lng + size),
+        staticmaps.create_latlng(lat, lng + size),
+        staticmaps.create_latlng(lat, lng),
+    ]
+    return staticmaps.Area(latlngs, fill_color=fill_color, width=2)
+
+
+def test_batched_disjoint_areas_match_separate_areas() -> None:
+    areas = [
+        _square(47.99 + 0.006 * row, 7.98 + 0.006 * col, 0.004, staticmaps.Color(255, 0, 0, 40 * row + 10 * col + 20))
+        for row in range(4)
+        for col in range(6)
+    ]
+    assert _render_areas(areas, True).tobytes() == _render_areas(areas, False).tobytes()
+
+
+def test_batched_overlapping_areas_match_separate_areas() -> None:
+    areas = [
+        _square(47.99 + 0.002 * i, 7.98 + 0.003 * i, 0.01, staticmaps.Color(255, 30 * i, 0, 60 + 20 * i))
+        for i in range(8)
+    ]
+    areas.append(staticmaps.Area(areas[0].interpolate(), fill_color=staticmaps.Color(0, 0, 255, 128), width=0))
+    assert _render_areas(areas, True).tobytes() == _render_areas(areas, False).tobytes()
+
+
+def test_adjacent_areas_share_one_layer(monkeypatch: pytest.MonkeyPatch) -> None:
+    flushes = []
+    flush_layer = staticmaps.PillowRenderer._flush_layer  # pylint: disable=protected-access
+
+    def counting_flush_layer(renderer: staticmaps.PillowRenderer) -> None:
+        if renderer._layer_bounds is not None:  # pylint: disable=protected-access
+            flushes.append(renderer)
+        flush_layer(renderer)
+
+    monkeypatch.setattr(staticmaps.PillowRenderer, "_flush_layer", counting_flush_layer)
+    areas = [
+        staticmaps.Area(
+            _square(47.98 + 0.004 * row, 7.97 + 0.004 * col, 0.004, staticmaps.RED).interpolate(),
+            fill_color=staticmaps.Color(255, 10 * row, 10 * col, 100),
+            width=0,
+        )
+        for row in range(10)
+        for col in range(10)
+    ]
+    batched = _render_areas(areas, True)
+    assert len(flushes) == 1
+    assert batched.tobytes() == _render_areas(areas, False).tobytes()
@@ -0,0 +1,113 @@
+"""py-staticmaps - Test TileCache"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+import os
+import pathlib
+
+import pytest  # type: ignore
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+from .tile_server import TileServer
+
+PROVIDER = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+
+
+def test_file_tile_cache(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path))
+    assert not cache.contains(PROVIDER, 3, 1, 2)
+    assert cache.get(PROVIDER, 3, 1, 2) is None
+
+    cache.put(PROVIDER, 3, 1, 2, b"tile")
+
+    assert (tmp_path / "test" / "3" / "1" / "2.png").read_bytes() == b"tile"
+    assert cache.contains(PROVIDER, 3, 1, 2)
+    assert cache.get_many(PROVIDER, 3, [(1, 2), (2, 2)]) == {(1, 2): b"tile"}
+
+
+def test_tiered_tile_cache_promotes_hits(tmp_path: pathlib.Path) -> None:
+    memory = staticmaps.MemoryTileCache()
+    local = staticmaps.FileTileCache(str(tmp_path / "local"))
+    shared = staticmaps.FileTileCache(str(tmp_path / "shared"))
+    cache = staticmaps.TieredTileCache([memory, local, shared])
+    shared.put(PROVIDER, 3, 1, 2, b"a")
+    shared.put(PROVIDER, 3, 2, 2, b"b")
+
+    assert cache.get(PROVIDER, 3, 1, 2) == b"a"
+    assert memory.contains(PROVIDER, 3, 1, 2)
+    assert local.contains(PROVIDER, 3, 1, 2)
+
+    assert cache.get_many(PROVIDER, 3, [(1, 2), (2, 2), (3, 2)]) == {(1, 2): b"a", (2, 2): b"b"}
+    assert memory.get(PROVIDER, 3, 2, 2) == b"b"
+    assert memory.stats()["hits"] == 2
+
+    cache.put(PROVIDER, 3, 3, 2, b"c")
+    assert all(tier.contains(PROVIDER, 3, 3, 2) for tier in cache.tiers())
+
+
+def test_downloader_uses_tile_cache(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.TieredTileCache([staticmaps.FileTileCache(str(tmp_path))])
+    cache.put(PROVIDER, 3, 1, 2, b"cached")
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(None)
+    downloader.set_tile_cache(cache)
+    assert downloader.tile_cache("unused") is cache
+    assert downloader.get(PROVIDER, "unused", 3, 1, 2) == b"cached"
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    PIL_Image.new("RGB", (4, 4)).save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def test_tile_data_is_complete() -> None:
+    png = _png()
+    assert staticmaps.tile_data_is_complete(png)
+    assert not staticmaps.tile_data_is_complete(png[:-5])
+    assert staticmaps.tile_data_is_complete(b"\xff\xd8\xff\xe0jpeg\xff\xd9\x00\x00")
+    assert not staticmaps.tile_data_is_complete(b"\xff\xd8\xff\xe0jpeg")
+    assert staticmaps.tile_data_is_complete(b"RIFF\x08\x00\x00\x00WEBPdata"[:16])
+    assert not staticmaps.tile_data_is_complete(b"RIFF\x10\x00\x00\x00WEBPdata")
+    assert not staticmaps.tile_data_is_complete(b"")
+
+
+def test_file_tile_cache_writes_atomically(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path), fsync=True)
+    cache.put(PROVIDER, 3, 1, 2, b"old")
+    cache.set_metadata(PROVIDER, 3, 1, 2, staticmaps.TileMetadata(1.0, etag="x"))
+    cache.put(PROVIDER, 3, 1, 2, b"new")
+
+    assert cache.get(PROVIDER, 3, 1, 2) == b"new"
+    assert os.listdir(tmp_path / "test" / "3" / "1") == ["2.png"]
+
+
+def test_file_tile_cache_ignores_truncated_tiles(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path))
+    png = _png()
+    file_name = pathlib.Path(cache.file_name(PROVIDER, 3, 1, 2))
+    file_name.parent.mkdir(parents=True)
+    file_name.write_bytes(png[: len(png) // 2])
+    assert cache.get(PROVIDER, 3, 1, 2) is None
+
+    file_name.write_bytes(b"")
+    assert cache.get(PROVIDER, 3, 1, 2) is None
+    cache.set_metadata(PROVIDER, 3, 1, 2, staticmaps.TileMetadata(1.0, status=404))
+    assert cache.get(PROVIDER, 3, 1, 2) == b""
+
+    with TileServer() as server:
+        server.default_response = (200, png, {})
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        file_name.write_bytes(png[:-1])
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        assert downloader.get(provider, str(tmp_path), 3, 1, 2) == png
+        assert file_name.read_bytes() == png
+
+        server.default_response = (200, png[:-1], {})
+        with pytest.raises(RuntimeError):
+            downloader.get(provider, str(tmp_path), 3, 2, 2)
+        assert not cache.contains(provider, 3, 2, 2)
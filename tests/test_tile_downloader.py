@@ -0,0 +1,476 @@
+"""py-staticmaps - Test TileDownloader"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import asyncio
+import multiprocessing
+import os
+import pathlib
+import threading
+import time
+import typing
+
+import pytest  # type: ignore
+
+import staticmaps
+
+from .tile_server import TileServer
+
+
+class SlowTileDownloader(staticmaps.TileDownloader):
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._active = 0
+        self.max_active = 0
+        self.requested: typing.List[typing.Tuple[int, int, int]] = []
+
+    def get(
+        self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        with self._lock:
+            self._active += 1
+            self.max_active = max(self.max_active, self._active)
+            self.requested.append((zoom, x, y))
+        time.sleep(0.01)
+        with self._lock:
+            self._active -= 1
+        if x == 0 and y == 0:
+            raise RuntimeError("fetch yields 404")
+        return f"{zoom}/{x}/{y}".encode()
+
+
+def test_get_many_fetches_each_tile_once_with_bounded_concurrency() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="$z/$x/$y", max_concurrency=3)
+    downloader = SlowTileDownloader()
+    tiles = [(x, y) for x in range(4) for y in range(4)] + [(1, 1)]
+
+    result = downloader.get_many(provider, "", 4, tiles)
+
+    assert len(downloader.requested) == 16
+    assert 1 < downloader.max_active <= 3
+    assert result[(2, 3)].result() == b"4/2/3"
+    with pytest.raises(RuntimeError):
+        result[(0, 0)].result()
+
+
+def test_render_prefetches_all_tiles() -> None:
+    downloader = SlowTileDownloader()
+    context = staticmaps.Context()
+    context.set_tile_downloader(downloader)
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.render_svg(1200, 800)
+
+    trans = staticmaps.Transformer(1200, 800, 15, staticmaps.create_latlng(48, 8), 256)
+    assert sorted(downloader.requested) == sorted((15, x, y) for _, _, x, y in trans.tiles())
+    assert downloader.max_active > 1
+
+
+class SlowAsyncTileDownloader(staticmaps.AsyncTileDownloader, SlowTileDownloader):
+    pass
+
+
+def test_get_many_async_does_not_block_event_loop() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="$z/$x/$y", max_concurrency=2)
+    downloader = SlowAsyncTileDownloader()
+    ticks = []
+
+    async def ticker() -> None:
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.005)
+
+    async def run() -> typing.Dict[typing.Tuple[int, int], typing.Any]:
+        tick_task = asyncio.create_task(ticker())
+        result = await downloader.get_many_async(provider, "", 3, [(x, y) for x in range(3) for y in range(3)])
+        await tick_task
+        return result
+
+    result = asyncio.run(run())
+    downloader.close()
+
+    assert len(downloader.requested) == 9
+    assert downloader.max_active == 2
+    assert len(ticks) == 5
+    assert result[(1, 2)].result() == b"3/1/2"
+    with pytest.raises(RuntimeError):
+        result[(0, 0)].result()
+
+
+def test_get_many_async_in_several_event_loops() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="$z/$x/$y", max_concurrency=2)
+    downloader = SlowAsyncTileDownloader()
+    tiles = [(x, y) for x in range(1, 9) for y in range(5)]
+
+    for _ in range(2):
+        result = asyncio.run(downloader.get_many_async(provider, "", 4, tiles))
+        assert all(task.result() == f"4/{x}/{y}".encode() for (x, y), task in result.items())
+    downloader.close()
+
+
+def test_session_pool_reuses_sessions_per_host() -> None:
+    pool = staticmaps.SessionPool(pool_size=4)
+    session = pool.session("https://a.tile.openstreetmap.org/1/0/0.png")
+    assert pool.session("https://a.tile.openstreetmap.org/1/1/0.png") is session
+    assert pool.session("https://b.tile.openstreetmap.org/1/1/0.png") is not session
+    pool.close()
+
+
+def test_get_reuses_connections() -> None:
+    with TileServer() as server:
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        pool = staticmaps.SessionPool()
+        for _ in range(2):
+            downloader = staticmaps.TileDownloader()
+            downloader.set_session_pool(pool)
+            downloader.set_memory_cache(None)
+            for x in range(3):
+                assert downloader.get(provider, None, 2, x, 0) == b"tile"  # type: ignore[arg-type]
+        pool.close()
+    assert len(server.requests) == 6
+    assert len(server.connections) == 1
+
+
+def test_get_serves_repeated_tiles_from_memory(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        provider = staticmaps.TileProvider("test-memory", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        memory_cache = staticmaps.MemoryTileCache()
+        downloader.set_memory_cache(memory_cache)
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"tile"
+        os.remove(downloader.cache_file_name(provider, str(tmp_path), 2, 1, 0))
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"tile"
+    assert len(server.requests) == 1
+    assert memory_cache.stats()["hits"] == 1
+
+
+def test_cache_file_name_layout() -> None:
+    provider = staticmaps.TileProvider("Test Provider", url_pattern="$z/$x/$y")
+    downloader = staticmaps.TileDownloader()
+    assert downloader.cache_file_name(provider, "cache", 3, 1, 2) == os.path.join(
+        "cache", "test-provider", "3", "1", "2.png"
+    )
+
+
+def test_expired_tiles_are_revalidated(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.default_response = (200, b"v1", {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+        provider = staticmaps.TileProvider("test-ttl", url_pattern=server.url_pattern(), ttl=3600)
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(staticmaps.MemoryTileCache())
+        cache = downloader.tile_cache(str(tmp_path))
+        assert cache is not None
+
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v1"
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v1"
+        assert len(server.requests) == 1
+
+        downloader.set_memory_cache(None)
+        cache.set_metadata(provider, 2, 1, 0, staticmaps.TileMetadata(0, '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT"))
+        server.default_response = (304, b"", {})
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v1"
+        assert server.requests[-1][1]["if-none-match"] == '"v1"'
+        assert server.requests[-1][1]["if-modified-since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        metadata = cache.get_metadata(provider, 2, 1, 0)
+        assert metadata is not None and metadata.fetched > time.time() - 60 and metadata.etag == '"v1"'
+
+        cache.set_metadata(provider, 2, 1, 0, staticmaps.TileMetadata(0, '"v1"'))
+        server.default_response = (200, b"v2", {"ETag": '"v2"'})
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v2"
+        assert cache.get(provider, 2, 1, 0) == b"v2"
+        assert len(server.requests) == 3
+
+
+def test_stale_while_revalidate(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.default_response = (200, b"v2", {})
+        provider = staticmaps.TileProvider("test-swr", url_pattern=server.url_pattern(), ttl=3600)
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        downloader.set_stale_while_revalidate(True)
+        cache = downloader.tile_cache(str(tmp_path))
+        assert cache is not None
+        cache.put(provider, 2, 1, 0, b"v1")
+        cache.set_metadata(provider, 2, 1, 0, staticmaps.TileMetadata(0))
+
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v1"
+        for _ in range(100):
+            if cache.get(provider, 2, 1, 0) == b"v2":
+                break
+            time.sleep(0.01)
+        assert cache.get(provider, 2, 1, 0) == b"v2"
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"v2"
+        assert len(server.requests) == 1
+
+
+def test_missing_tiles_are_negatively_cached(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.default_response = (404, b"not found", {})
+        provider = staticmaps.TileProvider("test-missing", url_pattern=server.url_pattern())
+        memory_cache = staticmaps.MemoryTileCache()
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(memory_cache)
+
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                downloader.get(provider, str(tmp_path), 2, 1, 0)
+        assert len(server.requests) == 1
+
+        memory_cache.clear()
+        other = staticmaps.TileDownloader()
+        other.set_memory_cache(None)
+        with pytest.raises(RuntimeError):
+            other.get(provider, str(tmp_path), 2, 1, 0)
+        assert len(server.requests) == 1
+
+        server.default_response = (200, b"tile", {})
+        other.set_negative_ttl(0.01)
+        time.sleep(0.02)
+        assert other.get(provider, str(tmp_path), 2, 1, 0) == b"tile"
+        assert other.get(provider, str(tmp_path), 2, 1, 0) == b"tile"
+        assert len(server.requests) == 2
+
+
+def test_concurrent_gets_are_coalesced(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.delay = 0.2
+        server.responses["/2/1/1.png"] = (404, b"not found", {})
+        provider = staticmaps.TileProvider("test-coalesced", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        barrier = threading.Barrier(20)
+        results: typing.List[typing.Any] = []
+
+        def fetch(x: int) -> None:
+            barrier.wait()
+            try:
+                results.append(downloader.get(provider, str(tmp_path), 2, x, 1))
+            except RuntimeError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=fetch, args=(i % 2,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(server.paths()) == ["/2/0/1.png", "/2/1/1.png"]
+        assert results.count(b"tile") == 10
+        assert sum(isinstance(result, RuntimeError) for result in results) == 10
+
+
+def _fetch_with_file_locking(provider: staticmaps.TileProvider, cache_dir: str) -> None:
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(None)
+    downloader.set_file_locking(True)
+    assert downloader.get(provider, cache_dir, 2, 1, 0) == b"tile"
+
+
+@pytest.mark.skipif(
+    not staticmaps.file_lock_is_supported() or "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requires fcntl and fork",
+)
+def test_file_locking_coalesces_processes(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.delay = 0.2
+        provider = staticmaps.TileProvider("test-file-lock", url_pattern=server.url_pattern())
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=_fetch_with_file_locking, args=(provider, str(tmp_path))) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+        assert server.paths() == ["/2/1/0.png"]
+
+
+def test_rate_limiter_bounds_rate() -> None:
+    rate_limiter = staticmaps.RateLimiter(max_rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        with rate_limiter.slot():
+            pass
+    assert time.monotonic() - start >= 0.18
+
+
+def test_transient_failures_are_retried(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.queued_responses = [(503, b"", {}), (429, b"", {"Retry-After": "0.2"})]
+        provider = staticmaps.TileProvider("test-retry", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        downloader.set_retries(3, 0.01, 1.0)
+
+        start = time.monotonic()
+        assert downloader.get(provider, str(tmp_path), 2, 1, 0) == b"tile"
+        assert time.monotonic() - start >= 0.2
+        assert server.paths() == ["/2/1/0.png"] * 3
+
+        server.default_response = (503, b"", {})
+        downloader.set_negative_ttl(None)
+        with pytest.raises(RuntimeError):
+            downloader.get(provider, str(tmp_path), 2, 2, 0)
+        assert len(server.requests) == 3 + 4
+
+        server.default_response = (429, b"", {"Retry-After": "3600"})
+        with pytest.raises(RuntimeError):
+            downloader.get(provider, str(tmp_path), 2, 3, 0)
+        assert len(server.requests) == 3 + 4 + 1
+
+
+def test_provider_concurrency_is_shared_by_downloaders(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.delay = 0.1
+        provider = staticmaps.TileProvider("test-shared", url_pattern=server.url_pattern(), max_concurrency=2)
+        downloaders = [staticmaps.TileDownloader() for _ in range(3)]
+        threads = [
+            threading.Thread(target=downloaders[i % 3].get, args=(provider, str(tmp_path), 3, i, 0)) for i in range(6)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - start >= 0.3
+        assert len(server.requests) == 6
+
+
+def test_render_deadline_degrades_missing_tiles(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.delay = 1.0
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern(), max_concurrency=2)
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        context = staticmaps.Context()
+        context.set_tile_downloader(downloader)
+        context.set_tile_provider(provider)
+        context.set_cache_dir(str(tmp_path))
+        context.set_center(staticmaps.create_latlng(48, 8))
+        context.set_zoom(15)
+        trans = staticmaps.Transformer(600, 400, 15, staticmaps.create_latlng(48, 8), 256)
+        _, _, cached_x, cached_y = next(iter(trans.tiles()))
+        cache = downloader.tile_cache(str(tmp_path))
+        assert cache is not None
+        cache.put(provider, 15, cached_x, cached_y, b"fallback")
+        context.set_fallback_tile(b"fallback")
+
+        start = time.monotonic()
+        context.render_svg(600, 400, staticmaps.CancellationToken(timeout=0.2))
+        assert time.monotonic() - start < 0.9
+
+        degraded = context.degraded_tiles()
+        assert {(tile.x, tile.y) for tile in degraded} == {(x, y) for _, _, x, y in trans.tiles()} - {
+            (cached_x, cached_y)
+        }
+        assert {tile.reason for tile in degraded} == {"cancelled"}
+        assert all(tile.filled for tile in degraded)
+        assert len(server.requests) <= 2
+
+
+def test_render_async_cancellation(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.delay = 1.0
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        downloader = staticmaps.AsyncTileDownloader()
+        downloader.set_memory_cache(None)
+        context = staticmaps.Context()
+        context.set_tile_downloader(downloader)
+        context.set_tile_provider(provider)
+        context.set_cache_dir(str(tmp_path))
+        context.set_center(staticmaps.create_latlng(48, 8))
+        context.set_zoom(15)
+        cancellation = staticmaps.CancellationToken()
+
+        async def run() -> typing.List[staticmaps.DegradedTile]:
+            asyncio.get_running_loop().call_later(0.1, cancellation.cancel)
+            await context.render_pillow_async(300, 200, cancellation)
+            # the report belongs to the task that rendered the map
+            return context.degraded_tiles()
+
+        start = time.monotonic()
+        degraded = asyncio.run(run())
+        downloader.close()
+        assert time.monotonic() - start < 0.9
+        assert degraded
+        assert all(tile.reason == "cancelled" and not tile.filled for tile in degraded)
+
+
+def test_metrics_count_lookups_and_requests(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.responses["/3/1/1.png"] = (404, b"", {})
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(staticmaps.MemoryTileCache())
+        events: typing.List[staticmaps.TileEvent] = []
+        downloader.add_observer(events.append)
+
+        assert downloader.get(provider, str(tmp_path), 3, 1, 2) == b"tile"
+        assert downloader.get(provider, str(tmp_path), 3, 1, 2) == b"tile"
+        with pytest.raises(RuntimeError):
+            downloader.get(provider, str(tmp_path), 3, 1, 1)
+
+        assert [(event.source, event.hit) for event in events[:4]] == [
+            ("memory", False),
+            ("disk", False),
+            ("cache", False),
+            ("network", True),
+        ]
+        assert events[3].shard == f"127.0.0.1:{server.url_pattern().split(':')[2].split('/')[0]}"
+        snapshot = downloader.metrics().snapshot()
+        assert snapshot["memory"] == {"hits": 1, "misses": 2, "bytes": 4}
+        assert snapshot["disk"] == {"hits": 0, "misses": 2, "bytes": 0}
+        assert snapshot["network"] == {"hits": 1, "misses": 1, "bytes": 4}
+        assert snapshot["zooms"] == {3: {"hits": 1, "misses": 2}}
+        assert snapshot["errors"] == {"404": 1}
+        assert snapshot["latency"]["providers"]["test"]["count"] == 2
+        assert len(snapshot["latency"]["providers"]["test"]["buckets"]) == len(staticmaps.LATENCY_BUCKETS) + 1
+
+        downloader.remove_observer(events.append)
+        downloader.metrics().reset()
+        downloader.get(provider, str(tmp_path), 3, 1, 2)
+        assert len(events) == 10
+        assert downloader.metrics().snapshot()["cache"]["hits"] == 1
+
+
+def test_shard_selector_avoids_unhealthy_shards() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="http://$s.example.org/$z/$x/$y.png", shards=["a", "b", "c"])
+    selector = staticmaps.ShardSelector()
+    assert [selector.urls(provider, 3, x, 0)[0] for x in range(3)] == [provider.url(3, x, 0) for x in range(3)]
+
+    for _ in range(3):
+        selector(staticmaps.TileEvent("network", "test", 3, True, 0.02, 4, "a.example.org"))
+        selector(staticmaps.TileEvent("network", "test", 3, False, 0.01, 0, "b.example.org", "503"))
+        selector(staticmaps.TileEvent("network", "test", 3, True, 0.03, 4, "c.example.org"))
+    assert {selector.urls(provider, 3, x, 0)[0] for x in range(6)} == {
+        "http://a.example.org/3/0/0.png",
+        "http://c.example.org/3/1/0.png",
+        "http://a.example.org/3/2/0.png",
+        "http://c.example.org/3/3/0.png",
+        "http://a.example.org/3/4/0.png",
+        "http://c.example.org/3/5/0.png",
+    }
+    assert selector.urls(provider, 3, 0, 0)[-1] == "http://b.example.org/3/0/0.png"
+    assert selector.stats()["b.example.org"]["error_rate"] > 0.4
+    assert selector.hedge_delay(provider, 0.95) is None
+
+
+def test_slow_requests_are_hedged(tmp_path: pathlib.Path) -> None:
+    with TileServer() as slow, TileServer() as fast:
+        slow.delay = 1.0
+        ports = [pattern.split(":")[2].split("/")[0] for pattern in (slow.url_pattern(), fast.url_pattern())]
+        provider = staticmaps.TileProvider("test", url_pattern="http://127.0.0.1:$s/$z/$x/$y.png", shards=ports)
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        selector = staticmaps.ShardSelector()
+        downloader.set_shard_selector(selector)
+        downloader.set_hedging(0.9)
+        for _ in range(20):
+            selector(staticmaps.TileEvent("network", "test", 3, True, 0.05, 4, "other"))
+
+        start = time.monotonic()
+        assert downloader.get(provider, str(tmp_path), 3, 0, 0) == b"tile"
+        assert time.monotonic() - start < 0.8
+        assert fast.paths() == ["/3/0/0.png"]
+        assert len(slow.requests) == 1
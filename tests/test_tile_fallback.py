@@ -0,0 +1,100 @@
+"""py-staticmaps - Test tile fallback"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+import pathlib
+
+import pytest  # type: ignore
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+from .tile_server import TileServer
+
+
+def png(color: str, size: int = 256) -> bytes:
+    output = io.BytesIO()
+    PIL_Image.new("RGBA", (size, size), color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def quadrants(size: int = 256) -> bytes:
+    image = PIL_Image.new("RGBA", (size, size), "red")
+    image.paste(PIL_Image.new("RGBA", (size // 2, size // 2), "blue"), (size // 2, size // 2))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_synthesize_tile_upscales_ancestor() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+    cache = staticmaps.MemoryTileCache()
+    cache.put(provider, 3, 2, 5, quadrants())
+
+    tile = staticmaps.synthesize_tile(cache, provider, 4, 5, 11)
+    assert isinstance(tile, staticmaps.SynthesizedTile)
+    assert tile.source_zoom() == 3
+    image = PIL_Image.open(io.BytesIO(tile))
+    assert image.size == (256, 256)
+    assert image.convert("RGB").getpixel((128, 128)) == (0, 0, 255)
+
+    tile = staticmaps.synthesize_tile(cache, provider, 5, 8, 20)
+    assert tile is not None and tile.source_zoom() == 3
+    assert PIL_Image.open(io.BytesIO(tile)).convert("RGB").getpixel((128, 128)) == (255, 0, 0)
+
+    assert staticmaps.synthesize_tile(cache, provider, 5, 8, 20, max_overzoom=1) is None
+
+
+def test_synthesize_tile_downsamples_children() -> None:
+    provider = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+    cache = staticmaps.MemoryTileCache()
+    for x, y in [(2, 4), (3, 4), (2, 5)]:
+        cache.put(provider, 3, x, y, png("red"))
+    assert staticmaps.synthesize_tile(cache, provider, 2, 1, 2, max_overzoom=0) is None
+
+    cache.put(provider, 3, 3, 5, png("blue"))
+    tile = staticmaps.synthesize_tile(cache, provider, 2, 1, 2, max_overzoom=0)
+    assert tile is not None and tile.source_zoom() == 3
+    image = PIL_Image.open(io.BytesIO(tile)).convert("RGB")
+    assert image.getpixel((64, 64)) == (255, 0, 0)
+    assert image.getpixel((192, 192)) == (0, 0, 255)
+
+
+def test_offline_mode_serves_cache_only(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern(), ttl=1)
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        cache = downloader.tile_cache(str(tmp_path))
+        assert cache is not None
+        cache.put(provider, 3, 2, 5, quadrants())
+        downloader.set_offline(True)
+
+        assert downloader.get(provider, str(tmp_path), 4, 5, 11) is None
+        downloader.set_zoom_fallback(2)
+        assert downloader.get(provider, str(tmp_path), 3, 2, 5) == quadrants()
+        tile = downloader.get(provider, str(tmp_path), 4, 5, 11)
+        assert isinstance(tile, staticmaps.SynthesizedTile)
+        assert not cache.contains(provider, 4, 5, 11)
+        assert not server.requests
+
+
+def test_failed_tiles_fall_back_to_other_zooms(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        server.default_response = (404, b"", {})
+        provider = staticmaps.TileProvider("test", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        downloader.set_negative_ttl(None)
+        cache = downloader.tile_cache(str(tmp_path))
+        assert cache is not None
+        cache.put(provider, 3, 2, 5, quadrants())
+
+        with pytest.raises(RuntimeError):
+            downloader.get(provider, str(tmp_path), 4, 5, 11)
+        downloader.set_zoom_fallback(1)
+        tile = downloader.get(provider, str(tmp_path), 4, 5, 11)
+        assert isinstance(tile, staticmaps.SynthesizedTile)
+        assert not cache.contains(provider, 4, 5, 11)
+        assert len(server.requests) == 2
@@ -0,0 +1,62 @@
+"""py-staticmaps - Test TilePack"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import pathlib
+
+import pytest  # type: ignore
+
+import staticmaps
+from staticmaps import cli
+
+PROVIDER = staticmaps.TileProvider("test", url_pattern="$z/$x/$y")
+
+
+def test_tile_pack_roundtrip(tmp_path: pathlib.Path) -> None:
+    file_name = str(tmp_path / "test.3-5.pack")
+    with staticmaps.TilePackWriter(file_name, 3, 5) as writer:
+        writer.add(5, 7, 1, b"b")
+        writer.add(3, 1, 2, b"tile")
+        with pytest.raises(RuntimeError):
+            writer.add(6, 0, 0, b"")
+
+    pack = staticmaps.TilePack(file_name)
+    assert len(pack) == 2
+    assert pack.zooms() == (3, 5)
+    data = pack.get(3, 1, 2)
+    assert isinstance(data, memoryview)
+    assert data == b"tile"
+    assert pack.get(5, 7, 1) == b"b"
+    assert pack.get(5, 7, 2) is None
+    assert pack.get(6, 7, 1) is None
+    assert pack.contains(5, 7, 1)
+    assert not pack.contains(5, 7, 2)
+    assert not pack.contains(6, 7, 1)
+    data.release()
+    pack.close()
+
+
+def test_pack_tile_cache(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path / "cache"))
+    cache.put(PROVIDER, 3, 1, 2, b"tile")
+    cache.put(PROVIDER, 3, 2, 2, b"")
+    cache.put(PROVIDER, 12, 2, 2, b"deep tile")
+
+    cli.cache_main(["pack", "--cache-dir", str(tmp_path / "cache"), "--output", str(tmp_path / "packs")])
+    packs = staticmaps.TilePackTileCache(str(tmp_path / "packs"))
+    assert [pack.zooms() for pack in packs.packs(PROVIDER)] == [(3, 12)]
+    assert packs.get(PROVIDER, 3, 1, 2) == b"tile"
+    assert packs.get(PROVIDER, 12, 2, 2) == b"deep tile"
+    assert not packs.contains(PROVIDER, 3, 2, 2)
+    assert packs.get_metadata(PROVIDER, 3, 1, 2) is not None
+
+    written = staticmaps.pack_tile_cache(str(tmp_path / "cache"), str(tmp_path / "split"), ["test"], [(0, 5), (6, 9)])
+    assert [pathlib.Path(file_name).name for file_name in written] == ["test.0-5.pack"]
+
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(staticmaps.MemoryTileCache())
+    downloader.set_tile_cache(staticmaps.TieredTileCache([packs, cache]))
+    assert downloader.get(PROVIDER, "unused", 12, 2, 2) == b"deep tile"
+    # tiles kept by the memory cache do not pin the mapping
+    for pack in packs.packs(PROVIDER):
+        pack.close()
@@ -0,0 +1,71 @@
+"""py-staticmaps - Test TileSeeder"""
+
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import pathlib
+import time
+import typing
+
+import staticmaps
+
+from .tile_server import TileServer
+
+
+def test_quadkey() -> None:
+    assert staticmaps.quadkey(3, 3, 5) == "213"
+    assert staticmaps.quadkey(0, 0, 0) == ""
+
+
+def test_seed_fetches_missing_tiles_in_quadkey_order(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        provider = staticmaps.TileProvider("test-seed", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        seeder = staticmaps.TileSeeder(downloader, provider, str(tmp_path))
+        rect = staticmaps.parse_latlngs2rect("52.3,13.0 52.7,13.8")
+        tiles = list(seeder.tiles(rect, 8, 11))
+        assert len(tiles) == seeder.count(rect, 8, 11)
+        assert tiles[0][0] == 8 and tiles[-1][0] == 11
+        zoom11 = [staticmaps.quadkey(*tile) for tile in tiles if tile[0] == 11]
+        assert zoom11 == sorted(zoom11)
+
+        downloader.get(provider, str(tmp_path), *tiles[0])
+        reports: typing.List[staticmaps.SeedProgress] = []
+        result = seeder.seed(rect, 8, 11, concurrency=4, progress=reports.append)
+
+        assert result.total == len(tiles)
+        assert (result.fetched, result.skipped, result.failed) == (len(tiles) - 1, 1, 0)
+        assert result.fetched_bytes == 4 * (len(tiles) - 1)
+        assert reports[-1] == result
+        assert len(server.requests) == len(tiles)
+
+        assert seeder.seed(rect, 8, 11).skipped == len(tiles)
+        assert len(server.requests) == len(tiles)
+
+
+def test_seed_retries_failed_tiles_after_their_negative_ttl(tmp_path: pathlib.Path) -> None:
+    with TileServer() as server:
+        provider = staticmaps.TileProvider("test-seed", url_pattern=server.url_pattern())
+        downloader = staticmaps.TileDownloader()
+        downloader.set_memory_cache(None)
+        downloader.set_negative_ttl(0.2)
+        seeder = staticmaps.TileSeeder(downloader, provider, str(tmp_path))
+        rect = staticmaps.parse_latlngs2rect("52.3,13.0 52.7,13.8")
+        failing = list(seeder.tiles(rect, 8, 8))[:2]
+        for zoom, x, y in failing:
+            server.responses[f"/{zoom}/{x}/{y}.png"] = (404, b"", {})
+        total = seeder.count(rect, 8, 8)
+
+        result = seeder.seed(rect, 8, 8)
+        assert (result.fetched, result.skipped, result.failed) == (total - 2, 0, 2)
+
+        # the negative cache entries still hold
+        result = seeder.seed(rect, 8, 8)
+        assert (result.fetched, result.skipped, result.failed) == (0, total, 0)
+        assert len(server.requests) == total
+
+        time.sleep(0.3)
+        server.responses.clear()
+        result = seeder.seed(rect, 8, 8)
+        assert (result.fetched, result.skipped, result.failed) == (2, total - 2, 0)
+        assert len(server.requests) == total + 2
@@ -0,0 +1,60 @@
+"""py-staticmaps - Test tile server"""
+
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import http.server
+import threading
+import time
+import typing
+
+
+class TileServer:  # pylint: disable=too-many-instance-attributes
+    """A local http tile server for tests, serving "/$z/$x/$y.png" """
+
+    def __init__(self) -> None:
+        self.requests: typing.List[typing.Tuple[str, typing.Dict[str, str]]] = []
+        self.connections: typing.Set[typing.Tuple[str, int]] = set()
+        self.responses: typing.Dict[str, typing.Tuple[int, bytes, typing.Dict[str, str]]] = {}
+        self.queued_responses: typing.List[typing.Tuple[int, bytes, typing.Dict[str, str]]] = []
+        self.default_response: typing.Tuple[int, bytes, typing.Dict[str, str]] = (200, b"tile", {})
+        self.delay = 0.0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                server.requests.append((self.path, {key.lower(): value for key, value in self.headers.items()}))
+                server.connections.add(self.client_address)
+                if server.queued_responses:
+                    status, body, headers = server.queued_responses.pop(0)
+                else:
+                    status, body, headers = server.responses.get(self.path, server.default_response)
+                time.sleep(server.delay)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: typing.Any) -> None:  # pylint: disable=arguments-differ
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "TileServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url_pattern(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/$z/$x/$y.png"
+
+    def paths(self) -> typing.List[str]:
+        return [path for path, _ in self.requests]